@@ -0,0 +1,126 @@
+# bench_member_cache.py - Resident memory of the full and lean bot profiles
+"""
+Builds discord.py's own Guild and Member objects from synthetic gateway payloads,
+the way a bot receives them at startup: GUILD_CREATE (voice states plus the members in
+voice), then, for the full profile only, GUILD_MEMBERS_CHUNK with every member
+and their presence. The lean profile instead fetches the DM subscribers into
+NotificationManager's cache. Each profile runs in a fresh process and reports
+the growth of its resident set per 10k guild members.
+
+Usage:
+    python benchmarks/bench_member_cache.py [--guilds 10] [--members 20000] [--voice-pct 2] [--dm-pct 5]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import discord
+from bot_profile import PROFILES, profile_options
+from utils import NotificationManager
+
+CHUNK_SIZE = 1000
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def member_payload(member_id: int) -> dict:
+    return {
+        "user": {"id": str(member_id), "username": f"member{member_id}", "global_name": f"Member {member_id}",
+                 "discriminator": "0", "avatar": "a" * 32, "public_flags": 0},
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+def presence_payload(member_id: int) -> dict:
+    return {
+        "user": {"id": str(member_id)},
+        "status": "online",
+        "client_status": {"desktop": "online"},
+        "activities": [{"name": "Some Game", "type": 0, "created_at": 1700000000000,
+                        "timestamps": {"start": 1700000000000}}],
+    }
+
+def guild_create(guild_id: int, member_ids: range, voice_pct: float) -> dict:
+    channel_id = guild_id + 1
+    in_voice = member_ids[:int(len(member_ids) * voice_pct / 100)]
+    return {
+        "id": str(guild_id),
+        "name": f"guild{guild_id}",
+        "member_count": len(member_ids),
+        "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                   "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(channel_id), "type": 2, "name": "voice", "position": 0, "permission_overwrites": [],
+                      "bitrate": 64000, "user_limit": 0}],
+        "voice_states": [{"user_id": str(m), "channel_id": str(channel_id), "session_id": "s", "deaf": False,
+                          "mute": False, "self_deaf": False, "self_mute": False, "suppress": False} for m in in_voice],
+        "members": [member_payload(m) for m in in_voice],
+        "presences": [],
+    }
+
+async def run_profile(args):
+    options = profile_options(args.profile)
+    client = discord.Client(**options)
+    state = client._connection
+    notifications = NotificationManager(db=None)
+    gc.collect()
+    before = rss_bytes()
+
+    for g in range(args.guilds):
+        guild_id = (g + 1) << 22
+        member_ids = range(guild_id * 100000, guild_id * 100000 + args.members)
+        guild = discord.Guild(data=guild_create(guild_id, member_ids, args.voice_pct), state=state)
+        state._add_guild(guild)
+
+        if options.get("chunk_guilds_at_startup", True):
+            # Chunking at startup delivers every member, with presences when that intent is on
+            for start in range(0, args.members, CHUNK_SIZE):
+                chunk = member_ids[start:start + CHUNK_SIZE]
+                members = [discord.Member(data=member_payload(m), guild=guild, state=state) for m in chunk]
+                if options["intents"].presences:
+                    for member, m in zip(members, chunk):
+                        member._presence_update(discord.RawPresenceUpdateEvent(data=presence_payload(m), state=state), ())
+                for member in members:
+                    guild._add_member(member)
+        else:
+            # Subscribers are fetched when a notification first needs them
+            for m in member_ids[::int(100 / args.dm_pct)]:
+                member = discord.Member(data=member_payload(m), guild=guild, state=state)
+                notifications.fetched_members.set((guild_id, m), member)
+
+    gc.collect()
+    grown = rss_bytes() - before
+    total = args.guilds * args.members
+    cached = sum(len(guild._members) for guild in state._guilds.values())
+    print(f"{args.profile:<5} {total:>8} members  {cached:>8} cached by discord.py  "
+          f"{len(notifications.fetched_members):>6} fetched  "
+          f"RSS +{grown / 2**20:>7.1f} MiB  ({grown / total * 10000 / 2**20:.2f} MiB per 10k members)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare resident memory of the full and lean profiles")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=20000, help="Members per guild")
+    parser.add_argument("--voice-pct", type=float, default=2, help="Share of members in a voice channel")
+    parser.add_argument("--dm-pct", type=float, default=5, help="Share of members subscribed to DMs")
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        asyncio.run(run_profile(args))
+        return
+
+    # A fresh process per profile, so one run's freed arenas don't hide the other's growth
+    for profile in PROFILES:
+        subprocess.run([sys.executable, __file__, "--profile", profile, "--guilds", str(args.guilds),
+                        "--members", str(args.members), "--voice-pct", str(args.voice_pct),
+                        "--dm-pct", str(args.dm_pct)], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# bench_session_close.py - Compare round trips for closing a voice session
+"""
+Runs the old two-step leave path (logLeaveTime + logGameTime) and the
+close_session RPC against a fake supabase client that counts requests and
+sleeps for a simulated network round trip.
+
+Usage:
+    python benchmarks/bench_session_close.py [--leaves 200] [--rtt-ms 40]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from queries import DatabaseQueries
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data) if isinstance(data, list) else 0
+
+class FakeQuery:
+    """Chainable stand-in for a postgrest query builder"""
+
+    def __init__(self, client, target):
+        self.client = client
+        self.target = target
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client.requests += 1
+        time.sleep(self.client.rtt)
+        if self.target == "close_session":
+            return FakeResult({"duration": 60.0, "gameTime": 3600.0})
+        if self.target == "get_session_duration_seconds":
+            return FakeResult(60.0)
+        return FakeResult([{"id": 1, "gameTime": 3540.0}])
+
+class FakeSupabase:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.requests = 0
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeQuery(self, name)
+
+class FakeGuild:
+    id = 1
+    name = "guild"
+
+class FakeMember:
+    def __init__(self, member_id):
+        self.id = member_id
+        self.name = f"member{member_id}"
+        self.guild = FakeGuild()
+
+async def old_path(db, member):
+    if await db.logLeaveTime(member):
+        await db.logGameTime(member)
+
+async def new_path(db, member):
+    await db.closeSession(member)
+
+async def run(label, path, leaves, rtt):
+    client = FakeSupabase(rtt)
+    db = DatabaseQueries(client)
+    members = [FakeMember(i) for i in range(leaves)]
+
+    start = time.perf_counter()
+    # logGameTime prints every session; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for member in members:
+            await path(db, member)
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    print(f"{label:<16} {client.requests / leaves:>5.1f} requests/leave  "
+          f"{elapsed / leaves * 1000:>7.1f} ms/leave")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leaves", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000
+    await run("logLeave+logGame", old_path, args.leaves, rtt)
+    await run("closeSession", new_path, args.leaves, rtt)
+
+if __name__ == "__main__":
+    asyncio.run(main())
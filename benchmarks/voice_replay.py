@@ -0,0 +1,317 @@
+# voice_replay.py - Replay synthetic voice-state streams through BotEvents
+"""
+Generates synthetic voice traffic, feeds it to BotEvents.on_voice_state_update
+the way discord.py dispatches it (one task per event, cache updated first)
+and reports throughput, handler latency, database calls per event and peak
+memory. The database is a local SQLite backend behind a proxy that injects
+latency and counts calls, so the numbers track the hot path in
+utils.handleVoiceJoin / handleVoiceLeave and NotificationManager.
+
+Usage:
+    python benchmarks/voice_replay.py --scenario join_storm --guilds 20 --members 50 --latency-ms 30
+    python benchmarks/voice_replay.py --scenario all --write-behind
+    python benchmarks/voice_replay.py --scenario all --journal
+    python benchmarks/voice_replay.py --scenario many_guilds --partitions 16
+    python benchmarks/voice_replay.py --scenario flapping --grace-seconds 10
+    python benchmarks/voice_replay.py --scenario channel_hopping --digest-seconds 0.5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from debounce import FlapDebouncer
+from digest import DigestScheduler
+from dispatcher import EventDispatcher
+from events import BotEvents
+from journal import EventJournal, JournalReplayer
+from leaderboard import LeaderboardCache
+from sqlite_queries import SqliteQueries
+from stats import StatsCache
+from utils import NotificationManager
+from write_behind import WriteBehindQueue
+
+SCENARIOS = ("join_storm", "flapping", "channel_hopping", "many_guilds")
+
+# ================================
+# FAKE DISCORD OBJECTS
+# ================================
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channels: int):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.members = {}
+        self.voice_channels = [FakeChannel(self, guild_id * 100 + i, f"voice{i}") for i in range(channels)]
+        self.stage_channels = []
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+class FakeChannel:
+    def __init__(self, guild, channel_id, name):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.members = []
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: FakeGuild, dm_latency: float):
+        self.id = member_id
+        self.name = f"member{member_id}"
+        self.display_name = self.name
+        self.guild = guild
+        self.roles = []
+        self.dm_latency = dm_latency
+        self.dms = 0
+        guild.members[member_id] = self
+
+    async def send(self, content):
+        await asyncio.sleep(self.dm_latency)
+        self.dms += 1
+
+class FakeVoiceState:
+    def __init__(self, channel, dispatched_at=None):
+        self.channel = channel
+        self.dispatched_at = dispatched_at
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+        self.user = "replay-bot"
+
+    def event(self, coro):
+        return coro
+
+    def get_guild(self, guild_id):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+# ================================
+# LATENCY-INJECTING DATABASE
+# ================================
+
+class LatencyBackend:
+    """Wraps a storage backend, sleeping before every call and counting calls per method"""
+
+    def __init__(self, inner, latency: float, jitter: float = 0.0):
+        self.inner = inner
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def timed(*args, **kwargs):
+            self.calls[name] += 1
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+            return await attr(*args, **kwargs)
+        return timed
+
+# ================================
+# TRAFFIC GENERATORS
+# ================================
+
+def build_world(guild_count, members_per_guild, channels, dm_latency):
+    guilds = [FakeGuild(1000 + g, channels) for g in range(guild_count)]
+    members = []
+    for guild in guilds:
+        for m in range(members_per_guild):
+            members.append(FakeMember(guild.id * 10000 + m, guild, dm_latency))
+    return guilds, members
+
+def join_storm(members, rng):
+    """Everyone joins in a burst, then everyone leaves"""
+    joins = [(m, None, rng.choice(m.guild.voice_channels)) for m in members]
+    rng.shuffle(joins)
+    leaves = [(m, channel, None) for m, _, channel in joins]
+    rng.shuffle(leaves)
+    return joins + leaves
+
+def flapping(members, rng, cycles=5):
+    """A quarter of members drop and rejoin the same channel repeatedly"""
+    events = []
+    for m in members[: max(1, len(members) // 4)]:
+        channel = rng.choice(m.guild.voice_channels)
+        for _ in range(cycles):
+            events.append((m, None, channel))
+            events.append((m, channel, None))
+    return events
+
+def channel_hopping(members, rng, hops=5):
+    """Members join, move between channels and leave"""
+    events = []
+    for m in members:
+        channel = rng.choice(m.guild.voice_channels)
+        events.append((m, None, channel))
+        for _ in range(hops):
+            target = rng.choice(m.guild.voice_channels)
+            events.append((m, channel, target))
+            channel = target
+        events.append((m, channel, None))
+    return events
+
+def many_guilds(members, rng):
+    """Short overlapping sessions interleaved across every guild"""
+    queues = {}
+    for m in members:
+        queues.setdefault(m.guild.id, []).append(m)
+    queues = list(queues.values())
+
+    events = []
+    open_sessions = []
+    while any(queues):
+        for queue in queues:
+            if queue:
+                member = queue.pop()
+                channel = member.guild.voice_channels[0]
+                events.append((member, None, channel))
+                open_sessions.append((member, channel))
+        rng.shuffle(open_sessions)
+        while len(open_sessions) > len(queues):
+            member, channel = open_sessions.pop()
+            events.append((member, channel, None))
+    events.extend((member, channel, None) for member, channel in open_sessions)
+    return events
+
+# ================================
+# REPLAY
+# ================================
+
+def apply_to_cache(member, before, after):
+    """discord.py updates channel membership before dispatching the event"""
+    if before is not None and member in before.members:
+        before.members.remove(member)
+    if after is not None and member not in after.members:
+        after.members.append(member)
+
+async def replay(events, bot_events, pace: float):
+    latencies = []
+
+    # Time from dispatch until the event has been handled, queued or not
+    handle_voice_state = bot_events.handle_voice_state
+    async def timed_handle(member, before, after):
+        await handle_voice_state(member, before, after)
+        latencies.append(time.perf_counter() - after.dispatched_at)
+    bot_events.handle_voice_state = timed_handle
+
+    async def handle(member, before, after):
+        await bot_events.on_voice_state_update(member, FakeVoiceState(before), FakeVoiceState(after, time.perf_counter()))
+
+    tasks = []
+    start = time.perf_counter()
+    for member, before, after in events:
+        apply_to_cache(member, before, after)
+        tasks.append(asyncio.create_task(handle(member, before, after)))
+        await asyncio.sleep(pace)
+    await asyncio.gather(*tasks)
+    if bot_events.dispatcher is not None:
+        await bot_events.dispatcher.stop(timeout=600)
+    if bot_events.debouncer is not None:
+        await bot_events.debouncer.flush(bot_events.close_session)
+    return time.perf_counter() - start, latencies
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+async def run_scenario(name, args):
+    rng = random.Random(args.seed)
+    guild_count = args.guilds * (5 if name == "many_guilds" else 1)
+    members_per_guild = max(2, args.members // (5 if name == "many_guilds" else 1))
+    guilds, members = build_world(guild_count, members_per_guild, args.channels, args.dm_latency_ms / 1000)
+    events = {
+        "join_storm": join_storm,
+        "flapping": flapping,
+        "channel_hopping": channel_hopping,
+        "many_guilds": many_guilds,
+    }[name](members, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inner = SqliteQueries(os.path.join(tmp, "replay.db"))
+        # Every fifth member subscribes to DMs
+        for guild in guilds:
+            await inner.registerGuild(guild)
+        await inner.upsertMembers([{"memberId": m.id, "name": m.name} for m in members])
+        await inner.upsertMembersGuild([{"memberId": m.id, "guildId": m.guild.id} for m in members])
+        for m in members[::5]:
+            await inner.add_to_dm_group(m.guild, m)
+
+        db = LatencyBackend(inner, args.latency_ms / 1000, args.jitter_ms / 1000)
+        bot = FakeBot(guilds)
+        write_behind = WriteBehindQueue(db) if args.write_behind else None
+        replayer = JournalReplayer(EventJournal(os.path.join(tmp, "replay.journal")), db) if args.journal else None
+        dispatcher = EventDispatcher(args.partitions) if args.partitions else None
+        debouncer = FlapDebouncer(args.grace_seconds) if args.grace_seconds else None
+        digests = DigestScheduler(window=args.digest_seconds, tick=args.digest_seconds / 5) if args.digest_seconds else None
+        bot_events = BotEvents(bot, NotificationManager(db, digests=digests), db, None, write_behind,
+                               LeaderboardCache(db), StatsCache(db), replayer, dispatcher, debouncer)
+
+        tracemalloc.start()
+        if write_behind is not None:
+            write_behind.start()
+        if replayer is not None:
+            replayer.start()
+        if dispatcher is not None:
+            dispatcher.start()
+        if digests is not None:
+            digests.start()
+        # Handlers print every session; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, latencies = await replay(events, bot_events, args.pace_ms / 1000)
+            if write_behind is not None:
+                await write_behind.stop()
+            if replayer is not None:
+                await replayer.stop()
+            if digests is not None:
+                # Let the last window close
+                await asyncio.sleep(args.digest_seconds * 1.5)
+                await digests.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        inner.close()
+
+    calls = sum(db.calls.values())
+    dms = sum(m.dms for m in members)
+    print(f"{name:<16} {len(events):>6} events  {len(events) / elapsed:>8.1f} ev/s  "
+          f"p50 {statistics.median(latencies) * 1000:>7.1f} ms  p99 {percentile(latencies, 99) * 1000:>7.1f} ms  "
+          f"{calls / len(events):>5.2f} db calls/ev  {dms:>4} DMs  peak {peak / 1024 / 1024:>6.1f} MiB")
+    if args.verbose:
+        for method, count in db.calls.most_common():
+            print(f"    {method:<24} {count}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic voice traffic through BotEvents")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=40, help="Members per guild")
+    parser.add_argument("--channels", type=int, default=3, help="Voice channels per guild")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Injected latency per database call")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--dm-latency-ms", type=float, default=50)
+    parser.add_argument("--pace-ms", type=float, default=0.0, help="Delay between dispatched events")
+    parser.add_argument("--write-behind", action="store_true", help="Buffer joins through WriteBehindQueue")
+    parser.add_argument("--journal", action="store_true", help="Journal session events and replay them to the db")
+    parser.add_argument("--partitions", type=int, default=0, help="Queue events on this many per-guild partitions")
+    parser.add_argument("--grace-seconds", type=float, default=0, help="Merge leave/rejoin flaps within this window")
+    parser.add_argument("--digest-seconds", type=float, default=0, help="Merge notifications into per-recipient digests (replaces the guild cooldown)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Print database calls per method")
+    args = parser.parse_args()
+
+    for name in SCENARIOS if args.scenario == "all" else (args.scenario,):
+        await run_scenario(name, args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
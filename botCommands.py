@@ -5,14 +5,22 @@ from discord import app_commands
 from typing import Optional
 import time
 from utils import _format_duration
-from queries import DatabaseQueries
+from leaderboard import LeaderboardCache, WINDOWS
+from stats import StatsCache
+from storage import StorageBackend
+from metrics import metrics
 
 class BotCommands:
-    def __init__(self, bot: commands.Bot, notification_manager, db: DatabaseQueries, discord_logger=None):
+    LEADERBOARD_PAGE_SIZE = 10
+
+    def __init__(self, bot: commands.Bot, notification_manager, db: StorageBackend, discord_logger=None, leaderboard=None, stats=None, watchdog=None):
         self.bot = bot
         self.notification_manager = notification_manager
         self.db = db
         self.discord_logger = discord_logger
+        self.leaderboard = leaderboard or LeaderboardCache(db)
+        self.stats = stats or StatsCache(db)
+        self.watchdog = watchdog
         
         # Register all commands
         self.register_commands()
@@ -26,8 +34,10 @@ class BotCommands:
             await self.stats_command(ctx, member)
         
         @self.bot.command(name='leaderboard', aliases=['lb'], help='Show voice time leaderboard')
-        async def leaderboard(ctx):
-            await self.leaderboard_command(ctx)
+        async def leaderboard(ctx, *args: str):
+            window = next((arg.lower() for arg in args if arg.lower() in WINDOWS), None)
+            page = next((int(arg) for arg in args if arg.isdigit()), 1)
+            await self.leaderboard_command(ctx, page, window)
         
         @self.bot.command(name='dm', help='Toggle DM notifications for yourself')
         async def dm_toggle(ctx):
@@ -43,6 +53,16 @@ class BotCommands:
         async def setup_guild(ctx):
             await self.setup_guild_command(ctx)
         
+        @self.bot.command(name='metrics', help='Show per-operation latency and error counts')
+        @commands.has_permissions(administrator=True)
+        async def metrics_summary(ctx):
+            await self.metrics_command(ctx)
+        
+        @self.bot.command(name='stalls', help='Show recent event-loop stalls and what blocked the loop')
+        @commands.has_permissions(administrator=True)
+        async def loop_stalls(ctx):
+            await self.stalls_command(ctx)
+        
         # @self.bot.command(name='help', help='Show all available commands')
         # async def help_command(ctx):
         #     await self.help_command_impl(ctx)
@@ -69,12 +89,35 @@ class BotCommands:
         target = member or ctx.author
         
         try:
-            # For now, just show a placeholder
+            stats = await self.stats.get(target.id)
+            if stats is None:
+                await ctx.send("❌ Stats are unavailable right now, try again later.")
+                return
+
+            rollups = list(stats["guilds"].values())
+            sessions = sum(row["sessionCount"] for row in rollups)
+            longest = max((float(row["longestSession"]) for row in rollups), default=0.0)
+            latest = max(rollups, key=lambda row: row["lastSeen"] or "", default=None)
+
             embed = discord.Embed(
                 title=f"📊 Voice Stats for {target.display_name}",
                 color=0x00ff00
             )
-            embed.add_field(name="Total Voice Time", value="Feature coming soon!", inline=False)
+            embed.add_field(name="Total Voice Time", value=_format_duration(stats["gameTime"]), inline=False)
+            embed.add_field(name="Sessions", value=str(sessions), inline=True)
+            embed.add_field(name="Longest Session", value=_format_duration(longest), inline=True)
+            if latest and latest["lastSession"] is not None:
+                embed.add_field(name="Last Session", value=_format_duration(float(latest["lastSession"])), inline=True)
+            embed.add_field(name="Last 7 Days", value=_format_duration(stats.get("recent", 0.0)), inline=True)
+
+            breakdown = []
+            for row in sorted(rollups, key=lambda row: float(row["totalTime"]), reverse=True):
+                guild = self.bot.get_guild(row["guildId"])
+                name = guild.name if guild else str(row["guildId"])
+                breakdown.append(f"**{name}** — {_format_duration(float(row['totalTime']))} over {row['sessionCount']} sessions")
+            if breakdown:
+                embed.add_field(name="By Server", value="\n".join(breakdown[:10]), inline=False)
+
             embed.set_thumbnail(url=target.display_avatar.url)
             embed.set_footer(text=f"Requested by {ctx.author.display_name}")
             
@@ -84,14 +127,34 @@ class BotCommands:
             await ctx.send(f"❌ Error getting stats: {e}")
             print(f"Error in stats command: {e}")
     
-    async def leaderboard_command(self, ctx):
-        """Show voice time leaderboard for the server"""
+    async def leaderboard_command(self, ctx, page: int = 1, window: Optional[str] = None):
+        """Show voice time leaderboard for the server, optionally over a recent window"""
         try:
+            if window:
+                ranking = await self.leaderboard.get_window(ctx.guild.id, window)
+            else:
+                ranking = await self.leaderboard.get(ctx.guild.id)
+
+            pages = max(1, -(-len(ranking) // self.LEADERBOARD_PAGE_SIZE))
+            page = min(max(page, 1), pages)
+            start = (page - 1) * self.LEADERBOARD_PAGE_SIZE
+
+            title = f"🏆 Voice Leaderboard - {ctx.guild.name}"
+            if window:
+                title += f" ({window})"
             embed = discord.Embed(
-                title=f"🏆 Voice Leaderboard - {ctx.guild.name}",
+                title=title,
                 color=0xffd700
             )
-            embed.add_field(name="Status", value="Leaderboard feature coming soon!", inline=False)
+            if ranking:
+                lines = [
+                    f"`#{rank}` **{row['name']}** — {_format_duration(float(row['gameTime']))}"
+                    for rank, row in enumerate(ranking[start:start + self.LEADERBOARD_PAGE_SIZE], start=start + 1)
+                ]
+                embed.description = "\n".join(lines)
+            else:
+                embed.description = "No voice time recorded yet!"
+            embed.set_footer(text=f"Page {page}/{pages} • !lb [today|week|month] [page]")
             
             await ctx.send(embed=embed)
             
@@ -111,9 +174,11 @@ class BotCommands:
             current_status = await self.db.getDmStatus(ctx.guild, ctx.author)
             
             if current_status:
-                await self.db.remove_from_dm_group(ctx.guild, ctx.author)
+                if await self.db.remove_from_dm_group(ctx.guild, ctx.author):
+                    self.notification_manager.dm_index.remove(ctx.guild.id, ctx.author.id)
             else:
-                await self.db.add_to_dm_group(ctx.guild, ctx.author)
+                if await self.db.add_to_dm_group(ctx.guild, ctx.author):
+                    self.notification_manager.dm_index.add(ctx.guild.id, ctx.author.id)
 
             await ctx.send(f"Your status went from DM: {current_status} to DM:{not current_status} for {ctx.guild.name}")
         except Exception as e:
@@ -151,6 +216,64 @@ class BotCommands:
             await ctx.send(f"❌ Setup error: {e}")
             print(f"Error in setup_guild command: {e}")
     
+    async def metrics_command(self, ctx):
+        """Show where time goes, heaviest operations first (Admin only)"""
+        try:
+            rows = metrics.summary()
+            embed = discord.Embed(
+                title="📈 Hot-path Metrics",
+                color=0x0099ff
+            )
+            if rows:
+                lines = [
+                    f"`{row['component']}.{row['op']}` {row['calls']} calls, {row['errors']} errors, "
+                    f"p50 ≤{row['p50'] * 1000:g} ms, p99 ≤{row['p99'] * 1000:g} ms, "
+                    f"{row['total']:.1f}s total, {row['in_flight']} in flight"
+                    for row in rows
+                ]
+                embed.description = "\n".join(lines)
+            else:
+                embed.description = "No operations recorded yet!"
+            embed.set_footer(text="Full histograms: GET /metrics on the metrics port")
+            
+            await ctx.send(embed=embed)
+            
+        except Exception as e:
+            await ctx.send(f"❌ Error getting metrics: {e}")
+            print(f"Error in metrics command: {e}")
+    
+    async def stalls_command(self, ctx):
+        """Show the latest event-loop stalls with the frame that blocked the loop (Admin only)"""
+        try:
+            if not self.watchdog:
+                await ctx.send("❌ The loop watchdog is disabled (LOOP_STALL_MS=0).")
+                return
+
+            stalls = self.watchdog.recent()
+            embed = discord.Embed(
+                title="🐢 Event-loop Stalls",
+                color=0xff9900
+            )
+            if stalls:
+                lines = [
+                    f"<t:{int(stall.at.timestamp())}:R> **{stall.duration * 1000:.0f} ms** `{stall.where()}`"
+                    for stall in stalls
+                ]
+                embed.description = "\n".join(lines)
+                if stalls[0].stack:
+                    stack = "\n".join(stalls[0].stack)[-1000:]
+                    embed.add_field(name="Latest stack", value=f"```{stack}```", inline=False)
+            else:
+                embed.description = f"No stalls over {self.watchdog.threshold * 1000:g} ms recorded!"
+            embed.set_footer(text=f"Lag now {self.watchdog.lag * 1000:.0f} ms, "
+                                  f"worst {self.watchdog.max_lag * 1000:.0f} ms")
+            
+            await ctx.send(embed=embed)
+            
+        except Exception as e:
+            await ctx.send(f"❌ Error getting stalls: {e}")
+            print(f"Error in stalls command: {e}")
+    
     async def help_command_impl(self, ctx):
         """Show all available commands"""
         embed = discord.Embed(
@@ -162,7 +285,7 @@ class BotCommands:
         embed.add_field(
             name="📊 User Commands",
             value="`!stats [@user]` - View voice time stats\n"
-                  "`!leaderboard` - Server voice leaderboard\n"
+                  "`!leaderboard [today|week|month] [page]` - Server voice leaderboard\n"
                   "`!dm` - Toggle DM notifications",
             inline=False
         )
@@ -170,7 +293,9 @@ class BotCommands:
         embed.add_field(
             name="🛠️ Admin Commands",
             value="`!setup` - Setup bot for this server\n"
-                  "`!cooldown` - Check notification cooldown",
+                  "`!cooldown` - Check notification cooldown\n"
+                  "`!metrics` - Show hot-path latency and errors\n"
+                  "`!stalls` - Show recent event-loop stalls",
             inline=False
         )
         
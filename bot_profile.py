@@ -0,0 +1,63 @@
+# bot_profile.py
+"""
+Gateway intents and member caching for the two runtime profiles (BOT_PROFILE).
+
+full: every member and presence of every guild is chunked and cached at startup.
+lean: no presences or typing, no chunking; discord.py caches only members who are
+      in a voice channel, and DM subscribers are fetched when a notification needs
+      them (NotificationManager keeps them in a small TTL cache).
+"""
+import discord
+
+PROFILES = ("full", "lean")
+
+def profile_intents(profile: str) -> discord.Intents:
+    if profile == "lean":
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.voice_states = True
+        # GUILD_MEMBER_UPDATE, for the DM role
+        intents.members = True
+        # Prefix commands
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.message_content = True
+        return intents
+
+    intents = discord.Intents.default()
+    intents.typing = True
+    intents.presences = True
+    intents.members = True
+    intents.voice_states = True
+    intents.guilds = True
+    intents.message_content = True
+    return intents
+
+def profile_options(profile: str) -> dict:
+    """Keyword arguments for the bot constructor"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown bot profile: {profile}")
+    options = {"intents": profile_intents(profile)}
+    if profile == "lean":
+        cache_flags = discord.MemberCacheFlags.none()
+        cache_flags.voice = True
+        options["member_cache_flags"] = cache_flags
+        options["chunk_guilds_at_startup"] = False
+    return options
+
+def dispatch_uncached_member_updates(bot):
+    """Dispatch on_uncached_member_update(member) for updates discord.py would discard.
+
+    With the lean cache, discord.py only fires on_member_update for members it has
+    cached (those in voice), so a DM role given to anyone else would go unnoticed.
+    The member is built from the payload and is not added to the cache."""
+    state = bot._connection
+    parse = state.parsers["GUILD_MEMBER_UPDATE"]
+
+    def parse_member_update(data):
+        guild = state._get_guild(int(data["guild_id"]))
+        if guild is not None and guild.get_member(int(data["user"]["id"])) is None:
+            state.dispatch("uncached_member_update", discord.Member(data=data, guild=guild, state=state))
+        parse(data)
+
+    state.parsers["GUILD_MEMBER_UPDATE"] = parse_member_update
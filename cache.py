@@ -0,0 +1,68 @@
+# cache.py
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded mapping that evicts the least recently used entry and expires entries after a TTL"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+class MemberRegistry:
+    """Remembers which members and member/guild links are already persisted"""
+
+    def __init__(self, max_size: int = 50000, ttl_seconds: float = 3600 * 6):
+        self.names = TTLCache(max_size, ttl_seconds)  # memberId -> name
+        self.links = TTLCache(max_size, ttl_seconds)  # (memberId, guildId) -> True
+
+    def has_member(self, member_id: int) -> bool:
+        return member_id in self.names
+
+    def is_known_member(self, member_id: int, name: str) -> bool:
+        """True if the member is stored under this exact name"""
+        return self.names.get(member_id) == name
+
+    def remember_member(self, member_id: int, name: str):
+        self.names.set(member_id, name)
+
+    def is_linked(self, member_id: int, guild_id: int) -> bool:
+        return (member_id, guild_id) in self.links
+
+    def remember_link(self, member_id: int, guild_id: int):
+        self.links.set((member_id, guild_id), True)
@@ -0,0 +1,62 @@
+# checkpoint.py
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+from storage import StorageBackend
+from metrics import timed
+
+class SessionCheckpointer:
+    """Credits the time of members who are still in voice on a fixed interval,
+    with one bulk call per guild, so totals stay current during long sessions
+    and a crash loses at most one interval. Closing a session then only credits
+    what is left since its last checkpoint."""
+
+    def __init__(self, bot, db: StorageBackend, interval: float = 300, leaderboard=None, stats=None, batch_size: int = 500):
+        self.bot = bot
+        self.db = db
+        self.interval = interval
+        self.leaderboard = leaderboard
+        self.stats = stats
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    @timed("checkpoint")
+    async def checkpoint(self) -> int:
+        """Credit every connected member up to now; returns how many members were credited"""
+        until = datetime.now(timezone.utc)
+        credited = 0
+        for guild in self.bot.guilds:
+            in_voice = {m.id: m for channel in guild.voice_channels + guild.stage_channels for m in channel.members}
+            member_ids = list(in_voice)
+            for i in range(0, len(member_ids), self.batch_size):
+                totals = await self.db.checkpointSessions(guild.id, member_ids[i:i + self.batch_size], until)
+                for row in totals or []:
+                    member = in_voice[row["memberId"]]
+                    if self.leaderboard and row["gameTime"] is not None:
+                        self.leaderboard.credit(member, float(row["gameTime"]))
+                    if self.stats:
+                        self.stats.invalidate(member.id)
+                credited += len(totals or [])
+        return credited
+
+    def start(self):
+        """Start checkpointing (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                print(f"Error checkpointing voice sessions: {e}")
@@ -0,0 +1,268 @@
+# cluster.py - Run the bot as several auto-sharded worker processes
+"""
+Splits the bot's shards across worker processes on one machine. Each worker is
+main.py with SHARD_COUNT, SHARD_IDS and CLUSTER_WORKER_ID set; cooldowns, DM
+index versions and metrics snapshots are shared through SHARED_STORE (a local
+SQLite file by default). The launcher restarts workers that crash and serves
+the merged metrics of every worker on METRICS_PORT.
+
+Usage:
+    python cluster.py --workers 4                     # shard count recommended by Discord
+    python cluster.py --workers 4 --shards 16
+    python cluster.py --local --workers 4 --guilds 64  # no Discord: synthetic traffic, SQLite stand-in
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+from dotenv import load_dotenv
+from metrics import MetricsServer, MetricsPublisher, aggregate
+from shared_store import createStore
+
+RESTART_BACKOFF_MAX = 60.0
+
+def shard_ranges(shard_count: int, workers: int) -> List[List[int]]:
+    """Split shard ids into contiguous, nearly equal ranges, one per worker"""
+    workers = min(workers, shard_count)
+    base, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+def recommended_shards(token: str) -> int:
+    """Ask Discord how many shards the bot should run"""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "gamingNotif cluster launcher"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return int(json.load(response)["shards"])
+
+def worker_env(index: int, shard_ids: List[int], shard_count: int, store_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SHARD_COUNT": str(shard_count),
+        "SHARD_IDS": ",".join(map(str, shard_ids)),
+        "CLUSTER_WORKER_ID": str(index),
+        "SHARED_STORE": store_url,
+        # The launcher serves the merged metrics; workers only publish theirs
+        "METRICS_PORT": "0",
+    })
+    # Every process needs a journal of its own
+    journal = os.getenv("JOURNAL_PATH", "events.journal")
+    if journal:
+        env["JOURNAL_PATH"] = f"{journal}.{index}"
+    return env
+
+# ================================
+# LAUNCHER
+# ================================
+
+class Cluster:
+    def __init__(self, command: List[str], ranges: List[List[int]], shard_count: int, store_url: str, restart: bool = True):
+        self.command = command
+        self.ranges = ranges
+        self.shard_count = shard_count
+        self.store_url = store_url
+        self.restart = restart
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        await asyncio.gather(*(self._supervise(i, shard_ids) for i, shard_ids in enumerate(self.ranges)))
+
+    async def _supervise(self, index: int, shard_ids: List[int]):
+        failures = 0
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                *self.command, env=worker_env(index, shard_ids, self.shard_count, self.store_url))
+            self.processes[index] = process
+            print(f"Worker {index} started (pid {process.pid}, shards {shard_ids[0]}-{shard_ids[-1]})")
+            code = await process.wait()
+            if self.stopping.is_set() or not self.restart:
+                return code
+
+            # A worker that ran for a while gets restarted straight away
+            failures = 0 if time.monotonic() - started > RESTART_BACKOFF_MAX else failures + 1
+            delay = min(RESTART_BACKOFF_MAX, 2 ** failures - 1)
+            print(f"Worker {index} exited with code {code}; restarting in {delay:.0f}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self, timeout: float = 30.0):
+        """Interrupt every worker so it runs its shutdown path, killing any that hang"""
+        self.stopping.set()
+        running = [p for p in self.processes.values() if p.returncode is None]
+        for process in running:
+            process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in running)), timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+
+async def refresh_metrics(server: MetricsServer, store, interval: float = 5.0):
+    while True:
+        try:
+            server.registry = await aggregate(store)
+        except Exception as e:
+            print(f"Error aggregating worker metrics: {e}")
+        await asyncio.sleep(interval)
+
+async def launch(args):
+    store = createStore(args.store)
+    # Snapshots from an earlier run would be merged in with ours
+    for key in await store.scan("metrics:"):
+        await store.delete(key)
+
+    if args.local:
+        # The SQLite stand-in for the database, created once so workers don't race on the schema
+        from sqlite_queries import SqliteQueries
+        SqliteQueries(args.sqlite_path).close()
+        command = [sys.executable, os.path.abspath(__file__), "--local-worker", *args.local_args]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]
+
+    shard_count = args.shards or (args.workers if args.local else recommended_shards(os.getenv("DISCORD_TOKEN")))
+    ranges = shard_ranges(shard_count, args.workers)
+    print(f"Launching {len(ranges)} workers for {shard_count} shards")
+    cluster = Cluster(command, ranges, shard_count, args.store, restart=not args.local)
+
+    server = None
+    refresher = None
+    metrics_port = int(os.getenv("METRICS_PORT", 9108))
+    if metrics_port and not args.local:
+        server = MetricsServer(port=metrics_port)
+        await server.start()
+        refresher = asyncio.create_task(refresh_metrics(server, store))
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: asyncio.create_task(cluster.stop()))
+
+    started = time.perf_counter()
+    try:
+        await cluster.run()
+    finally:
+        if refresher:
+            refresher.cancel()
+        if server:
+            await server.stop()
+
+    if args.local:
+        elapsed = time.perf_counter() - started
+        merged = await aggregate(store)
+        handled = merged.calls.get(("events", "handle_voice_state"), 0)
+        print(f"\nCluster: {handled} voice events in {elapsed:.2f}s across {len(ranges)} workers "
+              f"({handled / elapsed:.1f} ev/s including startup)")
+        for row in merged.summary(limit=8):
+            print(f"    {row['component'] + '.' + row['op']:<32} {row['calls']:>7} calls  {row['errors']:>4} errors  "
+                  f"p50 ≤{row['p50'] * 1000:g} ms  p99 ≤{row['p99'] * 1000:g} ms")
+    store.close()
+
+# ================================
+# LOCAL WORKER (synthetic traffic)
+# ================================
+
+async def run_local_worker(args):
+    """Replay synthetic voice traffic for this worker's shards through the real handlers"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    import voice_replay as replay
+    from dispatcher import EventDispatcher
+    from dm_index import DmIndex
+    from events import BotEvents
+    from leaderboard import LeaderboardCache
+    from sqlite_queries import SqliteQueries
+    from stats import StatsCache
+    from utils import NotificationManager
+
+    shard_count = int(os.environ["SHARD_COUNT"])
+    shard_ids = {int(i) for i in os.environ["SHARD_IDS"].split(",")}
+    worker_id = os.environ["CLUSTER_WORKER_ID"]
+    store = createStore(os.environ["SHARED_STORE"])
+    inner = SqliteQueries(args.sqlite_path)
+
+    # Discord routes a guild to shard (guild_id >> 22) % shard_count
+    rng = random.Random(args.seed + int(worker_id))
+    guilds = [replay.FakeGuild(g << 22, args.channels) for g in range(args.guilds) if g % shard_count in shard_ids]
+    members = [replay.FakeMember(guild.id * 1000 + m, guild, args.dm_latency_ms / 1000)
+               for guild in guilds for m in range(args.members)]
+    for guild in guilds:
+        await inner.registerGuild(guild)
+    await inner.upsertMembers([{"memberId": m.id, "name": m.name} for m in members])
+    await inner.upsertMembersGuild([{"memberId": m.id, "guildId": m.guild.id} for m in members])
+    for m in members[::5]:
+        await inner.add_to_dm_group(m.guild, m)
+
+    db = replay.LatencyBackend(inner, args.latency_ms / 1000)
+    events = getattr(replay, args.scenario)(members, rng)
+    bot_events = BotEvents(replay.FakeBot(guilds), NotificationManager(db, DmIndex(db, store=store), store=store), db,
+                           None, None, LeaderboardCache(db), StatsCache(db), None, EventDispatcher(args.partitions))
+    bot_events.dispatcher.start()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed, latencies = await replay.replay(events, bot_events, args.pace_ms / 1000)
+    await MetricsPublisher(store, worker_id).publish()
+    inner.close()
+    store.close()
+
+    print(f"Worker {worker_id} (shards {sorted(shard_ids)}): {len(guilds)} guilds, {len(events)} events, "
+          f"{len(events) / elapsed:.1f} ev/s, p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {replay.percentile(latencies, 99) * 1000:.1f} ms")
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the bot as auto-sharded worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--shards", type=int, default=0, help="Total shards (default: Discord's recommendation)")
+    parser.add_argument("--store", default=None, help="Shared store URL (default sqlite:cluster_state.db)")
+    parser.add_argument("--local", action="store_true", help="Spawn workers that replay synthetic traffic instead of connecting to Discord")
+    parser.add_argument("--local-worker", action="store_true", help=argparse.SUPPRESS)
+    local = parser.add_argument_group("local mode")
+    local.add_argument("--sqlite-path", default=None)
+    local.add_argument("--scenario", choices=("join_storm", "flapping", "channel_hopping", "many_guilds"), default="many_guilds")
+    local.add_argument("--guilds", type=int, default=32)
+    local.add_argument("--members", type=int, default=20, help="Members per guild")
+    local.add_argument("--channels", type=int, default=3)
+    local.add_argument("--partitions", type=int, default=16)
+    local.add_argument("--latency-ms", type=float, default=20, help="Injected latency per database call")
+    local.add_argument("--dm-latency-ms", type=float, default=50)
+    local.add_argument("--pace-ms", type=float, default=0.0)
+    local.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.local_worker:
+        asyncio.run(run_local_worker(args))
+        return
+
+    if args.local:
+        tmp = tempfile.mkdtemp(prefix="cluster-")
+        args.sqlite_path = args.sqlite_path or os.path.join(tmp, "standin.db")
+        args.store = args.store or f"sqlite:{os.path.join(tmp, 'state.db')}"
+        args.local_args = [
+            "--sqlite-path", args.sqlite_path, "--scenario", args.scenario, "--guilds", str(args.guilds),
+            "--members", str(args.members), "--channels", str(args.channels), "--partitions", str(args.partitions),
+            "--latency-ms", str(args.latency_ms), "--dm-latency-ms", str(args.dm_latency_ms),
+            "--pace-ms", str(args.pace_ms), "--seed", str(args.seed),
+        ]
+    args.store = args.store or "sqlite:cluster_state.db"
+    asyncio.run(launch(args))
+
+if __name__ == "__main__":
+    main()
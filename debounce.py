@@ -0,0 +1,60 @@
+# debounce.py
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+from metrics import metrics
+
+class FlapDebouncer:
+    """Holds voice leaves for a grace window so a quick rejoin continues the same
+    session instead of closing one and opening another"""
+
+    def __init__(self, grace_seconds: float = 10.0):
+        self.grace_seconds = grace_seconds
+        # (memberId, guildId) -> (timer task, member, channel left, leave time)
+        self.pending: Dict[Tuple[int, int], Tuple[asyncio.Task, object, object, datetime]] = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def defer_leave(self, member, channel, on_expire):
+        """Call on_expire(member, leftAt) once the grace window passes without a rejoin"""
+        key = (member.id, member.guild.id)
+        left_at = datetime.now(timezone.utc)
+        # A second leave inside the window (after a rejoin we never saw) replaces the first;
+        # its timer would otherwise expire the new entry early
+        previous = self.pending.pop(key, None)
+        if previous is not None:
+            previous[0].cancel()
+        task = asyncio.create_task(self._expire(key, on_expire))
+        self.pending[key] = (task, member, channel, left_at)
+
+    def cancel_leave(self, member):
+        """Take back a pending leave on rejoin; returns the channel that was left, or None"""
+        entry = self.pending.pop((member.id, member.guild.id), None)
+        if entry is None:
+            return None
+        task, _, channel, _ = entry
+        task.cancel()
+        metrics.inc("flaps_merged")
+        return channel
+
+    async def _expire(self, key, on_expire):
+        await asyncio.sleep(self.grace_seconds)
+        entry = self.pending.pop(key, None)
+        if entry is not None:
+            _, member, _, left_at = entry
+            await self._finish(on_expire, member, left_at)
+
+    async def _finish(self, on_expire, member, left_at: datetime):
+        try:
+            await on_expire(member, left_at)
+        except Exception as e:
+            print(f"Error closing debounced leave for {member.name}: {e}")
+
+    async def flush(self, on_expire):
+        """Close every pending leave now, at its original leave time (used on shutdown)"""
+        entries = list(self.pending.values())
+        self.pending.clear()
+        for task, _, _, _ in entries:
+            task.cancel()
+        await asyncio.gather(*(self._finish(on_expire, member, left_at) for _, member, _, left_at in entries))
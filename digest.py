@@ -0,0 +1,156 @@
+# digest.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from cache import TTLCache
+from fanout import DmFanout, FanoutReport
+from metrics import metrics
+
+class TokenBucket:
+    """Per-recipient allowance of DMs: burst at once, then one every 1/rate seconds"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def ready_at(self, now: float) -> float:
+        self._refill(now)
+        return now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+
+class Digest:
+    """Channels that became active for one recipient since their last DM"""
+
+    def __init__(self, member, due: float):
+        self.member = member
+        self.due = due
+        self.channels: "OrderedDict[Tuple[int, int], object]" = OrderedDict()  # (guildId, channelId) -> channel
+
+class DigestScheduler:
+    """Buffers "channel became active" events per recipient for a short window and
+    merges every channel, across guilds, into one DM. Each recipient has a token
+    bucket of their own; a digest that finds it empty keeps collecting until it refills."""
+
+    def __init__(self, fanout: Optional[DmFanout] = None, window: float = 60, per_hour: float = 4, burst: int = 2,
+                 tick: float = 1.0):
+        self.fanout = fanout or DmFanout()
+        self.window = window
+        self.rate = per_hour / 3600
+        self.burst = burst
+        self.tick = tick
+
+        self.pending: Dict[int, Digest] = {}  # recipient id -> digest
+        # An idle recipient's bucket is full again after burst / rate, so it can be forgotten then
+        self.buckets = TTLCache(max_size=100000, ttl_seconds=burst / self.rate)
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge("digest_pending", lambda: len(self.pending))
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, recipients: List, channel) -> int:
+        """Queue channel for every recipient; returns how many did not already have it queued"""
+        now = time.monotonic()
+        key = (channel.guild.id, channel.id)
+        added = 0
+        for member in recipients:
+            digest = self.pending.get(member.id)
+            if digest is None:
+                digest = self.pending[member.id] = Digest(member, now + self.window)
+            if key not in digest.channels:
+                added += 1
+            digest.channels[key] = channel
+        metrics.inc("digest_events", added)
+        return added
+
+    def _bucket(self, member_id: int) -> TokenBucket:
+        bucket = self.buckets.get(member_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        # Re-set on every use so the entry only expires once the recipient has been idle long enough
+        self.buckets.set(member_id, bucket)
+        return bucket
+
+    def _render(self, digest: Digest) -> Optional[str]:
+        """The DM for a digest, from who is in each channel now; None if every channel emptied"""
+        lines = []
+        guild_ids = {guild_id for guild_id, _ in digest.channels}
+        for channel in digest.channels.values():
+            members = [m for m in channel.members if m.id != digest.member.id]
+            if not members or len(members) < len(channel.members):
+                continue  # Everyone left, or the recipient joined them already
+            names = " and ".join(m.name for m in members)
+            where = f'"{channel.name}" in {channel.guild.name}' if len(guild_ids) > 1 else f'"{channel.name}"'
+            lines.append((where, names))
+        if not lines:
+            return None
+        if len(lines) == 1:
+            return f"Gaming time in {lines[0][0]} with {lines[0][1]}!"
+        return "Gaming time!\n" + "\n".join(f"• {where} with {names}" for where, names in lines)
+
+    async def flush(self) -> FanoutReport:
+        """Send every digest whose window has passed and whose recipient has a token"""
+        now = time.monotonic()
+        messages = []
+        report = FanoutReport()
+        for member_id, digest in list(self.pending.items()):
+            if digest.due > now:
+                continue
+            content = self._render(digest)
+            if content is None:
+                del self.pending[member_id]
+                report.skipped += 1
+                continue
+            bucket = self._bucket(member_id)
+            if not bucket.try_take(now):
+                # Keep merging into this digest until the recipient's bucket refills
+                digest.due = bucket.ready_at(now)
+                metrics.inc("digest_throttled")
+                continue
+            del self.pending[member_id]
+            metrics.inc("digest_channels_merged", len(digest.channels))
+            messages.append((digest.member, content))
+        if messages:
+            await self.fanout.send_each(messages, report)
+        return report
+
+    def start(self):
+        """Start sending due digests (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the scheduler; buffered digests are dropped (the bot can no longer send by now)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.pending:
+            print(f"Dropping {len(self.pending)} unsent notification digests")
+            self.pending.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                report = await self.flush()
+                if report.delivered or report.failed:
+                    print(f"Notification digests: {report}")
+            except Exception as e:
+                print(f"Error sending notification digests: {e}")
@@ -1,16 +1,49 @@
 # discord_logger.py
 import asyncio
 import discord
-from typing import Optional
+import logging
+import queue
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional
 from datetime import datetime
 
+LEVELS = {"DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+MAX_MESSAGE_LENGTH = 2000
+
 class DiscordLogger:
-    def __init__(self, bot: discord.Client, guild_id: int, channel_name: str):
+    def __init__(self, bot: discord.Client, guild_id: int, channel_name: str,
+                 buffer_size: int = 1000, flush_interval: float = 2.0, min_level: str = "INFO",
+                 log_file: Optional[str] = None, drop_policy: str = "oldest"):
         self.bot = bot
         self.guild_id = guild_id
         self.channel_name = channel_name
         self.channel: Optional[discord.TextChannel] = None
         self.original_print = print  # Store original print function
+
+        # Lines wait in a bounded buffer and a single task ships them in batches
+        self.buffer: deque = deque()
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.min_level = LEVELS.get(min_level.upper(), LEVELS["INFO"])
+        self.drop_policy = drop_policy  # "oldest" or "newest"
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+
+        # Optional local copy of every line, written as it is produced (before level filtering,
+        # the drop policy or a channel existing) by a listener thread, so the loop never touches the disk
+        self.file_logger: Optional[logging.Logger] = None
+        self._file_listener: Optional[QueueListener] = None
+        if log_file:
+            handler = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            lines: queue.SimpleQueue = queue.SimpleQueue()
+            self._file_listener = QueueListener(lines, handler)
+            self._file_listener.start()
+            self.file_logger = logging.getLogger("discord_logger.mirror")
+            self.file_logger.setLevel(logging.DEBUG)
+            self.file_logger.propagate = False
+            self.file_logger.handlers = [QueueHandler(lines)]
         
     async def setup(self):
         """Setup the Discord channel for logging"""
@@ -19,6 +52,7 @@ class DiscordLogger:
             if guild:
                 self.channel = discord.utils.get(guild.channels, name=self.channel_name)
                 if self.channel:
+                    self.start()
                     await self.log(f"🔧 Discord Logger initialized in {guild.name} -> #{self.channel_name}")
                     return True
                 else:
@@ -28,48 +62,130 @@ class DiscordLogger:
         except Exception as e:
             self.original_print(f"❌ Error setting up Discord logger: {e}")
         return False
+
+    def start(self):
+        """Start the flusher task (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and send whatever is still buffered"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._file_listener:
+            # Writes out what is still queued for the file
+            await asyncio.to_thread(self._file_listener.stop)
+            self._file_listener = None
+
+    def _mirror(self, message: str, level: str) -> str:
+        """Timestamp a line and copy it to the log file"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        line = f"`[{timestamp}] [{level}]` {message}"
+        if self.file_logger:
+            self.file_logger.info(line)
+        return line
+
+    def enqueue(self, message: str, level: str = "INFO"):
+        """Buffer a log line without blocking; applies level filtering and the drop policy"""
+        line = self._mirror(message, level)
+        if LEVELS.get(level, LEVELS["INFO"]) < self.min_level:
+            return
+
+        if len(self.buffer) >= self.buffer_size:
+            self.dropped += 1
+            if self.drop_policy == "newest":
+                return
+            self.buffer.popleft()
+        self.buffer.append(line)
     
     async def log(self, message: str, level: str = "INFO"):
         """Send a log message to Discord channel"""
         if not self.channel:
+            self._mirror(message, level)
             self.original_print(message)  # Fallback to console
             return
-        
-        try:
-            # Format the message with timestamp and level
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            formatted_message = f"`[{timestamp}] [{level}]` {message}"
-            
-            # Split long messages to avoid Discord's 2000 character limit
-            if len(formatted_message) > 1990:
-                chunks = [formatted_message[i:i+1990] for i in range(0, len(formatted_message), 1990)]
-                for chunk in chunks:
-                    await self.channel.send(chunk)
-            else:
-                await self.channel.send(formatted_message)
-                
-        except Exception as e:
-            # Fallback to console if Discord fails
-            self.original_print(f"Discord log failed: {e}")
-            self.original_print(message)
+        self.enqueue(message, level)
+
+    async def flush(self):
+        """Send every buffered line, packed into as few messages as possible"""
+        if not self.buffer and not self.dropped:
+            return
+
+        lines = list(self.buffer)
+        self.buffer.clear()
+        if self.dropped:
+            lines.insert(0, f"`…{self.dropped} lines dropped`")
+            self.dropped = 0
+
+        if not self.channel:
+            for line in lines:
+                self.original_print(line)
+            return
+
+        for chunk in self._pack(lines):
+            try:
+                await self.channel.send(chunk)
+            except Exception as e:
+                # Fallback to console if Discord fails
+                self.original_print(f"Discord log failed: {e}")
+                self.original_print(chunk)
+
+    @staticmethod
+    def _pack(lines: List[str]) -> List[str]:
+        """Join lines into messages under Discord's 2000 character limit"""
+        chunks = []
+        current = ""
+        for line in lines:
+            # Split long lines to avoid Discord's 2000 character limit
+            pieces = [line[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(line), MAX_MESSAGE_LENGTH)] or [""]
+            for piece in pieces:
+                if current and len(current) + 1 + len(piece) > MAX_MESSAGE_LENGTH:
+                    chunks.append(current)
+                    current = piece
+                else:
+                    current = f"{current}\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.original_print(f"Discord log flush failed: {e}")
+
+    @staticmethod
+    def _infer_level(message: str) -> str:
+        """Guess a level for plain print() output"""
+        if message.startswith(("❌", "Error", "ERROR")):
+            return "ERROR"
+        if message.startswith(("⚠️", "Warning", "WARNING")):
+            return "WARNING"
+        return "INFO"
     
     def override_print(self):
         """Override the global print function"""
         def async_print(*args, **kwargs):
             # Convert print arguments to string
             message = " ".join(str(arg) for arg in args)
-            
-            # Try to get the current event loop and send to Discord
+
+            # Buffer for the flusher; never blocks or spawns a task per line
             try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # Schedule the coroutine if loop is already running
-                    asyncio.create_task(self.log(message))
+                if self.channel:
+                    self.enqueue(message, self._infer_level(message))
                 else:
-                    # Fallback to original print if no loop
+                    self._mirror(message, self._infer_level(message))
                     self.original_print(message)
             except Exception as e:
-                # Fallback to original print if async fails
+                # Fallback to original print if buffering fails
                 self.original_print(message)
         
         # Replace the global print function
@@ -84,10 +200,10 @@ class DiscordLogger:
 # Global logger instance
 discord_logger: Optional[DiscordLogger] = None
 
-def setup_discord_logging(bot: discord.Client, guild_id: int, channel_name: str = "testingchannel"):
+def setup_discord_logging(bot: discord.Client, guild_id: int, channel_name: str = "testingchannel", **options):
     """Setup Discord logging globally"""
     global discord_logger
-    discord_logger = DiscordLogger(bot, guild_id, channel_name)
+    discord_logger = DiscordLogger(bot, guild_id, channel_name, **options)
     return discord_logger
 
 async def log_info(message: str):
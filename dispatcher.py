@@ -0,0 +1,95 @@
+# dispatcher.py
+import asyncio
+import time
+from typing import Dict, List, Optional
+from metrics import metrics
+
+class _Partition:
+    def __init__(self, index: int, queue_size: int, concurrency: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Held while waiting for room, so a full queue still admits events in arrival order
+        self.put_lock = asyncio.Lock()
+        # Events taken off the queue but not finished, and how many of those may run at once
+        self.admitted = asyncio.Semaphore(queue_size)
+        self.slots = asyncio.Semaphore(concurrency)
+        # Each member's most recent event; the next one for that member waits on it
+        self.tails: Dict[int, asyncio.Task] = {}
+        self.task: Optional[asyncio.Task] = None
+
+class EventDispatcher:
+    """Routes events onto per-guild worker queues (guild id hashed over a fixed
+    number of partitions). Within a partition, each member's events run one at a
+    time in arrival order, so a join and leave never race, while different
+    members run concurrently up to a per-partition limit. A slow guild only
+    holds up the guilds that share its partition."""
+
+    def __init__(self, partitions: int = 16, queue_size: int = 1000, concurrency: int = 8):
+        self.partitions: List[_Partition] = [_Partition(i, queue_size, concurrency) for i in range(partitions)]
+        for partition in self.partitions:
+            metrics.gauge("dispatch_queue_depth", partition.queue.qsize, partition=partition.index)
+
+    def __len__(self):
+        return sum(partition.queue.qsize() for partition in self.partitions)
+
+    async def submit(self, key: int, member_id: int, handler, *args):
+        """Queue handler(*args) on the key's partition, behind the member's earlier events.
+        Waits for room when the partition is full rather than dropping the event."""
+        partition = self.partitions[key % len(self.partitions)]
+        item = (member_id, handler, args, time.perf_counter())
+        metrics.begin(("dispatch", "queue_wait"))
+
+        if partition.put_lock.locked() or partition.queue.full():
+            metrics.inc("dispatch_overflows", partition=partition.index)
+            async with partition.put_lock:
+                await partition.queue.put(item)
+        else:
+            partition.queue.put_nowait(item)
+
+    def start(self):
+        """Start one worker per partition (must be called from a running loop)"""
+        for partition in self.partitions:
+            if partition.task is None or partition.task.done():
+                partition.task = asyncio.create_task(self._run(partition))
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish queued events (up to timeout), then stop the workers"""
+        async def drained(partition: _Partition):
+            await partition.queue.join()
+            await asyncio.gather(*partition.tails.values(), return_exceptions=True)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(drained(p) for p in self.partitions)), timeout)
+        except asyncio.TimeoutError:
+            print(f"Stopping dispatcher with {len(self)} events still queued")
+        for partition in self.partitions:
+            if partition.task:
+                partition.task.cancel()
+                try:
+                    await partition.task
+                except asyncio.CancelledError:
+                    pass
+                partition.task = None
+
+    async def _run(self, partition: _Partition):
+        while True:
+            member_id, handler, args, queued_at = await partition.queue.get()
+            # Past the admission limit the queue backs up instead of the task count
+            await partition.admitted.acquire()
+            previous = partition.tails.get(member_id)
+            task = asyncio.create_task(self._handle(partition, previous, handler, args, queued_at))
+            partition.tails[member_id] = task
+            task.add_done_callback(lambda t, m=member_id: partition.tails.pop(m, None) if partition.tails.get(m) is t else None)
+            partition.queue.task_done()
+
+    async def _handle(self, partition: _Partition, previous: Optional[asyncio.Task], handler, args, queued_at: float):
+        try:
+            # Waiting on the member's previous event does not take a slot
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with partition.slots:
+                metrics.end(("dispatch", "queue_wait"), time.perf_counter() - queued_at)
+                await handler(*args)
+        except Exception as e:
+            print(f"Error handling queued event in partition {partition.index}: {e}")
+        finally:
+            partition.admitted.release()
@@ -0,0 +1,130 @@
+# dm_index.py
+import asyncio
+from typing import Dict, List, Optional, Set
+from storage import StorageBackend
+
+class DmIndex:
+    """In-memory index of DM subscribers per guild, kept in sync with MembersGuild"""
+
+    def __init__(self, db: StorageBackend, reconcile_interval: float = 900, store=None):
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+        # Per-guild change counters shared with the other bot processes, when clustered
+        self.store = store
+        self._shared_versions: Dict[int, int] = {}
+        self._pending_bumps = set()
+
+        self.subscribers: Dict[int, Set[int]] = {}  # guildId -> memberIds with DM = 1
+        self._guilds: Dict[int, object] = {}
+        # Per load in flight: member id -> subscribed, for toggles that land while it reads
+        self._toggles: Dict[int, List[Dict[int, bool]]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, guild) -> Set[int]:
+        """Return the guild's subscriber ids, loading them on first use"""
+        if self.store is not None:
+            await self._check_shared_version(guild)
+        if guild.id not in self.subscribers:
+            lock = self._locks.setdefault(guild.id, asyncio.Lock())
+            async with lock:
+                if guild.id not in self.subscribers:
+                    await self._load(guild)
+        return self.subscribers.get(guild.id, set())
+
+    async def _load(self, guild) -> bool:
+        toggles: Dict[int, bool] = {}
+        self._toggles.setdefault(guild.id, []).append(toggles)
+        try:
+            rows = await self.db.get_dm_group(guild)
+        finally:
+            loads = [t for t in self._toggles[guild.id] if t is not toggles]
+            if loads:
+                self._toggles[guild.id] = loads
+            else:
+                del self._toggles[guild.id]
+        if rows is None:
+            return False
+        # The rows may have been read before a toggle that landed meanwhile; the toggle is newer
+        members = {row["memberId"] for row in rows}
+        for member_id, subscribed in toggles.items():
+            if subscribed:
+                members.add(member_id)
+            else:
+                members.discard(member_id)
+        self.subscribers[guild.id] = members
+        self._guilds[guild.id] = guild
+        return True
+
+    async def _check_shared_version(self, guild):
+        """Drop the cached guild if another process changed its subscribers"""
+        try:
+            version = int(await self.store.get(f"dm_version:{guild.id}") or 0)
+        except Exception as e:
+            print(f"Error reading shared DM index version: {e}")
+            return
+        if version != self._shared_versions.get(guild.id, 0):
+            self._shared_versions[guild.id] = version
+            self.subscribers.pop(guild.id, None)
+
+    def _bump_shared_version(self, guild_id: int):
+        async def bump():
+            try:
+                previous = self._shared_versions.get(guild_id, 0)
+                version = await self.store.incr(f"dm_version:{guild_id}")
+                # Our own change is already applied locally; reload only if someone else's landed too
+                if version != previous + 1:
+                    self.subscribers.pop(guild_id, None)
+                self._shared_versions[guild_id] = version
+            except Exception as e:
+                print(f"Error publishing DM index change: {e}")
+        task = asyncio.create_task(bump())
+        self._pending_bumps.add(task)
+        task.add_done_callback(self._pending_bumps.discard)
+
+    def _record_toggle(self, guild_id: int, member_id: int, subscribed: bool):
+        for toggles in self._toggles.get(guild_id, ()):
+            toggles[member_id] = subscribed
+
+    def add(self, guild_id: int, member_id: int):
+        """Record a subscription already written to the db"""
+        self._record_toggle(guild_id, member_id, True)
+        if guild_id in self.subscribers:
+            self.subscribers[guild_id].add(member_id)
+        if self.store is not None:
+            self._bump_shared_version(guild_id)
+
+    def remove(self, guild_id: int, member_id: int):
+        """Record an unsubscription already written to the db"""
+        self._record_toggle(guild_id, member_id, False)
+        if guild_id in self.subscribers:
+            self.subscribers[guild_id].discard(member_id)
+        if self.store is not None:
+            self._bump_shared_version(guild_id)
+
+    def start(self):
+        """Start periodic reconciliation against the db"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reconcile(self):
+        """Reload every cached guild from MembersGuild"""
+        for guild in list(self._guilds.values()):
+            await self._load(guild)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"Error reconciling DM index: {e}")
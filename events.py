@@ -1,13 +1,25 @@
+import asyncio
 import discord
 from utils import *
-from queries import DatabaseQueries
+from storage import StorageBackend
+from metrics import timed
+from resilience import deadline
 
 class BotEvents:
-    def __init__(self, bot, notification_manager, db: DatabaseQueries, discord_logger=None):
+    def __init__(self, bot, notification_manager, db: StorageBackend, discord_logger=None, write_behind=None, leaderboard=None, stats=None, replayer=None, dispatcher=None, debouncer=None, event_budget=None):
         self.bot = bot
         self.notification_manager = notification_manager
         self.db = db
         self.discord_logger = discord_logger
+        self.write_behind = write_behind
+        self.leaderboard = leaderboard
+        self.stats = stats
+        self.replayer = replayer
+        self.dispatcher = dispatcher
+        self.debouncer = debouncer
+        # Seconds the database calls made for one voice event may take in total
+        self.event_budget = event_budget
+        self._notify_tasks = set()
         
         # Register all event handlers
         self.register_events()
@@ -18,9 +30,23 @@ class BotEvents:
         self.bot.event(self.on_voice_state_update)
         self.bot.event(self.on_guild_join)
         self.bot.event(self.on_member_update) 
+        self.bot.event(self.on_uncached_member_update)
     
+    @timed("events")
     async def on_ready(self):
         print(f'We have logged in as {self.bot.user}')
+
+        # Known members/links let repeat joins skip their upserts
+        warmed = await self.db.warmRegistry([guild.id for guild in self.bot.guilds])
+        print(f"Member registry warmed with {warmed} guild links")
+
+        # Land journaled events first so reconciliation sees every session they opened
+        if self.replayer is not None:
+            await self.replayer.drain()
+
+        # Sessions may have started or ended while we were offline
+        # A sharded worker only sees its own guilds, so it must not judge anyone else's sessions
+        await reconcileVoiceStates(self.bot.guilds, self.db, ownGuildsOnly=self.bot.shard_count is not None)
         
         # Setup Discord logging
         if self.discord_logger:
@@ -28,29 +54,74 @@ class BotEvents:
             if setup_success:
                 self.discord_logger.override_print()  # Override print function
     
+    @timed("events")
     async def on_voice_state_update(self, member, before, after):
         """Handle voice state updates"""
+        if self.dispatcher is not None:
+            # Ordered per member on the guild's partition
+            await self.dispatcher.submit(member.guild.id, member.id, self.handle_voice_state, member, before, after)
+        else:
+            await self.handle_voice_state(member, before, after)
 
-        if is_user_joining_voice(before, after):
-            await handleVoiceJoin(member, self.db)
-            if is_second_person_in_channel(after.channel):
-                # Check cooldown
-                if await self.notification_manager.is_on_cooldown(member.guild):
-                    print("Global cooldown active")
-                    return
-                # Update cooldown and send notifications
-                await self.notification_manager.update_cooldown(member.guild)
-                if (await self.notification_manager.send_notifications(after.channel)):
-                    print(f"Succesfully sent DMs to members in {member.guild.name}")
+    @timed("events")
+    async def handle_voice_state(self, member, before, after):
+        """Record a join or leave; runs in dispatch order for the member's guild"""
+        # Every database call this event makes shares one budget
+        with deadline(self.event_budget):
+            if is_user_joining_voice(before, after):
+                # A rejoin inside the grace window continues the session it left
+                rejoined = self.debouncer.cancel_leave(member) if self.debouncer is not None else None
+                if rejoined is None:
+                    await handleVoiceJoin(member, self.db, self.write_behind, self.replayer)
+                # Blipping back into the same channel is not a new arrival worth a notification
+                if rejoined != after.channel and is_second_person_in_channel(after.channel):
+                    notify = self.notify_channel(member, after.channel)
+                    if self.dispatcher is not None:
+                        # A large fan-out must not hold up the guild's next voice events
+                        task = asyncio.create_task(notify)
+                        self._notify_tasks.add(task)
+                        task.add_done_callback(self._notify_tasks.discard)
+                    else:
+                        await notify
         
-        if is_user_leaving_voice(before, after):
-            await handleVoiceLeave(member, self.db)
+            if is_user_leaving_voice(before, after):
+                if self.debouncer is not None:
+                    self.debouncer.defer_leave(member, before.channel, self.expire_leave)
+                else:
+                    await self.close_session(member)
+
+    async def expire_leave(self, member, left_at):
+        """Close a debounced leave whose grace window passed, behind the member's newer events"""
+        if self.dispatcher is not None:
+            await self.dispatcher.submit(member.guild.id, member.id, self.close_session, member, left_at)
+        else:
+            await self.close_session(member, left_at)
 
+    async def close_session(self, member, left_at=None):
+        with deadline(self.event_budget):
+            session = await handleVoiceLeave(member, self.db, self.write_behind, self.replayer, left_at)
+        if session and session["gameTime"] is not None and self.leaderboard:
+            self.leaderboard.credit(member, session["gameTime"])
+        if session and self.stats:
+            self.stats.record_session(member, session)
+
+    async def notify_channel(self, member, channel):
+        # Digests throttle each recipient on their own; otherwise the whole guild shares a cooldown
+        if self.notification_manager.digests is None and not await self.notification_manager.try_start_cooldown(member.guild):
+            print("Global cooldown active")
+            return
+        # Send notifications
+        report = await self.notification_manager.send_notifications(channel)
+        if report.delivered or report.failed or report.queued:
+            print(f"DM fan-out in {member.guild.name}: {report}")
+
+    @timed("events")
     async def on_guild_join(self, guild):
         """Register a new guild in the db"""
         if await handleNewGuild(guild):
             print(f"Guild {guild.name} was succesfully added into the db")
 
+    @timed("events")
     async def on_member_update(self, before, after):
         """Auto-update DM group when DM role changes"""
         before_roles = {role.name for role in before.roles}
@@ -58,9 +129,28 @@ class BotEvents:
 
         if "DM" in after_roles and "DM" not in before_roles:
             # DM role added
-            await self.db.add_to_dm_group(after.guild, after)
+            if await self.db.add_to_dm_group(after.guild, after):
+                self.notification_manager.dm_index.add(after.guild.id, after.id)
             print(f"✅ {after.name} added to DM notifications")
         elif "DM" in before_roles and "DM" not in after_roles:
             # DM role removed
-            await self.db.remove_from_dm_group(after.guild, after)
-            print(f"❌ {after.name} removed from DM notifications")
\ No newline at end of file
+            if await self.db.remove_from_dm_group(after.guild, after):
+                self.notification_manager.dm_index.remove(after.guild.id, after.id)
+            print(f"❌ {after.name} removed from DM notifications")
+
+    @timed("events")
+    async def on_uncached_member_update(self, member):
+        """Lean profile: subscribe a member outside the member cache who has the DM role.
+        Without a before state a newly given role cannot be told apart from one held all
+        along, so only members with no MembersGuild row yet are subscribed: DM=0 on a row
+        may be a !dm opt-out, which a later update must not undo. Removals are only seen
+        for cached members (on_member_update)."""
+        if not any(role.name == "DM" for role in member.roles):
+            return
+        if member.id in await self.notification_manager.dm_index.get(member.guild):
+            return
+        if await self.db.getDmStatus(member.guild, member) is not None:
+            return
+        if await self.db.add_to_dm_group(member.guild, member):
+            self.notification_manager.dm_index.add(member.guild.id, member.id)
+        print(f"✅ {member.name} added to DM notifications")
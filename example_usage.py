@@ -27,5 +27,6 @@ await log_error("Failed to send notification to user")
 # The system will:
 # 1. Send all output to Discord channel "testingchannel" in guild 1422756400584724622
 # 2. Format messages with timestamps and levels
-# 3. Handle long messages by splitting them
-# 4. Fallback to console if Discord fails
\ No newline at end of file
+# 3. Batch buffered lines into messages of up to 2000 characters every few seconds
+# 4. Drop the oldest lines when the buffer is full and report how many were dropped
+# 5. Fallback to console if Discord fails
\ No newline at end of file
@@ -0,0 +1,87 @@
+# fanout.py
+import asyncio
+import time
+import discord
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+from cache import TTLCache
+
+@dataclass
+class FanoutReport:
+    """Outcome of one notification fan-out"""
+    delivered: int = 0
+    failed: int = 0
+    skipped: int = 0
+    queued: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        queued = f", {self.queued} queued for digests" if self.queued else ""
+        return (f"{self.delivered} delivered, {self.failed} failed, "
+                f"{self.skipped} skipped{queued} in {self.elapsed:.2f}s")
+
+class RateLimiter:
+    """Token bucket shared by every send, keeping us under Discord's global limit"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class DmFanout:
+    """Sends one message to many members concurrently.
+
+    discord.py already queues requests on each per-route bucket and sleeps
+    through 429s; this bounds how many sends are in flight at once and
+    paces them with a global token bucket so a large fan-out does not pile
+    up on the shared "create DM" route or trip the global limit.
+    """
+
+    def __init__(self, max_concurrency: int = 10, rate_per_second: float = 20, undeliverable_ttl: float = 3600 * 24):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.limiter = RateLimiter(rate_per_second, burst=max_concurrency)
+        # Members whose DMs are closed; skipped until the entry expires
+        self.undeliverable = TTLCache(max_size=50000, ttl_seconds=undeliverable_ttl)
+
+    async def send(self, recipients: Iterable, content: str, report: Optional[FanoutReport] = None) -> FanoutReport:
+        """Deliver content to every recipient, continuing past individual failures"""
+        return await self.send_each(((member, content) for member in recipients), report)
+
+    async def send_each(self, messages: Iterable[Tuple[object, str]], report: Optional[FanoutReport] = None) -> FanoutReport:
+        """Deliver a message of its own to each (member, content) pair"""
+        report = report or FanoutReport()
+        start = time.perf_counter()
+
+        async def deliver(member, content):
+            if member.id in self.undeliverable:
+                report.skipped += 1
+                return
+            async with self.semaphore:
+                await self.limiter.acquire()
+                try:
+                    await member.send(content)
+                    report.delivered += 1
+                except discord.Forbidden:
+                    self.undeliverable.set(member.id, True)
+                    report.failed += 1
+                    print(f"Cannot send DM to {member.name}")
+                except discord.HTTPException as e:
+                    report.failed += 1
+                    print(f"Failed to send DM to {member.name}: {e}")
+
+        await asyncio.gather(*(deliver(member, content) for member, content in messages))
+        report.elapsed = time.perf_counter() - start
+        return report
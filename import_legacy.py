@@ -0,0 +1,287 @@
+# import_legacy.py - Migration of the JSON files written by deprecated.py
+"""
+Imports the arrivals log (get_arrival_time) and the gameplay totals file
+(log_game_time) of an old deployment into Members, MembersGuild and TimeLog.
+
+Both files are single JSON arrays that can be far too large to json.load, so
+they are read with a streaming parser that holds one entry at a time. Entries
+are de-duplicated by member: the arrivals give each member's latest name and
+when they were last seen, and each member's total becomes one closed session
+ending at their last session (the legacy files never kept individual leave
+times). Rows are written in chunks, and the byte offset reached is saved to
+the progress file every few seconds, so an interrupted import resumes close to
+where it stopped; sessions carry an eventId so none is ever counted twice.
+
+Usage:
+    python import_legacy.py --guild-id 123 --arrivals log.json --totals gameplay_time.json
+                            [--chunk-size 500] [--progress import_legacy.progress] [--restart]
+"""
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from storage import createDatabase, StorageBackend
+
+READ_SIZE = 1 << 16
+WHITESPACE = " \t\r\n"
+
+def iter_json_array(path: str, offset: int = 0, read_size: int = READ_SIZE) -> Iterator[Tuple[object, int]]:
+    """Yield (item, byte offset just past it) for each item of the top-level JSON array in path.
+
+    Only one item and one read are buffered at a time. A non-zero offset must be
+    one this generator yielded; parsing then resumes with the next item."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    eof = False
+    opened = offset > 0  # A resumed read starts after an item, inside the array
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+
+        def fill() -> bool:
+            nonlocal buffer, eof
+            if eof:
+                return False
+            data = f.read(read_size)
+            eof = not data
+            buffer += text.decode(data, final=eof)
+            return True
+
+        def skip(chars: str) -> str:
+            """Drop leading chars from the buffer; returns the next character ('' at the end of the file)"""
+            nonlocal buffer, offset
+            while True:
+                stripped = buffer.lstrip(chars)
+                offset += len(buffer[:len(buffer) - len(stripped)].encode("utf-8"))
+                buffer = stripped
+                if buffer or not fill():
+                    return buffer[:1]
+
+        if not opened:
+            if skip(WHITESPACE) != "[":
+                raise ValueError(f"{path} is not a JSON array")
+            buffer = buffer[1:]
+            offset += 1
+
+        while True:
+            head = skip(WHITESPACE + ",")
+            if head == "]":
+                return
+            if head == "":
+                raise ValueError(f"{path} ends before its closing bracket (byte {offset})")
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                    break
+                except json.JSONDecodeError as e:
+                    # Most likely the item continues past what has been read so far
+                    if not fill():
+                        raise ValueError(f"{path}: invalid JSON at byte {offset}: {e.msg}") from None
+            offset += len(buffer[:end].encode("utf-8"))
+            buffer = buffer[end:]
+            yield item, offset
+
+def _parse_clock(value) -> float:
+    """Seconds in a legacy "MM:SS" or "HH:MM:SS" duration; 0 if it is missing or malformed"""
+    try:
+        seconds = 0.0
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return 0.0
+
+class LegacyImporter:
+    """Streams the legacy files into the database in chunks, saving its progress after each one"""
+
+    def __init__(self, db: StorageBackend, guild_id: int, chunk_size: int = 500, progress_path: Optional[str] = None,
+                 save_interval: float = 5.0):
+        self.db = db
+        self.guild_id = guild_id
+        self.chunk_size = chunk_size
+        self.progress_path = progress_path
+        # lastSeen grows with the member count, so progress is saved every few seconds rather than every
+        # chunk; writes are idempotent, so resuming from a slightly older offset only repeats some of them
+        self.save_interval = save_interval
+        self._saved = time.monotonic()
+        # Per file: byte offset reached and whether it is finished; lastSeen maps
+        # member id -> [latest name, latest arrival timestamp] across chunks and runs
+        self.progress = {"guildId": guild_id, "arrivals": {"offset": 0, "done": False},
+                         "totals": {"offset": 0, "done": False}, "lastSeen": {}}
+        self.members = 0
+        self.sessions = 0
+
+    def load(self, restart: bool = False):
+        if restart or not self.progress_path or not os.path.exists(self.progress_path):
+            return
+        with open(self.progress_path) as f:
+            progress = json.load(f)
+        if progress.get("guildId") != self.guild_id:
+            raise SystemExit(f"{self.progress_path} belongs to guild {progress.get('guildId')}; pass --restart to start over")
+        self.progress = progress
+
+    def save(self, force: bool = True):
+        if not self.progress_path or (not force and time.monotonic() - self._saved < self.save_interval):
+            return
+        self._saved = time.monotonic()
+        # Written aside and renamed, so a crash mid-write leaves the previous progress intact
+        with open(self.progress_path + ".tmp", "w") as f:
+            json.dump(self.progress, f)
+        os.replace(self.progress_path + ".tmp", self.progress_path)
+
+    async def _write_members(self, names: Dict[int, str]):
+        if not names:
+            return
+        ok = await self.db.upsertMembers([{"memberId": m, "name": name} for m, name in names.items()])
+        ok = ok and await self.db.upsertMembersGuild([{"memberId": m, "guildId": self.guild_id} for m in names])
+        if not ok:
+            raise SystemExit("Stopping: members could not be written; rerun to resume from the last chunk")
+        self.members += len(names)
+
+    async def import_arrivals(self, path: str):
+        """Record every member's latest name and arrival, writing new or renamed members"""
+        state, last_seen = self.progress["arrivals"], self.progress["lastSeen"]
+        if state["done"]:
+            return
+        report = ThroughputReport("arrivals", path, state["offset"])
+        names: Dict[int, str] = {}
+        entries = 0
+        for item, offset in iter_json_array(path, state["offset"]):
+            entries += 1
+            try:
+                member_id = int(item["member_id"])
+                name = item["details"]["member_name"]
+                timestamp = float(item["details"]["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                report.skipped += 1
+            else:
+                key = str(member_id)  # JSON object keys in the progress file
+                seen = last_seen.get(key)
+                if seen is None or timestamp >= seen[1]:
+                    if seen is None or seen[0] != name:
+                        names[member_id] = name
+                    last_seen[key] = [name, timestamp]
+            if entries % self.chunk_size == 0:
+                await self._write_members(names)
+                names.clear()
+                state["offset"] = offset
+                self.save(force=False)
+                report.tick(entries, offset)
+
+        await self._write_members(names)
+        state["done"] = True
+        self.save()
+        report.done(entries, os.path.getsize(path), self.members, 0)
+
+    async def _write_sessions(self, chunk: Dict[int, Tuple[str, datetime, datetime]]):
+        if not chunk:
+            return
+        await self._write_members({m: name for m, (name, _, _) in chunk.items()})
+        imported = await self.db.importSessions([
+            {"memberId": m, "guildId": self.guild_id, "arrivalTime": arrival, "leavingTime": leaving,
+             "eventId": f"legacy:{self.guild_id}:{m}"}
+            for m, (_, arrival, leaving) in chunk.items()])
+        if imported is None:
+            raise SystemExit("Stopping: sessions could not be written; rerun to resume from the last chunk")
+        self.sessions += imported
+
+    async def import_totals(self, path: str):
+        """Turn each member's total into one closed session ending when their last session did"""
+        state, last_seen = self.progress["totals"], self.progress["lastSeen"]
+        if state["done"]:
+            return
+        report = ThroughputReport("totals", path, state["offset"])
+        # Members never seen arriving are placed at the time the totals file was last written
+        fallback = os.path.getmtime(path)
+        chunk: Dict[int, Tuple[str, datetime, datetime]] = {}
+        members, sessions = self.members, self.sessions
+        entries = 0
+        for item, offset in iter_json_array(path, state["offset"]):
+            entries += 1
+            try:
+                member_id = int(item["member_id"])
+                total = float(item["total_gameplay_time_seconds"])
+            except (KeyError, TypeError, ValueError):
+                report.skipped += 1
+                total = 0.0
+            if total > 0:
+                name, arrived = last_seen.get(str(member_id), [item.get("member_name"), None])
+                # The last arrival plus the length of that session is when the member was last in voice
+                leaving = arrived + _parse_clock(item.get("last_session")) if arrived is not None else fallback
+                leaving = datetime.fromtimestamp(leaving, timezone.utc)
+                chunk[member_id] = (name or item.get("member_name") or str(member_id),
+                                    leaving - timedelta(seconds=total), leaving)
+            if entries % self.chunk_size == 0:
+                await self._write_sessions(chunk)
+                chunk.clear()
+                state["offset"] = offset
+                self.save(force=False)
+                report.tick(entries, offset)
+
+        await self._write_sessions(chunk)
+        state["done"] = True
+        self.save()
+        report.done(entries, os.path.getsize(path), self.members - members, self.sessions - sessions)
+
+class ThroughputReport:
+    """Progress lines every few seconds and a summary when a file is finished"""
+
+    def __init__(self, phase: str, path: str, offset: int, every: float = 5.0):
+        self.phase = phase
+        self.path = path
+        self.start_offset = offset
+        self.every = every
+        self.skipped = 0
+        self.started = self.last = time.perf_counter()
+        if offset:
+            print(f"{phase}: resuming {path} at byte {offset}")
+
+    def tick(self, entries: int, offset: int):
+        now = time.perf_counter()
+        if now - self.last >= self.every:
+            self.last = now
+            print(f"{self.phase}: {entries} entries, {(offset - self.start_offset) / 2**20:.1f} MiB "
+                  f"({entries / (now - self.started):.0f} entries/s)")
+
+    def done(self, entries: int, size: int, members: int, sessions: int):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        read = (size - self.start_offset) / 2**20
+        print(f"{self.phase}: {entries} entries from {self.path} ({read:.1f} MiB) in {elapsed:.1f}s, "
+              f"{entries / elapsed:.0f} entries/s, {read / elapsed:.1f} MiB/s; "
+              f"{members} members written, {sessions} sessions imported, {self.skipped} malformed entries skipped")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Import the legacy JSON arrival and gameplay files")
+    parser.add_argument("--guild-id", type=int, required=True, help="Guild the legacy deployment ran in")
+    parser.add_argument("--arrivals", help="Arrivals log written by get_arrival_time")
+    parser.add_argument("--totals", help="Gameplay totals written by log_game_time")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Entries per bulk write")
+    parser.add_argument("--progress", default="import_legacy.progress", help="Resumable progress file")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and start over")
+    args = parser.parse_args()
+    if not args.arrivals and not args.totals:
+        parser.error("nothing to import: pass --arrivals and/or --totals")
+
+    load_dotenv()
+    db = createDatabase(os.getenv('DB_BACKEND', 'supabase'), url=os.getenv('DATABASE_URL'),
+                        key=os.getenv('DATABASE_KEY'), path=os.getenv('SQLITE_PATH', 'gamingNotif.db'))
+    importer = LegacyImporter(db, args.guild_id, args.chunk_size, args.progress)
+    importer.load(args.restart)
+    try:
+        # Arrivals first: the totals need each member's last arrival to place their session
+        if args.arrivals:
+            await importer.import_arrivals(args.arrivals)
+        if args.totals:
+            await importer.import_totals(args.totals)
+    finally:
+        db.close()
+    print(f"Legacy import finished: {importer.members} member rows written, {importer.sessions} sessions imported")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,333 @@
+# journal.py
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set, Tuple
+from storage import StorageBackend
+from resilience import no_deadline
+
+class EventJournal:
+    """Append-only local log of voice session events, fsynced in small batches.
+
+    Each line is one compact JSON event. A sidecar checkpoint file holds the byte
+    offset up to which events have reached the database; everything after it is
+    replayed on the next start."""
+
+    def __init__(self, path: str, fsync_interval: float = 0.01, compact_bytes: int = 1 << 20):
+        self.path = path
+        self.checkpoint_path = path + ".ckpt"
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+
+        # Durable events not yet applied to the db, with the file offset each one ends at
+        self.pending: List[Tuple[Dict, int]] = []
+        self._buffer: List[Tuple[bytes, Dict, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._io_lock = asyncio.Lock()
+
+        self._recover()
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _recover(self):
+        """Load unapplied events, dropping a torn line left by a crash mid-write"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            checkpoint = 0
+
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            # A checkpoint past the end means we crashed while compacting; replay is idempotent
+            offset = checkpoint if checkpoint <= size else 0
+            f.seek(offset)
+            for line in f:
+                try:
+                    event = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    event = None
+                if event is None:
+                    print(f"Discarding {size - offset} unreadable bytes at the end of {self.path}")
+                    f.truncate(offset)
+                    break
+                offset += len(line)
+                self.pending.append((event, offset))
+
+        if self.pending:
+            print(f"Recovered {len(self.pending)} unapplied events from {self.path}")
+
+    async def append(self, kind: str, member, at: Optional[datetime] = None) -> Dict:
+        """Durably record an event (happening now, or at at); returns once it has been fsynced"""
+        event = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "memberId": member.id,
+            "name": member.name,
+            "guildId": member.guild.id,
+            "at": at.timestamp() if at is not None else time.time(),
+        }
+        line = json.dumps(event, separators=(",", ":")).encode() + b"\n"
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((line, event, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._group_commit())
+        await future
+        return event
+
+    async def _group_commit(self):
+        # Appends arriving during the wait or the write share the next fsync
+        while self._buffer:
+            await asyncio.sleep(self.fsync_interval)
+            batch, self._buffer = self._buffer, []
+            try:
+                async with self._io_lock:
+                    await asyncio.to_thread(self._write, b"".join(line for line, _, _ in batch))
+                    offset = self._size
+                    for line, event, _ in batch:
+                        offset += len(line)
+                        self.pending.append((event, offset))
+                    self._size = offset
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for _, event, future in batch:
+                if not future.done():
+                    future.set_result(event)
+        self._flush_task = None
+
+    def _write(self, data: bytes):
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception:
+            # Never leave half a batch behind for the next append to extend
+            self._file.truncate(self._size)
+            raise
+
+    def peek(self, limit: int) -> List[Dict]:
+        return [event for event, _ in self.pending[:limit]]
+
+    def position(self, event_id: str) -> int:
+        """How many unapplied events there are up to and including event_id; 0 once it is applied"""
+        # Searched from the newest end: the event asked about was usually appended moments ago
+        for i in range(len(self.pending) - 1, -1, -1):
+            if self.pending[i][0]["id"] == event_id:
+                return i + 1
+        return 0
+
+    async def commit(self, count: int):
+        """Mark the oldest count events as applied"""
+        if count <= 0:
+            return
+        offset = self.pending[count - 1][1]
+        del self.pending[:count]
+        async with self._io_lock:
+            if not self.pending and not self._buffer and self._size >= self.compact_bytes:
+                # Checkpoint first: a crash before the truncate only replays applied events
+                await asyncio.to_thread(self._write_checkpoint, 0)
+                await asyncio.to_thread(self._file.truncate, 0)
+                self._size = 0
+            else:
+                await asyncio.to_thread(self._write_checkpoint, offset)
+
+    def _write_checkpoint(self, offset: int):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def close(self):
+        self._file.close()
+
+def _journaled_member(event: Dict):
+    """Stand-in with the attributes the storage backends read from a discord.Member"""
+    return SimpleNamespace(id=event["memberId"], name=event["name"], guild=SimpleNamespace(id=event["guildId"]))
+
+class JournalReplayer:
+    """Journals session events before they touch the db, then applies them in order
+    and in bulk, backing off while the db is unreachable"""
+
+    def __init__(self, journal: EventJournal, db: StorageBackend, batch_size: int = 500,
+                 interval: float = 1.0, max_backoff: float = 60.0):
+        self.journal = journal
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+
+        self.healthy = True
+        self._backoff = interval
+        self._retry_at = 0.0
+        self._waiting: Set[str] = set()
+        self._sessions: Dict[str, Dict] = {}
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def record_join(self, member):
+        """Journal a voice join; the db writes go out with the next drain"""
+        try:
+            await self.journal.append("join", member)
+        except Exception as e:
+            print(f"Error journaling join for {member.name}: {e}")
+            with no_deadline():
+                await self.drain()
+            await self.db.newMember(member)
+            await self.db.newMemberToGuild(member, member.guild)
+            await self.db.logArrivalTime(member)
+            return
+        if len(self.journal) >= self.batch_size:
+            self._wake.set()
+
+    async def record_leave(self, member, leavingTime: Optional[datetime] = None) -> Optional[Dict]:
+        """Journal a voice leave and, while the db is healthy, apply it now and return the closed session"""
+        try:
+            event = await self.journal.append("leave", member, leavingTime)
+        except Exception as e:
+            print(f"Error journaling leave for {member.name}: {e}")
+            with no_deadline():
+                await self.drain()
+            return await self.db.closeSession(member, leavingTime)
+
+        if not self.healthy:
+            return None  # Kept in the journal; the background replayer applies it once the db is back
+
+        self._waiting.add(event["id"])
+        try:
+            # The drain applies the backlog ahead of this leave and may wait behind another drain, so
+            # it is not held to this event's budget: running out would be mistaken for a db outage.
+            # It stops at this leave, so events appended meanwhile never keep the handler waiting.
+            with no_deadline():
+                await self.drain(through=event["id"])
+            return self._sessions.pop(event["id"], None)
+        finally:
+            self._waiting.discard(event["id"])
+
+    async def drain(self, through: Optional[str] = None) -> bool:
+        """Apply journaled events in order: those up to and including the event with id through,
+        or everything journaled when the drain starts. Returns False if the db failed part way"""
+        async with self._lock:
+            # Bounded when it starts, so steady traffic cannot keep one drain (and its waiters) going
+            left = len(self.journal) if through is None else self.journal.position(through)
+            while left > 0:
+                batch = self.journal.peek(min(self.batch_size, left))
+                if not await self._apply(batch):
+                    self._mark_unhealthy(len(self.journal))
+                    return False
+                await self.journal.commit(len(batch))
+                left -= len(batch)
+            if not self.healthy:
+                print("Event journal drained; database writes are current again")
+            self.healthy = True
+            self._backoff = self.interval
+            return True
+
+    def _mark_unhealthy(self, backlog: int):
+        if self.healthy:
+            print(f"Database unavailable; {backlog} session events held in the journal")
+        else:
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+        self.healthy = False
+        self._retry_at = time.monotonic() + self._backoff
+
+    async def _apply(self, batch: List[Dict]) -> bool:
+        # Only each member's own events need ordering: wave n holds every member's
+        # n-th event of the batch, so a wave's joins and leaves can each go out together
+        waves: List[List[Dict]] = []
+        seen: Dict[int, int] = {}
+        for event in batch:
+            n = seen.get(event["memberId"], 0)
+            seen[event["memberId"]] = n + 1
+            if n == len(waves):
+                waves.append([])
+            waves[n].append(event)
+
+        for wave in waves:
+            joins = [e for e in wave if e["kind"] == "join"]
+            leaves = [e for e in wave if e["kind"] == "leave"]
+            if joins and not await self._apply_joins(joins):
+                return False
+            if leaves and not await self._apply_leaves(leaves):
+                return False
+        return True
+
+    async def _apply_joins(self, events: List[Dict]) -> bool:
+        members = {e["memberId"]: {"memberId": e["memberId"], "name": e["name"]} for e in events}
+        links = {(e["memberId"], e["guildId"]): {"memberId": e["memberId"], "guildId": e["guildId"]} for e in events}
+        time_logs = [{
+            "memberId": e["memberId"],
+            "guildId": e["guildId"],
+            "arrivalTime": datetime.fromtimestamp(e["at"], timezone.utc).isoformat(),
+            "eventId": e["id"],
+        } for e in events]
+
+        # Every write is idempotent, so a batch interrupted here is safe to resend
+        return (await self.db.upsertMembers(list(members.values()))
+                and await self.db.upsertMembersGuild(list(links.values()))
+                and await self.db.insertTimeLogs(time_logs))
+
+    async def _apply_leaves(self, events: List[Dict]) -> bool:
+        # One bulk call; a leave whose id is already recorded on a closed session is skipped,
+        # so a replay never closes an older session the first attempt did not touch
+        sessions = await self.db.closeSessions([{
+            "memberId": e["memberId"],
+            "guildId": e["guildId"],
+            "at": datetime.fromtimestamp(e["at"], timezone.utc),
+            "eventId": e["id"],
+        } for e in events])
+        if sessions is None:
+            return False
+        for event in events:
+            if event["id"] in sessions and event["id"] in self._waiting:
+                self._sessions[event["id"]] = sessions[event["id"]]
+        return True
+
+    def start(self):
+        """Start the background replayer (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop replaying, make a last attempt to drain and close the journal"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if len(self.journal) and not await self.drain():
+            print(f"{len(self.journal)} session events left in {self.journal.path} for the next start")
+        self.journal.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not len(self.journal) or (not self.healthy and time.monotonic() < self._retry_at):
+                continue
+            try:
+                # Each drain covers what was journaled when it started; carry on with the rest
+                if await self.drain() and len(self.journal):
+                    self._wake.set()
+            except Exception as e:
+                print(f"Error replaying event journal: {e}")
@@ -0,0 +1,137 @@
+# leaderboard.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+from cache import TTLCache
+from storage import StorageBackend
+
+# window name -> (how far back, bucket granularity to read)
+WINDOWS = {
+    "today": (timedelta(hours=24), "hour"),
+    "week": (timedelta(days=7), "day"),
+    "month": (timedelta(days=30), "day"),
+}
+
+class GuildLeaderboard:
+    """Top-K members of one guild by total game time"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: Dict[int, Dict] = {}  # memberId -> {"memberId", "gameTime", "name"}
+        self._ranked: Optional[List[Dict]] = None
+        # Set when a listed member's total went down: someone off the board may now be ahead
+        self.stale = False
+
+    def seed(self, rows: List[Dict]):
+        self.entries = {row["memberId"]: dict(row) for row in rows[:self.size]}
+        self._ranked = None
+        self.stale = False
+
+    def update(self, member_id: int, name: str, game_time: float) -> bool:
+        """Apply a member's new total; returns True if the board changed"""
+        current = self.entries.get(member_id)
+        if current is None and len(self.entries) >= self.size:
+            # An outsider enters only by passing the last place
+            lowest = min(self.entries.values(), key=lambda row: row["gameTime"])
+            if game_time <= lowest["gameTime"]:
+                return False
+            del self.entries[lowest["memberId"]]
+        elif current is not None and game_time < current["gameTime"] and len(self.entries) >= self.size:
+            # Totals can go down: a late leave takes back time checkpoints credited past it.
+            # Only the db knows who is next in line, so a full board is re-seeded before its next read
+            self.stale = True
+
+        self.entries[member_id] = {"memberId": member_id, "gameTime": game_time, "name": name}
+        self._ranked = None  # Re-sorted on the next read, whichever way the total moved
+        return True
+
+    def ranked(self) -> List[Dict]:
+        if self._ranked is None:
+            self._ranked = sorted(self.entries.values(), key=lambda row: row["gameTime"], reverse=True)
+        return self._ranked
+
+class LeaderboardCache:
+    """Per-guild leaderboards kept current from session closes, re-seeded from the db periodically"""
+
+    def __init__(self, db: StorageBackend, size: int = 100, reseed_interval: float = 1800, window_ttl: float = 60):
+        self.db = db
+        self.size = size
+        self.reseed_interval = reseed_interval
+        # (guildId, window) -> ranking built from TimeBuckets
+        self.windows = TTLCache(max_size=1000, ttl_seconds=window_ttl)
+
+        self.boards: Dict[int, GuildLeaderboard] = {}
+        self._member_guilds: Dict[int, Set[int]] = {}  # memberId -> guilds whose board lists them
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, guild_id: int) -> List[Dict]:
+        """Return the guild's ranking, seeding it on first use"""
+        if self._needs_seed(guild_id):
+            lock = self._locks.setdefault(guild_id, asyncio.Lock())
+            async with lock:
+                if self._needs_seed(guild_id):
+                    await self._seed(guild_id)
+        board = self.boards.get(guild_id)
+        return board.ranked() if board else []
+
+    def _needs_seed(self, guild_id: int) -> bool:
+        board = self.boards.get(guild_id)
+        return board is None or board.stale
+
+    async def get_window(self, guild_id: int, window: str) -> List[Dict]:
+        """Return the guild's ranking over a recent window, read from time buckets"""
+        ranking = self.windows.get((guild_id, window))
+        if ranking is None:
+            span, granularity = WINDOWS[window]
+            since = datetime.now(timezone.utc) - span
+            since = since.replace(minute=0, second=0, microsecond=0)
+            if granularity == "day":
+                since = since.replace(hour=0)
+            ranking = await self.db.getWindowTotals(guild_id, since, granularity, self.size)
+            if ranking is None:
+                return []
+            self.windows.set((guild_id, window), ranking)
+        return ranking
+
+    async def _seed(self, guild_id: int):
+        rows = await self.db.getTopUsersByGuild(guild_id, self.size)
+        board = self.boards.get(guild_id) or GuildLeaderboard(self.size)
+        if not rows and board.entries:
+            return  # Members are never removed, so an empty result means the query failed
+        board.seed(rows)
+        self.boards[guild_id] = board
+        for row in rows:
+            self._member_guilds.setdefault(row["memberId"], set()).add(guild_id)
+
+    def credit(self, member, game_time: float):
+        """Record a member's new total in every loaded board it belongs on"""
+        guild_ids = set(self._member_guilds.get(member.id, ()))
+        guild_ids.add(member.guild.id)
+        for guild_id in guild_ids:
+            board = self.boards.get(guild_id)
+            if board and board.update(member.id, member.name, game_time):
+                self._member_guilds.setdefault(member.id, set()).add(guild_id)
+
+    def start(self):
+        """Start periodic re-seeding from the db"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reseed_interval)
+            for guild_id in list(self.boards):
+                try:
+                    await self._seed(guild_id)
+                except Exception as e:
+                    print(f"Error re-seeding leaderboard for guild {guild_id}: {e}")
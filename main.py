@@ -1,44 +1,176 @@
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
+import asyncio
 import os
 from utils import NotificationManager
 from events import BotEvents
-from queries import DatabaseQueries
-from supabase import create_client, Client
+from storage import createDatabase
 from discord_logger import setup_discord_logging
+from write_behind import WriteBehindQueue
+from journal import EventJournal, JournalReplayer
+from dm_index import DmIndex
+from fanout import DmFanout
+from digest import DigestScheduler
+from leaderboard import LeaderboardCache
+from stats import StatsCache
+from metrics import MetricsServer, MetricsPublisher
+from dispatcher import EventDispatcher
+from debounce import FlapDebouncer
+from checkpoint import SessionCheckpointer
+from watchdog import LoopWatchdog
+from shared_store import createStore
+from resilience import CallGuard, CircuitBreaker
+from bot_profile import profile_options, dispatch_uncached_member_updates
 from botCommands import *
 
-# Setup Discord client
-intents = discord.Intents.default()
-intents.typing = True
-intents.presences = True
-intents.members = True
-intents.voice_states = True
-intents.guilds = True
-intents.message_content = True
-bugs = commands.Bot(intents=intents, command_prefix="!")
-
 # Load environment variables
 load_dotenv()
 token = os.getenv('DISCORD_TOKEN') 
+# full caches every member and presence; lean caches only members in voice
+botProfile = os.getenv('BOT_PROFILE', 'full')
+# Set by cluster.py for each worker process; unset runs one unsharded bot
+shardCount = int(os.getenv('SHARD_COUNT', 0))
+shardIds = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i]
+workerId = os.getenv('CLUSTER_WORKER_ID')
+sharedStoreUrl = os.getenv('SHARED_STORE', 'memory')
+dbBackend = os.getenv('DB_BACKEND', 'supabase')
 dbUrl = os.getenv('DATABASE_URL')
 dbKey = os.getenv('DATABASE_KEY')
+dbMaxWorkers = int(os.getenv('DB_MAX_WORKERS', 8))
+dbSlowCallMs = float(os.getenv('DB_SLOW_CALL_MS', 2000))
+dbBreakerOpenSeconds = float(os.getenv('DB_BREAKER_OPEN_SECONDS', 15))
+dbRetries = int(os.getenv('DB_RETRIES', 2))
+eventBudgetMs = float(os.getenv('EVENT_BUDGET_MS', 5000))
+sqlitePath = os.getenv('SQLITE_PATH', 'gamingNotif.db')
+writeBatchSize = int(os.getenv('WRITE_BATCH_SIZE', 200))
+writeFlushSeconds = float(os.getenv('WRITE_FLUSH_SECONDS', 2.0))
+journalPath = os.getenv('JOURNAL_PATH', 'events.journal')
+journalFsyncMs = float(os.getenv('JOURNAL_FSYNC_MS', 10))
+dmReconcileSeconds = float(os.getenv('DM_RECONCILE_SECONDS', 900))
+dmConcurrency = int(os.getenv('DM_CONCURRENCY', 10))
+dmRatePerSecond = float(os.getenv('DM_RATE_PER_SECOND', 20))
+digestWindowSeconds = float(os.getenv('DIGEST_WINDOW_SECONDS', 60))
+digestPerHour = float(os.getenv('DIGEST_PER_HOUR', 4))
+digestBurst = int(os.getenv('DIGEST_BURST', 2))
+leaderboardSize = int(os.getenv('LEADERBOARD_SIZE', 100))
+leaderboardReseedSeconds = float(os.getenv('LEADERBOARD_RESEED_SECONDS', 1800))
+statsCacheSeconds = float(os.getenv('STATS_CACHE_SECONDS', 600))
+dispatchPartitions = int(os.getenv('DISPATCH_PARTITIONS', 16))
+dispatchQueueSize = int(os.getenv('DISPATCH_QUEUE_SIZE', 1000))
+dispatchConcurrency = int(os.getenv('DISPATCH_CONCURRENCY', 8))
+flapGraceSeconds = float(os.getenv('FLAP_GRACE_SECONDS', 10))
+checkpointSeconds = float(os.getenv('CHECKPOINT_SECONDS', 300))
+loopStallMs = float(os.getenv('LOOP_STALL_MS', 250))
+metricsPort = int(os.getenv('METRICS_PORT', 9108))
+logLevel = os.getenv('LOG_LEVEL', 'INFO')
+logFile = os.getenv('LOG_FILE')
+logBufferSize = int(os.getenv('LOG_BUFFER_SIZE', 1000))
+logFlushSeconds = float(os.getenv('LOG_FLUSH_SECONDS', 2.0))
+
+# Setup Discord client; a cluster worker connects only its own range of shards
+clientOptions = profile_options(botProfile)
+if shardCount:
+    bugs = commands.AutoShardedBot(command_prefix="!", shard_count=shardCount,
+                                   shard_ids=shardIds or None, **clientOptions)
+else:
+    bugs = commands.Bot(command_prefix="!", **clientOptions)
+if botProfile == "lean":
+    dispatch_uncached_member_updates(bugs)
 
 # Initialize database connection (global)
-supabase: Client = create_client(dbUrl, dbKey)
-db = DatabaseQueries(supabase)
+# Queries fail fast while the database is erroring or slow; upserts are retried with jitter
+db_guard = CallGuard(CircuitBreaker("db", slow_call_seconds=dbSlowCallMs / 1000, open_seconds=dbBreakerOpenSeconds),
+                     retries=dbRetries)
+db = createDatabase(dbBackend, url=dbUrl, key=dbKey, max_workers=dbMaxWorkers, path=sqlitePath, guard=db_guard)
+
+# State every worker process must agree on (cooldowns, DM index versions, metrics)
+store = createStore(sharedStoreUrl)
 
 # Initialize managers
-notification_manager = NotificationManager(db)
+dm_index = DmIndex(db, reconcile_interval=dmReconcileSeconds, store=store)
+dm_fanout = DmFanout(max_concurrency=dmConcurrency, rate_per_second=dmRatePerSecond)
+# Per-recipient digests replace the guild-wide cooldown (DIGEST_WINDOW_SECONDS=0 restores it)
+digests = DigestScheduler(dm_fanout, window=digestWindowSeconds, per_hour=digestPerHour,
+                          burst=digestBurst) if digestWindowSeconds > 0 else None
+notification_manager = NotificationManager(db, dm_index, dm_fanout, store, digests)
+leaderboard = LeaderboardCache(db, size=leaderboardSize, reseed_interval=leaderboardReseedSeconds)
+stats = StatsCache(db, ttl_seconds=statsCacheSeconds)
+dispatcher = EventDispatcher(dispatchPartitions, dispatchQueueSize, dispatchConcurrency) if dispatchPartitions else None
+debouncer = FlapDebouncer(flapGraceSeconds) if flapGraceSeconds > 0 else None
+# Credits time in voice while sessions are still open
+checkpointer = SessionCheckpointer(bugs, db, checkpointSeconds, leaderboard, stats) if checkpointSeconds > 0 else None
+# Samples the loop thread's stack whenever the loop is blocked for longer than LOOP_STALL_MS
+watchdog = LoopWatchdog(threshold=loopStallMs / 1000) if loopStallMs > 0 else None
+metrics_server = MetricsServer(port=metricsPort) if metricsPort else None
+metrics_publisher = MetricsPublisher(store, workerId) if workerId else None
+write_behind = WriteBehindQueue(db, max_batch=writeBatchSize, flush_interval=writeFlushSeconds)
+# Session events are journaled to local disk before they reach the db (JOURNAL_PATH= disables)
+replayer = JournalReplayer(EventJournal(journalPath, fsync_interval=journalFsyncMs / 1000), db,
+                           batch_size=writeBatchSize) if journalPath else None
 
 # Setup Discord logging
-discord_logger = setup_discord_logging(bugs, 1422756400584724622, "testingchannel")
+discord_logger = setup_discord_logging(bugs, 1422756400584724622, "testingchannel",
+                                       buffer_size=logBufferSize, flush_interval=logFlushSeconds,
+                                       min_level=logLevel, log_file=logFile)
 
 # Register events (pass discord_logger to events)
-bot_events = BotEvents(bugs, notification_manager, db, discord_logger)
-bot_commands = BotCommands(bugs, notification_manager, db, discord_logger)
+bot_events = BotEvents(bugs, notification_manager, db, discord_logger, write_behind, leaderboard, stats, replayer, dispatcher, debouncer,
+                       event_budget=eventBudgetMs / 1000 if eventBudgetMs else None)
+bot_commands = BotCommands(bugs, notification_manager, db, discord_logger, leaderboard, stats, watchdog)
+
+async def main():
+    async with bugs:
+        if watchdog:
+            watchdog.start()
+        write_behind.start()
+        dm_index.start()
+        leaderboard.start()
+        if replayer:
+            replayer.start()
+        if dispatcher:
+            dispatcher.start()
+        if checkpointer:
+            checkpointer.start()
+        if digests:
+            digests.start()
+        if metrics_publisher:
+            metrics_publisher.start()
+        if metrics_server:
+            try:
+                await metrics_server.start()
+            except OSError as e:
+                print(f"Error starting metrics endpoint on port {metricsPort}: {e}")
+        try:
+            await bugs.start(token)
+        finally:
+            # Stop background tasks, then flush buffered joins and logs before exiting
+            if dispatcher:
+                await dispatcher.stop()
+            if debouncer:
+                # Leaves still inside their grace window close at the time they happened
+                await debouncer.flush(bot_events.close_session)
+            if checkpointer:
+                await checkpointer.stop()
+            if digests:
+                await digests.stop()
+            await notification_manager.flush()
+            await dm_index.stop()
+            await leaderboard.stop()
+            await write_behind.stop()
+            if replayer:
+                await replayer.stop()
+            if metrics_server:
+                await metrics_server.stop()
+            if metrics_publisher:
+                await metrics_publisher.stop()
+            if watchdog:
+                await watchdog.stop()
+            await discord_logger.stop()
+            db.close()
+            store.close()
 
 # Start the bot
 if __name__ == "__main__":
-    bugs.run(token)
\ No newline at end of file
+    discord.utils.setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,284 @@
+# metrics.py
+import asyncio
+import functools
+import json
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, Prometheus style (+Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Key = Tuple[str, str]  # (component, op)
+Labels = Tuple[Tuple[str, str], ...]
+
+# The timed operation the current task is inside, so swallowed errors can be attributed
+_current_op: ContextVar[Optional[Key]] = ContextVar("current_op", default=None)
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """Call counts, error counts, latency histograms and in-flight gauges per operation"""
+
+    def __init__(self, prefix: str = "gamingnotif", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.calls: Dict[Key, int] = {}
+        self.errors: Dict[Key, int] = {}
+        self.in_flight: Dict[Key, int] = {}
+        self.latency: Dict[Key, Histogram] = {}
+        # Free-form series: name -> labels -> value (counters) or sampling callback (gauges)
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, Callable[[], float]]] = {}
+
+    def begin(self, key: Key):
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def end(self, key: Key, elapsed: float):
+        self.in_flight[key] -= 1
+        self.calls[key] = self.calls.get(key, 0) + 1
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(self.buckets)
+        histogram.observe(elapsed)
+
+    def error(self, key: Optional[Key] = None):
+        """Count an error against key, or the operation the calling task is timing"""
+        key = key or _current_op.get()
+        if key is not None:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels):
+        """Register a gauge sampled on every render"""
+        self.gauges.setdefault(name, {})[tuple(sorted((k, str(v)) for k, v in labels.items()))] = fn
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        p = self.prefix
+        lines = []
+
+        def labels(key: Key, extra: str = "") -> str:
+            return f'{{component="{key[0]}",op="{key[1]}"{extra}}}'
+
+        lines += [f"# HELP {p}_calls_total Completed operations", f"# TYPE {p}_calls_total counter"]
+        lines += [f"{p}_calls_total{labels(k)} {v}" for k, v in sorted(self.calls.items())]
+        lines += [f"# HELP {p}_errors_total Failed operations", f"# TYPE {p}_errors_total counter"]
+        lines += [f"{p}_errors_total{labels(k)} {v}" for k, v in sorted(self.errors.items())]
+        lines += [f"# HELP {p}_in_flight Operations currently running", f"# TYPE {p}_in_flight gauge"]
+        lines += [f"{p}_in_flight{labels(k)} {v}" for k, v in sorted(self.in_flight.items())]
+
+        lines += [f"# HELP {p}_latency_seconds Operation latency", f"# TYPE {p}_latency_seconds histogram"]
+        for key, histogram in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = f',le="{bound}"'
+                lines.append(f"{p}_latency_seconds_bucket{labels(key, le)} {cumulative}")
+            le = ',le="+Inf"'
+            lines.append(f"{p}_latency_seconds_bucket{labels(key, le)} {histogram.count}")
+            lines.append(f"{p}_latency_seconds_sum{labels(key)} {histogram.sum}")
+            lines.append(f"{p}_latency_seconds_count{labels(key)} {histogram.count}")
+
+        def series_labels(key: Labels) -> str:
+            return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}" if key else ""
+
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines += [f"{p}_{name}_total{series_labels(k)} {v}" for k, v in sorted(series.items())]
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines += [f"{p}_{name}{series_labels(k)} {fn()}" for k, fn in sorted(series.items())]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """JSON-safe copy of every series, with gauges sampled now"""
+        return {
+            "calls": [[*k, v] for k, v in self.calls.items()],
+            "errors": [[*k, v] for k, v in self.errors.items()],
+            "in_flight": [[*k, v] for k, v in self.in_flight.items()],
+            "latency": [[*k, h.counts, h.sum, h.count] for k, h in self.latency.items()],
+            "counters": {name: [[list(map(list, k)), v] for k, v in series.items()] for name, series in self.counters.items()},
+            "gauges": {name: [[list(map(list, k)), fn()] for k, fn in series.items()] for name, series in self.gauges.items()},
+        }
+
+    def merge(self, snapshot: Dict):
+        """Add another process's snapshot into this registry"""
+        for field in ("calls", "errors", "in_flight"):
+            values = getattr(self, field)
+            for component, op, v in snapshot.get(field, ()):
+                values[(component, op)] = values.get((component, op), 0) + v
+        for component, op, counts, total, count in snapshot.get("latency", ()):
+            histogram = self.latency.setdefault((component, op), Histogram(self.buckets))
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+            histogram.count += count
+        for name, series in snapshot.get("counters", {}).items():
+            for labels, v in series:
+                self.inc(name, v, **dict(labels))
+        for name, series in snapshot.get("gauges", {}).items():
+            for labels, v in series:
+                key = tuple(tuple(pair) for pair in labels)
+                previous = self.gauges.get(name, {}).get(key)
+                total = v + (previous() if previous else 0)
+                self.gauges.setdefault(name, {})[key] = lambda total=total: total
+
+    def summary(self, limit: int = 15) -> List[Dict]:
+        """Operations ordered by total time spent, for !metrics"""
+        rows = [{
+            "component": key[0],
+            "op": key[1],
+            "calls": histogram.count,
+            "errors": self.errors.get(key, 0),
+            "in_flight": self.in_flight.get(key, 0),
+            "total": histogram.sum,
+            "p50": histogram.quantile(0.5),
+            "p99": histogram.quantile(0.99),
+        } for key, histogram in self.latency.items()]
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows[:limit]
+
+# Process-wide registry the decorators and the endpoint share
+metrics = Metrics()
+
+def timed(component: str, op: Optional[str] = None):
+    """Decorate a coroutine function to record its calls, latency, in-flight count and raised errors"""
+    def decorate(fn):
+        key = (component, op or fn.__name__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _current_op.set(key)
+            metrics.begin(key)
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                metrics.error(key)
+                raise
+            finally:
+                metrics.end(key, time.perf_counter() - start)
+                _current_op.reset(token)
+        wrapper.__timed__ = True
+        return wrapper
+    return decorate
+
+class MetricsPublisher:
+    """Writes this process's snapshot to a shared store so a cluster launcher can aggregate it"""
+
+    def __init__(self, store, worker_id: str, registry: Metrics = metrics, interval: float = 10.0):
+        self.store = store
+        self.worker_id = worker_id
+        self.registry = registry
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self):
+        await self.store.set(f"metrics:{self.worker_id}", json.dumps(self.registry.snapshot()))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.publish()
+        except Exception as e:
+            print(f"Error publishing metrics: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                print(f"Error publishing metrics: {e}")
+
+async def aggregate(store) -> Metrics:
+    """Merge every published worker snapshot into one registry"""
+    merged = Metrics()
+    for value in (await store.scan("metrics:")).values():
+        merged.merge(json.loads(value))
+    return merged
+
+class MetricsServer:
+    """Serves the registry as Prometheus text on GET /metrics"""
+
+    def __init__(self, registry: Metrics = metrics, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request has no body we care about
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
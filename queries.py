@@ -1,34 +1,72 @@
 from supabase import Client
 from typing import Optional, List, Dict
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from discord import Member, Guild
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from cache import MemberRegistry
+from storage import StorageBackend
+from resilience import CallGuard
+from metrics import metrics
 
-class DatabaseQueries:
-    def __init__(self, supabase_client: Client):
+class DatabaseQueries(StorageBackend):
+    """Supabase storage backend"""
+
+    def __init__(self, supabase_client: Client, max_workers: int = 8, registry: Optional[MemberRegistry] = None,
+                 guard: Optional[CallGuard] = None):
+        super().__init__(registry, guard)
         self.supabase = supabase_client
+        # The supabase client is synchronous, so every .execute() runs on a
+        # bounded pool of threads sharing the client's keep-alive HTTP session
+        # instead of blocking the event loop.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def _execute(self, query, idempotent: bool = False):
+        """Run a query builder's blocking execute() off the event loop.
+        Only idempotent queries (upserts) are retried after a failure."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await self.guard.run(lambda: loop.run_in_executor(self.executor, query.execute), idempotent)
+        except Exception:
+            # Callers log and swallow the error; count it against the operation being timed
+            metrics.error()
+            raise
+
+    def close(self):
+        """Shut down the worker threads, waiting for in-flight queries"""
+        self.executor.shutdown(wait=True)
 
     async def existsMember(self, member) -> bool:
+        if self.registry.has_member(member.id):
+            return True
         try:
-            data = self.supabase.table("Members").select("memberId", count="exact").eq("memberId", member.id).execute()
+            data = await self._execute(self.supabase.table("Members").select("memberId", count="exact").eq("memberId", member.id))
             return data.count > 0
         except Exception as e:
             print(f"Error fetching member {member.name}: {e}")
             return False
             
     async def newMember(self, member: Member) -> bool:
+        if self.registry.is_known_member(member.id, member.name):
+            return True
         try:
-          self.supabase.table("Members").upsert([
+          await self._execute(self.supabase.table("Members").upsert([
               {"memberId": member.id, "name" : member.name}
-          ]).execute()
+          ]), idempotent=True)
+          self.registry.remember_member(member.id, member.name)
           return True
         except Exception as e:
             print(f"Error inserting member {member.name}: {e}")
             return False
 
     async def newMemberToGuild(self, member, guild):
+        if self.registry.is_linked(member.id, guild.id):
+            return True
         try:
-            self.supabase.table("MembersGuild").upsert({"memberId": member.id, "guildId" : guild.id}).execute()
+            await self._execute(self.supabase.table("MembersGuild").upsert({"memberId": member.id, "guildId" : guild.id}), idempotent=True)
+            self.registry.remember_link(member.id, guild.id)
+            return True
         except Exception as e:
             print(f"Error linking {member.name} to guild {guild.name}: {e}")
             return False
@@ -36,7 +74,7 @@ class DatabaseQueries:
     async def logArrivalTime(self, member) -> bool:
         # Insert member into arrival time
         try:
-            self.supabase.table("TimeLog").upsert([{"memberId" : member.id}]).execute()
+            await self._execute(self.supabase.table("TimeLog").upsert([{"memberId" : member.id, "guildId": member.guild.id}]))
             return True
         except Exception as e:
             print(f"Error time log {member.name}: {e}")
@@ -44,9 +82,9 @@ class DatabaseQueries:
     
     async def logLeaveTime(self, member) -> bool:
         try:
-            data = self.supabase.table("TimeLog").select("id").eq("memberId", member.id).order("arrivalTime", desc=True).limit(1).execute()
+            data = await self._execute(self.supabase.table("TimeLog").select("id").eq("memberId", member.id).order("arrivalTime", desc=True).limit(1))
             timeId = data.data[0]["id"]
-            self.supabase.table("TimeLog").update({"leavingTime": "now()"}).eq("id", timeId).execute()
+            await self._execute(self.supabase.table("TimeLog").update({"leavingTime": "now()"}).eq("id", timeId))
             return True
         except Exception as e:
             print(f"Error leaving time log {member.name}: {e}")
@@ -55,15 +93,15 @@ class DatabaseQueries:
     async def logGameTime(self, member) -> bool:
         try:
             # Call the stored procedure
-            result = self.supabase.rpc('get_session_duration_seconds', {'recievedmemberid': member.id}).execute()
-            data = self.supabase.table("Members").select("gameTime").eq("memberId", member.id).execute()
+            result = await self._execute(self.supabase.rpc('get_session_duration_seconds', {'recievedmemberid': member.id}))
+            data = await self._execute(self.supabase.table("Members").select("gameTime").eq("memberId", member.id))
 
             data = data.data[0]["gameTime"] if data.data else 0.0
             duration = float(result.data) if result.data else 0.0
 
             if data is not None:
                 duration += float(data)
-            self.supabase.table("Members").update({"gameTime": duration}).eq("memberId", member.id).execute()
+            await self._execute(self.supabase.table("Members").update({"gameTime": duration}).eq("memberId", member.id))
 
             if duration > 0:
                 print(f"{member.name} played for {duration:.1f} seconds")
@@ -72,38 +110,80 @@ class DatabaseQueries:
             print(f"Error calculating game time for {member.name}: {e}")
             return False
         
+    async def closeSession(self, member, leavingTime: Optional[datetime] = None) -> Optional[Dict]:
+        """Close the open session and credit what checkpoints have not yet, in one call;
+        returns {"duration", "credited", "gameTime", "arrivalTime", "leavingTime"}"""
+        try:
+            params = {'recievedmemberid': member.id, 'recievedguildid': member.guild.id}
+            if leavingTime is not None:
+                params['recievedleavingtime'] = leavingTime.isoformat()
+            result = await self._execute(self.supabase.rpc('close_session', params))
+            data = result.data or {}
+            return {
+                "duration": float(data.get("duration") or 0.0),
+                "credited": float(data.get("credited") or 0.0),
+                "gameTime": float(data["gameTime"]) if data.get("gameTime") is not None else None,
+                "arrivalTime": data.get("arrivalTime"),
+                "leavingTime": data.get("leavingTime"),
+            }
+        except Exception as e:
+            print(f"Error closing session for {member.name}: {e}")
+            return None
+
+    async def closeSessions(self, leaves: List[Dict]) -> Optional[Dict[str, Dict]]:
+        """Close a batch of journaled leaves in one request (see sql/close_sessions.sql)"""
+        if not leaves:
+            return {}
+        try:
+            params = {'leaves': [{**leave, 'at': leave['at'].isoformat()} for leave in leaves]}
+            # Leaves already recorded are skipped, so a failed batch is safe to resend
+            result = await self._execute(self.supabase.rpc('close_sessions', params), idempotent=True)
+            return {
+                event_id: {
+                    "duration": float(data.get("duration") or 0.0),
+                    "credited": float(data.get("credited") or 0.0),
+                    "gameTime": float(data["gameTime"]) if data.get("gameTime") is not None else None,
+                    "arrivalTime": data.get("arrivalTime"),
+                    "leavingTime": data.get("leavingTime"),
+                }
+                for event_id, data in (result.data or {}).items()
+            }
+        except Exception as e:
+            print(f"Error closing {len(leaves)} sessions: {e}")
+            return None
+
     async def registerGuild(self, guild: Guild) -> bool:
         try:
-            self.supabase.table("Guild").upsert({
+            await self._execute(self.supabase.table("Guild").upsert({
                 "guildId" : guild.id, "guildName": guild.name,
-            }).execute()
+            }), idempotent=True)
             return True
         except Exception as e:
             print(f"There was an error on registering this guild {guild.name}: {e}")
             return False
         
-    async def getCoolDown(self, guild: Guild):
+    async def getCoolDown(self, guild: Guild) -> Optional[float]:
         try:
-            result = self.supabase.table("Guild").select("Cooldown").eq("guildId", guild.id).execute()
-            return result
+            result = await self._execute(self.supabase.table("Guild").select("Cooldown").eq("guildId", guild.id))
+            return float(result.data[0]["Cooldown"] or 0) if result.data else 0.0
         except Exception as e:
             print(f"There was an error getting the cooldown for {guild.name}: {e}")
-            return False
+            return None
         
-    async def updateCoolDown(self, guild: Guild):
+    async def updateCoolDown(self, guild: Guild, timestamp: Optional[float] = None):
         try:
-            self.supabase.table("Guild").update({
-                "Cooldown" : time.time()
-            }).eq("guildId", guild.id).execute()
+            await self._execute(self.supabase.table("Guild").update({
+                "Cooldown" : timestamp or time.time()
+            }).eq("guildId", guild.id))
         except Exception as e:
             print(f"There was an error updating {guild.name}'s cooldown: {e}")
             return False
         
     async def add_to_dm_group(self, guild: Guild, member: Member) -> bool:
         try:
-            self.supabase.table("MembersGuild").update({
+            await self._execute(self.supabase.table("MembersGuild").update({
                 "DM" : 1
-            }).eq("guildId", guild.id).eq("memberId", member.id).execute()
+            }).eq("guildId", guild.id).eq("memberId", member.id))
             return True
         except Exception as e:
             print(f"Error adding member {member.id} to DM group for guild {guild.id}: {e}")
@@ -111,31 +191,30 @@ class DatabaseQueries:
 
     async def remove_from_dm_group(self, guild: Guild, member: Member) -> bool:
         try:
-            self.supabase.table("MembersGuild").update({
+            await self._execute(self.supabase.table("MembersGuild").update({
                 "DM" : 0
-            }).eq("guildId", guild.id).eq("memberId", member.id).execute()
+            }).eq("guildId", guild.id).eq("memberId", member.id))
             return True
         except Exception as e:
             print(f"Error removing member {member.id} from DM group for guild {guild.id}: {e}")
             return False
 
-    async def get_dm_group(self, guild: int) -> list:
+    async def get_dm_group(self, guild: Guild) -> Optional[list]:
         try:
-            result = self.supabase.table("MembersGuild").select("memberId").eq("guildId", guild.id).eq("DM", 1).execute()
+            result = await self._execute(self.supabase.table("MembersGuild").select("memberId").eq("guildId", guild.id).eq("DM", 1))
             return result.data
         except Exception as e:
             print(f"Error fetching DM group for guild {guild.id}: {e}")
-            return []
+            return None
 
     async def getTopUsersByGuild(self, guildId, limit):
         try:
-            result = self.supabase.table("MembersGuild")\
+            result = await self._execute(self.supabase.table("MembersGuild")\
             .select("memberId, Members(gameTime, name)")\
             .eq("guildId", guildId)\
             .not_.is_("Members.gameTime", "null")\
             .order("Members.gameTime", desc=True)\
-            .limit(limit)\
-            .execute()
+            .limit(limit))
 
             # Transform the data for easier use
             top_users = []
@@ -153,11 +232,10 @@ class DatabaseQueries:
     
     async def getDmStatus(self, guild: Guild, member: Member):
         try:
-            result = self.supabase.table("MembersGuild")\
+            result = await self._execute(self.supabase.table("MembersGuild")\
                 .select("DM")\
                 .eq("guildId", guild.id)\
-                .eq("memberId", member.id)\
-                .execute()
+                .eq("memberId", member.id))
             if result.data and len(result.data) > 0:
                 return result.data[0]["DM"]
             else:
@@ -167,9 +245,179 @@ class DatabaseQueries:
             return None
 
     async def existsMembersGuild(self, member: Member, guild: Guild):
+        if self.registry.is_linked(member.id, guild.id):
+            return True
         try:
-            data = self.supabase.table("MembersGuild").select("memberId", count="exact").eq("memberId", member.id).eq("guildId", guild.id).execute()
-            return data.count > 0  
+            data = await self._execute(self.supabase.table("MembersGuild").select("memberId", count="exact").eq("memberId", member.id).eq("guildId", guild.id))
+            if data.count > 0:
+                self.registry.remember_link(member.id, guild.id)
+            return data.count > 0
         except Exception as e:
             print(f"Error fetching top users for guild {guild.id}: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def upsertMembers(self, rows: List[Dict]) -> bool:
+        rows = [row for row in rows if not self.registry.is_known_member(row["memberId"], row["name"])]
+        if not rows:
+            return True
+        try:
+            await self._execute(self.supabase.table("Members").upsert(rows), idempotent=True)
+            for row in rows:
+                self.registry.remember_member(row["memberId"], row["name"])
+            return True
+        except Exception as e:
+            print(f"Error bulk upserting {len(rows)} members: {e}")
+            return False
+
+    async def upsertMembersGuild(self, rows: List[Dict]) -> bool:
+        rows = [row for row in rows if not self.registry.is_linked(row["memberId"], row["guildId"])]
+        if not rows:
+            return True
+        try:
+            await self._execute(self.supabase.table("MembersGuild").upsert(rows), idempotent=True)
+            for row in rows:
+                self.registry.remember_link(row["memberId"], row["guildId"])
+            return True
+        except Exception as e:
+            print(f"Error bulk linking {len(rows)} members to guilds: {e}")
+            return False
+
+    async def insertTimeLogs(self, rows: List[Dict]) -> bool:
+        try:
+            if any("eventId" in row for row in rows):
+                # Replayed journal events: rows already inserted are skipped by event id
+                await self._execute(self.supabase.table("TimeLog").upsert(rows, on_conflict="eventId", ignore_duplicates=True),
+                                    idempotent=True)
+            else:
+                await self._execute(self.supabase.table("TimeLog").insert(rows))
+            return True
+        except Exception as e:
+            print(f"Error bulk inserting {len(rows)} time logs: {e}")
+            return False
+
+
+    async def warmRegistry(self, guildIds: List[int], pageSize: int = 1000, guildChunk: int = 100) -> int:
+        """Load the persisted members and guild links for these guilds into the registry"""
+        loaded = 0
+        try:
+            for i in range(0, len(guildIds), guildChunk):
+                chunk = guildIds[i:i + guildChunk]
+                offset = 0
+                while True:
+                    result = await self._execute(self.supabase.table("MembersGuild")\
+                        .select("memberId, guildId, Members(name)")\
+                        .in_("guildId", chunk)\
+                        .order("guildId")\
+                        .order("memberId")\
+                        .range(offset, offset + pageSize - 1))
+                    for row in result.data:
+                        self.registry.remember_link(row["memberId"], row["guildId"])
+                        if row["Members"]:
+                            self.registry.remember_member(row["memberId"], row["Members"]["name"])
+                    offset += len(result.data)
+                    if len(result.data) < pageSize:
+                        break
+                loaded += offset
+            return loaded
+        except Exception as e:
+            print(f"Error warming member registry: {e}")
+            return loaded
+
+    async def checkpointSessions(self, guildId: int, memberIds: List[int], until: Optional[datetime] = None) -> Optional[List[Dict]]:
+        """Credit the time the given members' open sessions in the guild have run since their last checkpoint"""
+        if not memberIds:
+            return []
+        try:
+            params = {'recievedguildid': guildId, 'memberids': memberIds}
+            if until is not None:
+                params['until'] = until.isoformat()
+            result = await self._execute(self.supabase.rpc('checkpoint_sessions', params))
+            return result.data or []
+        except Exception as e:
+            print(f"Error checkpointing sessions in guild {guildId}: {e}")
+            return None
+
+    async def importSessions(self, rows: List[Dict]) -> Optional[int]:
+        """Bulk-insert closed legacy sessions and credit them in one request (see sql/import_sessions.sql)"""
+        if not rows:
+            return 0
+        try:
+            sessions = [{**row, 'arrivalTime': row['arrivalTime'].isoformat(), 'leavingTime': row['leavingTime'].isoformat()}
+                        for row in rows]
+            # Sessions already imported are skipped by eventId, so a retried chunk is not counted twice
+            result = await self._execute(self.supabase.rpc('import_sessions', {'sessions': sessions}), idempotent=True)
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error importing {len(rows)} sessions: {e}")
+            return None
+
+    async def getOpenSessions(self, pageSize: int = 1000) -> Optional[List[Dict]]:
+        """Fetch every TimeLog session that has no leaving time yet"""
+        sessions = []
+        try:
+            while True:
+                result = await self._execute(self.supabase.table("TimeLog")\
+                    .select("id, memberId, guildId, arrivalTime")\
+                    .is_("leavingTime", "null")\
+                    .order("id")\
+                    .range(len(sessions), len(sessions) + pageSize - 1))
+                sessions.extend(result.data)
+                if len(result.data) < pageSize:
+                    return sessions
+        except Exception as e:
+            print(f"Error fetching open sessions: {e}")
+            return None
+
+    async def closeStaleSessions(self, sessionIds: List[int]) -> int:
+        """Close sessions whose member left while the bot was offline, crediting no time past their last checkpoint"""
+        try:
+            result = await self._execute(self.supabase.rpc('close_stale_sessions', {'session_ids': sessionIds}))
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error closing {len(sessionIds)} stale sessions: {e}")
+            return 0
+
+    async def getMemberStats(self, memberId: int, windowDays: int = 7) -> Optional[Dict]:
+        """Fetch a member's all-time total, per-guild MemberStats rollups and recent daily buckets in one request"""
+        since = (datetime.now(timezone.utc) - timedelta(days=windowDays)).replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            result = await self._execute(self.supabase.table("Members")\
+                .select("gameTime, MemberStats(guildId, totalTime, sessionCount, longestSession, lastSession, lastSeen), TimeBuckets(seconds)")\
+                .eq("memberId", memberId)\
+                .eq("TimeBuckets.granularity", "day")\
+                .gte("TimeBuckets.bucketStart", since.isoformat()))
+            if not result.data:
+                return {"gameTime": 0.0, "guilds": {}, "recent": 0.0}
+            row = result.data[0]
+            return {
+                "gameTime": float(row["gameTime"] or 0.0),
+                "guilds": {stats["guildId"]: stats for stats in row["MemberStats"] or []},
+                "recent": sum(float(bucket["seconds"]) for bucket in row.get("TimeBuckets") or []),
+            }
+        except Exception as e:
+            print(f"Error fetching stats for member {memberId}: {e}")
+            return None
+
+    async def getWindowTotals(self, guildId: int, since: datetime, granularity: str = "day",
+                              limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Sum TimeBuckets per member for a guild since a point in time, highest first.
+        Summed on the server (sql/time_buckets.sql), so one row per member comes back instead of every bucket"""
+        try:
+            params = {'recievedguildid': guildId, 'grain': granularity, 'since': since.isoformat()}
+            if limit is not None:
+                params['maxrows'] = limit
+            result = await self._execute(self.supabase.rpc('window_totals', params))
+            return [{"memberId": row["memberId"], "name": row["name"], "gameTime": float(row["gameTime"])}
+                    for row in result.data or []]
+        except Exception as e:
+            print(f"Error fetching windowed totals for guild {guildId}: {e}")
+            return None
+
+    async def rebuildTimeBuckets(self, since: datetime) -> Optional[int]:
+        """Re-derive every time bucket from since onwards from TimeLog; returns sessions folded"""
+        try:
+            result = await self._execute(self.supabase.rpc('rebuild_time_buckets', {'since': since.isoformat()}))
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error rebuilding time buckets since {since}: {e}")
+            return None
@@ -0,0 +1,32 @@
+# rebuild_buckets.py - Compaction job for the TimeBuckets rollup table
+"""
+Re-derives the hourly and daily TimeBuckets from closed TimeLog sessions.
+Run it after restoring TimeLog data or changing the bucket logic:
+
+    python rebuild_buckets.py --days 30
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from storage import createDatabase
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild TimeBuckets from TimeLog")
+    parser.add_argument("--days", type=int, default=30, help="How many days back to rebuild")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = createDatabase(os.getenv('DB_BACKEND', 'supabase'), url=os.getenv('DATABASE_URL'),
+                        key=os.getenv('DATABASE_KEY'), path=os.getenv('SQLITE_PATH', 'gamingNotif.db'))
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+
+    folded = await db.rebuildTimeBuckets(since)
+    db.close()
+    if folded is None:
+        raise SystemExit(1)
+    print(f"Rebuilt time buckets since {since:%Y-%m-%d} from {folded} sessions")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,221 @@
+# resilience.py
+import asyncio
+import contextlib
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+from metrics import metrics
+
+# Monotonic time by which the database calls of the event being handled must finish,
+# and the task handling it: tasks it spawns inherit the budget only while it runs
+_deadline: ContextVar[Optional[Tuple[float, asyncio.Task]]] = ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    """The event's time budget ran out before the database call finished"""
+
+class OutcomeUnknown(DeadlineExceeded):
+    """The budget ran out while a write that is unsafe to resend was in flight; it keeps
+    running and may still commit, so the caller must not send it again"""
+
+class CircuitOpen(Exception):
+    """The circuit breaker is failing calls fast"""
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]):
+    """Share a budget of seconds between every database call made inside the block.
+    Nested budgets never extend an outer one; None leaves the current budget as is.
+    Work the block leaves running (a debounced leave, a notification) is not held to it."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = remaining()
+    if outer is not None:
+        at = min(at, time.monotonic() + outer)
+    token = _deadline.set((at, asyncio.current_task()))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+@contextlib.contextmanager
+def no_deadline():
+    """Run the block outside the current budget: for shared work, such as draining the
+    event journal, that one event should neither pay for nor cut short"""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None outside one"""
+    current = _deadline.get()
+    if current is None or current[1].done():
+        return None
+    return current[0] - time.monotonic()
+
+class CircuitBreaker:
+    """Stops sending calls to a backend that is failing or too slow.
+
+    closed: calls go through and their outcomes over the last window seconds are
+    kept; once at least min_calls were made and failure_rate of them failed or
+    took longer than slow_call_seconds, the breaker opens.
+    open: calls raise CircuitOpen for open_seconds, then the breaker half-opens.
+    half_open: probe_calls calls go through; if all succeed in time it closes,
+    the first failure opens it again."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str = "db", failure_rate: float = 0.5, slow_call_seconds: float = 2.0,
+                 min_calls: int = 10, window: float = 30.0, open_seconds: float = 15.0, probe_calls: int = 3):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.probe_calls = probe_calls
+
+        self.state = self.CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (finished at, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        metrics.gauge("circuit_state", lambda: ("closed", "half_open", "open").index(self.state), circuit=name)
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go through now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                metrics.inc("circuit_rejected", circuit=self.name)
+                raise CircuitOpen(f"circuit {self.name} is open")
+            self._transition(self.HALF_OPEN, f"probing after {self.open_seconds:g}s")
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.probe_calls:
+                metrics.inc("circuit_rejected", circuit=self.name)
+                raise CircuitOpen(f"circuit {self.name} is half open")
+            self._probes += 1
+
+    def release(self):
+        """Give back a probe slot taken by a call that was cancelled"""
+        if self.state == self.HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record(self, ok: bool, elapsed: float):
+        failed = not ok or elapsed > self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            if failed:
+                self._open("probe failed" if not ok else f"probe took {elapsed:.1f}s")
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.probe_calls:
+                    self._transition(self.CLOSED, f"{self.probe_calls} probes succeeded")
+            return
+        if self.state == self.OPEN:
+            return  # A call started before the breaker opened
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._failures -= self._outcomes.popleft()[1]
+
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(f"{self._failures}/{calls} calls failed or were slow in the last {self.window:g}s")
+
+    def _open(self, reason: str):
+        self._opened_at = time.monotonic()
+        self._transition(self.OPEN, reason)
+
+    def _transition(self, state: str, reason: str):
+        print(f"Circuit {self.name}: {self.state} -> {state} ({reason})")
+        metrics.inc("circuit_transitions", circuit=self.name, to=state)
+        self.state = state
+        self._outcomes.clear()
+        self._failures = 0
+        self._probes = 0
+        self._probe_successes = 0
+
+class CallGuard:
+    """Runs backend calls under the current deadline and a circuit breaker,
+    retrying idempotent ones with jittered exponential backoff"""
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, retries: int = 2,
+                 retry_base: float = 0.1, retry_cap: float = 2.0):
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+
+    async def run(self, call: Callable[[], Awaitable], idempotent: bool = False):
+        """Await call(); only idempotent calls (upserts) are ever sent twice.
+
+        The deadline cannot stop a query already handed to a worker thread. An idempotent
+        call cut short raises DeadlineExceeded and may be resent by the caller. Any other
+        call is shielded and left to finish in the background: it raises OutcomeUnknown,
+        because the write may still commit, and its real outcome goes to the breaker."""
+        attempt = 0
+        while True:
+            budget = remaining()
+            if budget is not None and budget <= 0:
+                metrics.inc("deadline_exceeded", circuit=self.breaker.name)
+                raise DeadlineExceeded("event budget spent")
+            self.breaker.allow()
+
+            started = time.monotonic()
+            in_flight: Optional[asyncio.Future] = None
+            try:
+                if budget is None:
+                    result = await call()
+                elif idempotent:
+                    result = await asyncio.wait_for(call(), budget)
+                else:
+                    in_flight = asyncio.ensure_future(call())
+                    result = await asyncio.wait_for(asyncio.shield(in_flight), budget)
+            except asyncio.CancelledError:
+                if in_flight is not None and not in_flight.done():
+                    self._settle(in_flight, started)
+                else:
+                    self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                metrics.inc("deadline_exceeded", circuit=self.breaker.name)
+                if in_flight is not None:
+                    self._settle(in_flight, started)
+                    metrics.inc("db_outcome_unknown", circuit=self.breaker.name)
+                    raise OutcomeUnknown(f"event budget spent after {time.monotonic() - started:.2f}s; "
+                                         f"the write is still running")
+                # Cut short by the caller's budget: a failure for the breaker only if it was already slow
+                self.breaker.record(True, time.monotonic() - started)
+                raise DeadlineExceeded(f"event budget spent after {time.monotonic() - started:.2f}s")
+            except Exception:
+                self.breaker.record(False, time.monotonic() - started)
+                if not idempotent or attempt >= self.retries:
+                    raise
+                # Full jitter keeps the retries of many handlers from arriving together
+                delay = random.uniform(0, min(self.retry_cap, self.retry_base * 2 ** attempt))
+                budget = remaining()
+                if budget is not None and delay >= budget:
+                    raise
+                attempt += 1
+                metrics.inc("db_retries", circuit=self.breaker.name)
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record(True, time.monotonic() - started)
+            return result
+
+    def _settle(self, in_flight: asyncio.Future, started: float):
+        """Record the outcome of a call the caller stopped waiting for once it finishes"""
+        def done(future: asyncio.Future):
+            error = None if future.cancelled() else future.exception()
+            self.breaker.record(error is None and not future.cancelled(), time.monotonic() - started)
+            if error is not None:
+                print(f"Database write abandoned by its caller failed: {error}")
+
+        in_flight.add_done_callback(done)
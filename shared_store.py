@@ -0,0 +1,144 @@
+# shared_store.py
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+class SharedStore(ABC):
+    """Small key/value store for state that every bot process must agree on
+    (notification cooldowns, DM index versions, metrics snapshots)"""
+
+    def close(self):
+        """Release connections and worker threads"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str): ...
+
+    @abstractmethod
+    async def delete(self, key: str): ...
+
+    @abstractmethod
+    async def incr(self, key: str) -> int:
+        """Atomically add one to an integer key (missing counts as 0) and return the new value"""
+
+    @abstractmethod
+    async def claim(self, key: str, ttl: float) -> bool:
+        """Atomically take key for ttl seconds; False if another holder's claim has not expired"""
+
+    @abstractmethod
+    async def scan(self, prefix: str) -> Dict[str, str]: ...
+
+class MemoryStore(SharedStore):
+    """Single-process store (the default when running one bot process)"""
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.expiry: Dict[str, float] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str):
+        self.values[key] = value
+
+    async def delete(self, key: str):
+        self.values.pop(key, None)
+        self.expiry.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self.values.get(key, 0)) + 1
+        self.values[key] = str(value)
+        return value
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        if self.expiry.get(key, 0.0) > now:
+            return False
+        self.expiry[key] = now + ttl
+        return True
+
+    async def scan(self, prefix: str) -> Dict[str, str]:
+        return {k: v for k, v in self.values.items() if k.startswith(prefix)}
+
+class SqliteStore(SharedStore):
+    """Store in a local SQLite file (WAL mode), shared by every process on the machine"""
+
+    def __init__(self, path: str = "cluster_state.db"):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-store")
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("pragma journal_mode=WAL")
+        self.conn.execute("pragma synchronous=NORMAL")
+        self.conn.execute("create table if not exists kv (key text primary key, value text, expires real)")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    def _transaction(self, fn, *args):
+        # begin immediate takes the write lock up front, so read-modify-write is atomic across processes
+        self.conn.execute("begin immediate")
+        try:
+            result = fn(*args)
+            self.conn.execute("commit")
+            return result
+        except Exception:
+            self.conn.execute("rollback")
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.conn.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        row = await self._run(lambda: self.conn.execute("select value from kv where key = ?", (key,)).fetchone())
+        return row[0] if row else None
+
+    async def set(self, key: str, value: str):
+        await self._run(lambda: self.conn.execute(
+            "insert into kv (key, value) values (?, ?) on conflict (key) do update set value = excluded.value",
+            (key, value)))
+
+    async def delete(self, key: str):
+        await self._run(lambda: self.conn.execute("delete from kv where key = ?", (key,)))
+
+    def _incr(self, key: str) -> int:
+        self.conn.execute(
+            "insert into kv (key, value) values (?, '1') "
+            "on conflict (key) do update set value = cast(value as integer) + 1", (key,))
+        return int(self.conn.execute("select value from kv where key = ?", (key,)).fetchone()[0])
+
+    async def incr(self, key: str) -> int:
+        return await self._run(self._transaction, self._incr, key)
+
+    def _claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        row = self.conn.execute("select expires from kv where key = ?", (key,)).fetchone()
+        if row and row[0] is not None and row[0] > now:
+            return False
+        self.conn.execute(
+            "insert into kv (key, value, expires) values (?, ?, ?) "
+            "on conflict (key) do update set value = excluded.value, expires = excluded.expires",
+            (key, str(now), now + ttl))
+        return True
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        return await self._run(self._transaction, self._claim, key, ttl)
+
+    async def scan(self, prefix: str) -> Dict[str, str]:
+        rows = await self._run(lambda: self.conn.execute(
+            "select key, value from kv where key >= ? and key < ?", (prefix, prefix + "\uffff")).fetchall())
+        return dict(rows)
+
+def createStore(url: str = "memory") -> SharedStore:
+    """Build the configured shared store ("memory" or "sqlite:<path>")"""
+    if url == "memory":
+        return MemoryStore()
+    if url.startswith("sqlite:"):
+        return SqliteStore(url[len("sqlite:"):] or "cluster_state.db")
+    raise ValueError(f"Unknown shared store: {url}")
@@ -0,0 +1,89 @@
+-- close_session(BIGINT, BIGINT, TIMESTAMPTZ)
+-- Closes the member's most recent open TimeLog session that started before the
+-- leaving time (default now()), credits the part checkpoint_sessions has not
+-- (from creditedUntil) to Members.gameTime, folds it into the member's
+-- MemberStats row for the guild and its hourly/daily TimeBuckets, and returns
+-- the result in a single round trip. A leave that arrives after a checkpoint
+-- already ran past it (debounced or replayed) takes the excess back out.
+-- The row lock and in-place increments keep overlapping leaves from losing time.
+-- Leaves replayed from the event journal pass their original timestamp and
+-- their event id, which is stored on the closed row (see close_sessions.sql).
+-- Returns: JSON {"duration", "credited", "gameTime", "arrivalTime", "leavingTime"}
+alter table "TimeLog" add column if not exists "leaveEventId" text;
+create unique index if not exists "TimeLog_leaveEventId_key" on "TimeLog" ("leaveEventId");
+
+drop function if exists close_session(bigint);
+drop function if exists close_session(bigint, bigint);
+drop function if exists close_session(bigint, bigint, timestamptz);
+
+create or replace function close_session(
+    recievedmemberid bigint,
+    recievedguildid bigint default null,
+    recievedleavingtime timestamptz default null,
+    leaveeventid text default null
+)
+returns json
+language plpgsql
+as $$
+declare
+    session_id bigint;
+    session_arrival timestamptz;
+    session_leaving timestamptz;
+    session_credited timestamptz;
+    session_duration numeric := 0;
+    remainder numeric := 0;
+    new_total numeric;
+begin
+    select id, coalesce("creditedUntil", "arrivalTime") into session_id, session_credited
+    from "TimeLog"
+    where "memberId" = recievedmemberid and "leavingTime" is null
+      and "arrivalTime" <= coalesce(recievedleavingtime, now())
+    order by "arrivalTime" desc
+    limit 1
+    for update;
+
+    if session_id is null then
+        return json_build_object('duration', 0, 'credited', 0, 'gameTime', null);
+    end if;
+
+    update "TimeLog"
+    set "leavingTime" = coalesce(recievedleavingtime, now()), "leaveEventId" = leaveeventid
+    where id = session_id
+    returning "arrivalTime", "leavingTime", extract(epoch from ("leavingTime" - "arrivalTime"))
+    into session_arrival, session_leaving, session_duration;
+
+    remainder := extract(epoch from (session_leaving - session_credited));
+
+    update "Members"
+    set "gameTime" = coalesce("gameTime", 0) + remainder
+    where "memberId" = recievedmemberid
+    returning "gameTime" into new_total;
+
+    if recievedguildid is not null then
+        if remainder >= 0 then
+            perform add_session_to_buckets(recievedmemberid, recievedguildid, session_credited, session_leaving);
+        else
+            perform add_session_to_buckets(recievedmemberid, recievedguildid, session_leaving, session_credited, -1);
+        end if;
+
+        insert into "MemberStats" as s
+            ("memberId", "guildId", "totalTime", "sessionCount", "longestSession", "lastSession", "lastSeen")
+        values
+            (recievedmemberid, recievedguildid, remainder, 1, session_duration, session_duration, session_leaving)
+        on conflict ("memberId", "guildId") do update set
+            "totalTime" = s."totalTime" + excluded."totalTime",
+            "sessionCount" = s."sessionCount" + 1,
+            "longestSession" = greatest(s."longestSession", excluded."longestSession"),
+            "lastSession" = excluded."lastSession",
+            "lastSeen" = excluded."lastSeen";
+    end if;
+
+    return json_build_object(
+        'duration', session_duration,
+        'credited', remainder,
+        'gameTime', new_total,
+        'arrivalTime', session_arrival,
+        'leavingTime', session_leaving
+    );
+end;
+$$;
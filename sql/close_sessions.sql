@@ -0,0 +1,31 @@
+-- close_sessions(JSON)
+-- Applies a batch of leaves replayed from the event journal in one round trip.
+-- Each leave closes its member's session through close_session, which records
+-- the leave's event id on the closed row. Leaves whose id is already recorded
+-- are skipped, so replaying a batch twice never closes an older session that
+-- the first attempt did not touch.
+-- Run after close_session.sql.
+-- Input: JSON [{"memberId", "guildId", "at", "eventId"}]
+-- Returns: JSON {"<eventId>": {"duration", "credited", "gameTime", "arrivalTime", "leavingTime"}}
+--          for the leaves applied by this call
+create or replace function close_sessions(leaves json)
+returns json
+language plpgsql
+as $$
+declare
+    leave record;
+    closed jsonb := '{}'::jsonb;
+begin
+    for leave in
+        select l."memberId", l."guildId", l."at", l."eventId"
+        from json_to_recordset(leaves) as l("memberId" bigint, "guildId" bigint, "at" timestamptz, "eventId" text)
+        where not exists (select 1 from "TimeLog" t where t."leaveEventId" = l."eventId")
+    loop
+        closed := closed || jsonb_build_object(
+            leave."eventId",
+            close_session(leave."memberId", leave."guildId", leave."at", leave."eventId")::jsonb
+        );
+    end loop;
+    return closed::json;
+end;
+$$;
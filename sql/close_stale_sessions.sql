@@ -0,0 +1,18 @@
+-- close_stale_sessions(BIGINT[])
+-- Closes sessions left open while the bot was offline. The real leave time is
+-- unknown, so each session is closed where its last checkpoint left it (its
+-- arrival time if it had none): time already credited is kept, and no hours
+-- nobody played are invented.
+-- Returns: INTEGER (number of sessions closed)
+create or replace function close_stale_sessions(session_ids bigint[])
+returns integer
+language sql
+as $$
+    with closed as (
+        update "TimeLog"
+        set "leavingTime" = coalesce("creditedUntil", "arrivalTime")
+        where id = any(session_ids) and "leavingTime" is null
+        returning id
+    )
+    select count(*)::integer from closed;
+$$;
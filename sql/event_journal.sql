@@ -0,0 +1,7 @@
+-- TimeLog.eventId
+-- Id of the journal event that opened the session. Replayed arrivals are
+-- upserted on it with ignore-duplicates, so draining the local event journal
+-- more than once never opens a session twice.
+alter table "TimeLog" add column if not exists "eventId" text;
+
+create unique index if not exists "TimeLog_eventId_key" on "TimeLog" ("eventId");
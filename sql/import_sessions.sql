@@ -0,0 +1,54 @@
+-- import_sessions(JSON)
+-- Bulk-inserts closed sessions recovered from the legacy JSON files
+-- (python import_legacy.py) and credits them to Members.gameTime and the
+-- guild's MemberStats rollup. Sessions whose eventId is already in TimeLog
+-- are skipped, so a resumed import never counts a chunk twice. Their time is
+-- not split into TimeBuckets: the legacy files never recorded when it was spent.
+-- Run after session_checkpoints.sql and member_stats.sql.
+-- Input: JSON [{"memberId", "guildId", "arrivalTime", "leavingTime", "eventId"}]
+-- Returns: INTEGER (number of sessions imported)
+create or replace function import_sessions(sessions json)
+returns integer
+language plpgsql
+as $$
+declare
+    member_ids bigint[];
+    guild_ids bigint[];
+    leavings timestamptz[];
+    durations numeric[];
+begin
+    with inserted as (
+        insert into "TimeLog" ("memberId", "guildId", "arrivalTime", "leavingTime", "creditedUntil", "eventId")
+        select s."memberId", s."guildId", s."arrivalTime", s."leavingTime", s."leavingTime", s."eventId"
+        from json_to_recordset(sessions) as s("memberId" bigint, "guildId" bigint, "arrivalTime" timestamptz,
+                                               "leavingTime" timestamptz, "eventId" text)
+        on conflict ("eventId") do nothing
+        returning "memberId", "guildId", "leavingTime", extract(epoch from ("leavingTime" - "arrivalTime")) as seconds
+    )
+    select array_agg("memberId"), array_agg("guildId"), array_agg("leavingTime"), array_agg(seconds)
+    into member_ids, guild_ids, leavings, durations
+    from inserted;
+
+    if member_ids is null then
+        return 0;
+    end if;
+
+    update "Members" m set "gameTime" = coalesce(m."gameTime", 0) + i.seconds
+    from (select "memberId", sum(seconds) as seconds
+          from unnest(member_ids, durations) as s("memberId", seconds) group by "memberId") i
+    where m."memberId" = i."memberId";
+
+    insert into "MemberStats" as s ("memberId", "guildId", "totalTime", "sessionCount", "longestSession", "lastSession", "lastSeen")
+    select "memberId", "guildId", sum(seconds), count(*), max(seconds), max(seconds), max("leavingTime")
+    from unnest(member_ids, guild_ids, leavings, durations) as i("memberId", "guildId", "leavingTime", seconds)
+    group by "memberId", "guildId"
+    on conflict ("memberId", "guildId") do update set
+        "totalTime" = s."totalTime" + excluded."totalTime",
+        "sessionCount" = s."sessionCount" + excluded."sessionCount",
+        "longestSession" = greatest(s."longestSession", excluded."longestSession"),
+        "lastSession" = coalesce(s."lastSession", excluded."lastSession"),
+        "lastSeen" = greatest(s."lastSeen", excluded."lastSeen");
+
+    return array_length(member_ids, 1);
+end;
+$$;
@@ -0,0 +1,15 @@
+-- MemberStats
+-- Per-member, per-guild session rollups maintained by close_session, so
+-- !stats never has to scan TimeLog.
+create table if not exists "MemberStats" (
+    "memberId" bigint not null references "Members"("memberId"),
+    "guildId" bigint not null,
+    "totalTime" numeric not null default 0,
+    "sessionCount" integer not null default 0,
+    "longestSession" numeric not null default 0,
+    "lastSession" numeric,
+    "lastSeen" timestamptz,
+    primary key ("memberId", "guildId")
+);
+
+create index if not exists "MemberStats_guildId_idx" on "MemberStats" ("guildId");
@@ -0,0 +1,75 @@
+-- TimeLog.creditedUntil / checkpoint_sessions(BIGINT, BIGINT[], TIMESTAMPTZ)
+-- The bot periodically credits the time of sessions that are still open, one
+-- call per guild, so totals include people who are in voice right now and a
+-- crash loses at most one interval. creditedUntil records how far a session
+-- has been credited; close_session then only adds the remainder.
+-- Run after time_buckets.sql and member_stats.sql.
+-- Returns: JSON [{"memberId", "gameTime"}] for the members credited
+alter table "TimeLog" add column if not exists "creditedUntil" timestamptz;
+
+create or replace function checkpoint_sessions(
+    recievedguildid bigint,
+    memberids bigint[],
+    until timestamptz default null
+)
+returns json
+language plpgsql
+as $$
+declare
+    upto timestamptz := coalesce(until, now());
+    member_ids bigint[];
+    sinces timestamptz[];
+    totals json;
+begin
+    -- One statement, no temporary table: for update waits for a concurrent
+    -- close_session and re-checks the row, so a session it closed is skipped.
+    -- Only each member's newest open session is credited, the one close_session
+    -- closes; older ones are stale and would count the same time twice.
+    with newest as (
+        select distinct on ("memberId") id
+        from "TimeLog"
+        where "guildId" = recievedguildid and "leavingTime" is null
+          and "memberId" = any(memberids)
+        order by "memberId", "arrivalTime" desc, id desc
+    ), checkpointed as (
+        select t.id, t."memberId", coalesce(t."creditedUntil", t."arrivalTime") as since
+        from "TimeLog" t
+        join newest n on n.id = t.id
+        where t."leavingTime" is null
+          and coalesce(t."creditedUntil", t."arrivalTime") < upto
+        for update of t
+    ), moved as (
+        update "TimeLog" t set "creditedUntil" = upto
+        from checkpointed c where t.id = c.id
+        returning c."memberId", c.since
+    )
+    select array_agg("memberId"), array_agg(since) into member_ids, sinces from moved;
+
+    if member_ids is null then
+        return '[]'::json;
+    end if;
+
+    update "Members" m set "gameTime" = coalesce(m."gameTime", 0) + c.seconds
+    from (select "memberId", sum(extract(epoch from (upto - since))) as seconds
+          from unnest(member_ids, sinces) as s("memberId", since) group by "memberId") c
+    where m."memberId" = c."memberId";
+
+    -- The session itself is counted (sessionCount, longestSession) when it closes
+    insert into "MemberStats" as s ("memberId", "guildId", "totalTime", "sessionCount", "longestSession", "lastSeen")
+    select "memberId", recievedguildid, sum(extract(epoch from (upto - since))), 0, 0, upto
+    from unnest(member_ids, sinces) as c("memberId", since) group by "memberId"
+    on conflict ("memberId", "guildId") do update set
+        "totalTime" = s."totalTime" + excluded."totalTime",
+        "lastSeen" = excluded."lastSeen";
+
+    perform add_session_to_buckets(c."memberId", recievedguildid, c.since, upto)
+    from unnest(member_ids, sinces) as c("memberId", since);
+
+    select coalesce(json_agg(json_build_object('memberId', m."memberId", 'gameTime', m."gameTime")), '[]'::json)
+    into totals
+    from "Members" m
+    where m."memberId" = any(member_ids);
+
+    return totals;
+end;
+$$;
@@ -0,0 +1,104 @@
+-- TimeBuckets
+-- Hourly and daily seconds-in-voice per member and guild, folded in by
+-- close_session, so time-windowed leaderboards and stats read a few bucket
+-- rows instead of scanning TimeLog.
+alter table "TimeLog" add column if not exists "guildId" bigint;
+
+create table if not exists "TimeBuckets" (
+    "memberId" bigint not null references "Members"("memberId"),
+    "guildId" bigint not null,
+    "granularity" text not null check ("granularity" in ('hour', 'day')),
+    "bucketStart" timestamptz not null,
+    "seconds" numeric not null default 0,
+    primary key ("memberId", "guildId", "granularity", "bucketStart")
+);
+
+create index if not exists "TimeBuckets_guild_window_idx"
+    on "TimeBuckets" ("guildId", "granularity", "bucketStart");
+
+-- add_session_to_buckets(BIGINT, BIGINT, TIMESTAMPTZ, TIMESTAMPTZ, INTEGER)
+-- Splits one session (or checkpointed stretch of one) across every hour and
+-- day bucket it touches and adds each share to the running totals; sign -1
+-- takes a stretch back out.
+drop function if exists add_session_to_buckets(bigint, bigint, timestamptz, timestamptz);
+
+create or replace function add_session_to_buckets(
+    recievedmemberid bigint, recievedguildid bigint, arrival timestamptz, leaving timestamptz,
+    sign integer default 1
+)
+returns void
+language sql
+as $$
+    insert into "TimeBuckets" as b ("memberId", "guildId", "granularity", "bucketStart", "seconds")
+    select recievedmemberid, recievedguildid, grains.granularity, bucket,
+           sign * extract(epoch from (least(leaving, bucket + grains.step) - greatest(arrival, bucket)))
+    from (values ('hour', interval '1 hour'), ('day', interval '1 day')) as grains(granularity, step),
+         lateral generate_series(date_trunc(grains.granularity, arrival), leaving, grains.step) as bucket
+    where leaving > arrival and bucket < leaving
+    on conflict ("memberId", "guildId", "granularity", "bucketStart")
+    do update set "seconds" = b."seconds" + excluded."seconds";
+$$;
+
+-- rebuild_time_buckets(TIMESTAMPTZ)
+-- Compaction job: drops every bucket from the start of since's day onwards
+-- and re-derives them from TimeLog: closed sessions in full, open ones up to
+-- their last checkpoint (creditedUntil). Sessions imported from the legacy
+-- files (eventId 'legacy:...') are left out. Live session closes wait
+-- on the table lock, so nothing is counted twice or lost while it runs.
+-- Returns: INTEGER (number of sessions folded)
+create or replace function rebuild_time_buckets(since timestamptz)
+returns integer
+language plpgsql
+as $$
+declare
+    window_start timestamptz := date_trunc('day', since);
+    session record;
+    folded integer := 0;
+begin
+    lock table "TimeBuckets" in share row exclusive mode;
+
+    delete from "TimeBuckets" where "bucketStart" >= window_start;
+
+    for session in
+        select "memberId", "guildId", "arrivalTime", coalesce("leavingTime", "creditedUntil") as "endTime"
+        from "TimeLog"
+        where "guildId" is not null
+          and coalesce("leavingTime", "creditedUntil") > window_start
+          -- Imported legacy totals say nothing about when the time was spent (import_sessions.sql)
+          and ("eventId" is null or "eventId" not like 'legacy:%')
+    loop
+        perform add_session_to_buckets(
+            session."memberId", session."guildId",
+            greatest(session."arrivalTime", window_start), session."endTime"
+        );
+        folded := folded + 1;
+    end loop;
+
+    return folded;
+end;
+$$;
+
+-- window_totals(BIGINT, TEXT, TIMESTAMPTZ, INTEGER)
+-- Sums a guild's buckets of one granularity per member since a point in
+-- time on the server, so a windowed leaderboard fetches one row per member
+-- (at most maxrows) instead of paging through every bucket.
+-- Returns: JSON [{"memberId", "name", "gameTime"}], highest first
+create or replace function window_totals(
+    recievedguildid bigint, grain text, since timestamptz, maxrows integer default null
+)
+returns json
+language sql
+stable
+as $$
+    select coalesce(json_agg(json_build_object('memberId', t."memberId", 'name', t.name, 'gameTime', t.seconds)
+                             order by t.seconds desc), '[]'::json)
+    from (
+        select b."memberId", coalesce(m.name, b."memberId"::text) as name, sum(b.seconds) as seconds
+        from "TimeBuckets" b
+        left join "Members" m on m."memberId" = b."memberId"
+        where b."guildId" = recievedguildid and b.granularity = grain and b."bucketStart" >= since
+        group by b."memberId", m.name
+        order by seconds desc
+        limit maxrows
+    ) t;
+$$;
@@ -0,0 +1,611 @@
+# sqlite_queries.py
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from cache import MemberRegistry
+from storage import StorageBackend
+from resilience import CallGuard
+from metrics import metrics
+
+SCHEMA = """
+create table if not exists Members (
+    memberId integer primary key,
+    name text,
+    gameTime real
+);
+create table if not exists Guild (
+    guildId integer primary key,
+    guildName text,
+    Cooldown real
+);
+create table if not exists MembersGuild (
+    memberId integer not null references Members(memberId),
+    guildId integer not null,
+    DM integer not null default 0,
+    primary key (memberId, guildId)
+);
+create table if not exists TimeLog (
+    id integer primary key autoincrement,
+    memberId integer not null,
+    guildId integer,
+    arrivalTime text not null,
+    leavingTime text,
+    eventId text,
+    creditedUntil text,
+    leaveEventId text
+);
+create table if not exists MemberStats (
+    memberId integer not null,
+    guildId integer not null,
+    totalTime real not null default 0,
+    sessionCount integer not null default 0,
+    longestSession real not null default 0,
+    lastSession real,
+    lastSeen text,
+    primary key (memberId, guildId)
+);
+create table if not exists TimeBuckets (
+    memberId integer not null,
+    guildId integer not null,
+    granularity text not null,
+    bucketStart text not null,
+    seconds real not null default 0,
+    primary key (memberId, guildId, granularity, bucketStart)
+);
+
+create index if not exists MembersGuild_dm_idx on MembersGuild (guildId, DM);
+create index if not exists Members_gameTime_idx on Members (gameTime desc);
+create index if not exists TimeLog_member_idx on TimeLog (memberId, arrivalTime);
+create index if not exists TimeLog_open_idx on TimeLog (memberId, arrivalTime) where leavingTime is null;
+create index if not exists TimeLog_closed_idx on TimeLog (leavingTime) where leavingTime is not null;
+create index if not exists MemberStats_guild_idx on MemberStats (guildId);
+create index if not exists TimeBuckets_window_idx on TimeBuckets (guildId, granularity, bucketStart);
+"""
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+def _timestamp(value=None) -> str:
+    """Fixed-width UTC ISO timestamp, so text comparison orders correctly"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+def _truncate(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+def split_session(arrival: datetime, leaving: datetime, granularity: str):
+    """Yield (bucketStart, seconds) for every bucket the session overlaps"""
+    step = GRANULARITIES[granularity]
+    bucket = _truncate(arrival, granularity)
+    while bucket < leaving:
+        overlap = (min(leaving, bucket + step) - max(arrival, bucket)).total_seconds()
+        if overlap > 0:
+            yield bucket, overlap
+        bucket += step
+
+class SqliteQueries(StorageBackend):
+    """Embedded SQLite storage backend (WAL mode) for single-node deployments and offline testing"""
+
+    def __init__(self, path: str = "gamingNotif.db", registry: Optional[MemberRegistry] = None,
+                 guard: Optional[CallGuard] = None):
+        super().__init__(registry, guard)
+        self.path = path
+        # One thread owns the connection, which serialises every statement
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("pragma journal_mode=WAL")
+        self.conn.execute("pragma synchronous=NORMAL")
+        self.conn.execute("pragma foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Bring databases created by older versions up to the current schema"""
+        columns = {row["name"] for row in self.conn.execute("pragma table_info(TimeLog)")}
+        if "eventId" not in columns:
+            self.conn.execute("alter table TimeLog add column eventId text")
+        # How far an open session's time has already been credited by checkpoints
+        if "creditedUntil" not in columns:
+            self.conn.execute("alter table TimeLog add column creditedUntil text")
+        # Id of the journaled leave that closed the session
+        if "leaveEventId" not in columns:
+            self.conn.execute("alter table TimeLog add column leaveEventId text")
+        # Journal event ids make replayed arrivals and leaves idempotent
+        self.conn.execute("create unique index if not exists TimeLog_event_idx on TimeLog (eventId)")
+        self.conn.execute("create unique index if not exists TimeLog_leave_event_idx on TimeLog (leaveEventId)")
+
+    async def _run(self, fn, *args, idempotent: bool = False):
+        """Run a blocking function against the connection off the event loop.
+        Only idempotent statements (upserts) are retried after a failure."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await self.guard.run(lambda: loop.run_in_executor(self.executor, fn, *args), idempotent)
+        except Exception:
+            # Callers log and swallow the error; count it against the operation being timed
+            metrics.error()
+            raise
+
+    def _transaction(self, fn, *args):
+        self.conn.execute("begin immediate")
+        try:
+            result = fn(*args)
+            self.conn.execute("commit")
+            return result
+        except Exception:
+            self.conn.execute("rollback")
+            raise
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.conn.close()
+
+    # Members and guild links
+
+    async def existsMember(self, member) -> bool:
+        if self.registry.has_member(member.id):
+            return True
+        try:
+            rows = await self._run(self._query, "select 1 from Members where memberId = ?", (member.id,))
+            return len(rows) > 0
+        except Exception as e:
+            print(f"Error fetching member {member.name}: {e}")
+            return False
+
+    async def newMember(self, member) -> bool:
+        return await self.upsertMembers([{"memberId": member.id, "name": member.name}])
+
+    async def newMemberToGuild(self, member, guild) -> bool:
+        return await self.upsertMembersGuild([{"memberId": member.id, "guildId": guild.id}])
+
+    async def existsMembersGuild(self, member, guild) -> bool:
+        if self.registry.is_linked(member.id, guild.id):
+            return True
+        try:
+            rows = await self._run(self._query, "select 1 from MembersGuild where memberId = ? and guildId = ?", (member.id, guild.id))
+            if rows:
+                self.registry.remember_link(member.id, guild.id)
+            return len(rows) > 0
+        except Exception as e:
+            print(f"Error fetching member {member.id} in guild {guild.id}: {e}")
+            return False
+
+    def _upsert_members(self, rows: List[Dict]):
+        self.conn.executemany(
+            "insert into Members (memberId, name) values (?, ?) "
+            "on conflict (memberId) do update set name = excluded.name",
+            [(row["memberId"], row["name"]) for row in rows])
+
+    async def upsertMembers(self, rows: List[Dict]) -> bool:
+        rows = [row for row in rows if not self.registry.is_known_member(row["memberId"], row["name"])]
+        if not rows:
+            return True
+        try:
+            await self._run(self._transaction, self._upsert_members, rows, idempotent=True)
+            for row in rows:
+                self.registry.remember_member(row["memberId"], row["name"])
+            return True
+        except Exception as e:
+            print(f"Error bulk upserting {len(rows)} members: {e}")
+            return False
+
+    def _upsert_members_guild(self, rows: List[Dict]):
+        self.conn.executemany(
+            "insert into MembersGuild (memberId, guildId) values (?, ?) on conflict do nothing",
+            [(row["memberId"], row["guildId"]) for row in rows])
+
+    async def upsertMembersGuild(self, rows: List[Dict]) -> bool:
+        rows = [row for row in rows if not self.registry.is_linked(row["memberId"], row["guildId"])]
+        if not rows:
+            return True
+        try:
+            await self._run(self._transaction, self._upsert_members_guild, rows, idempotent=True)
+            for row in rows:
+                self.registry.remember_link(row["memberId"], row["guildId"])
+            return True
+        except Exception as e:
+            print(f"Error bulk linking {len(rows)} members to guilds: {e}")
+            return False
+
+    async def warmRegistry(self, guildIds: List[int]) -> int:
+        if not guildIds:
+            return 0
+        try:
+            placeholders = ",".join("?" * len(guildIds))
+            rows = await self._run(self._query,
+                f"select mg.memberId, mg.guildId, m.name from MembersGuild mg "
+                f"join Members m on m.memberId = mg.memberId where mg.guildId in ({placeholders})",
+                tuple(guildIds))
+            for row in rows:
+                self.registry.remember_link(row["memberId"], row["guildId"])
+                self.registry.remember_member(row["memberId"], row["name"])
+            return len(rows)
+        except Exception as e:
+            print(f"Error warming member registry: {e}")
+            return 0
+
+    # Sessions
+
+    async def logArrivalTime(self, member) -> bool:
+        return await self.insertTimeLogs([{"memberId": member.id, "guildId": member.guild.id}])
+
+    def _insert_time_logs(self, rows: List[Dict]):
+        self.conn.executemany(
+            "insert into TimeLog (memberId, guildId, arrivalTime, eventId) values (?, ?, ?, ?) "
+            "on conflict (eventId) do nothing",
+            [(row["memberId"], row.get("guildId"), _timestamp(row.get("arrivalTime")), row.get("eventId")) for row in rows])
+
+    async def insertTimeLogs(self, rows: List[Dict]) -> bool:
+        try:
+            # Rows carrying an eventId are skipped if already present, so only those are safe to resend
+            await self._run(self._transaction, self._insert_time_logs, rows,
+                            idempotent=all("eventId" in row for row in rows))
+            return True
+        except Exception as e:
+            print(f"Error bulk inserting {len(rows)} time logs: {e}")
+            return False
+
+    def _log_leave_time(self, member_id: int) -> bool:
+        rows = self._query("select id from TimeLog where memberId = ? order by arrivalTime desc limit 1", (member_id,))
+        if not rows:
+            return False
+        self.conn.execute("update TimeLog set leavingTime = ? where id = ?", (_timestamp(), rows[0]["id"]))
+        return True
+
+    async def logLeaveTime(self, member) -> bool:
+        try:
+            return await self._run(self._transaction, self._log_leave_time, member.id)
+        except Exception as e:
+            print(f"Error leaving time log {member.name}: {e}")
+            return False
+
+    def _log_game_time(self, member_id: int) -> float:
+        rows = self._query(
+            "select arrivalTime, leavingTime from TimeLog where memberId = ? and leavingTime is not null "
+            "order by arrivalTime desc limit 1", (member_id,))
+        if not rows:
+            return 0.0
+        duration = (datetime.fromisoformat(rows[0]["leavingTime"]) - datetime.fromisoformat(rows[0]["arrivalTime"])).total_seconds()
+        self.conn.execute("update Members set gameTime = coalesce(gameTime, 0) + ? where memberId = ?", (duration, member_id))
+        return duration
+
+    async def logGameTime(self, member) -> bool:
+        try:
+            duration = await self._run(self._transaction, self._log_game_time, member.id)
+            if duration > 0:
+                print(f"{member.name} played for {duration:.1f} seconds")
+            return True
+        except Exception as e:
+            print(f"Error calculating game time for {member.name}: {e}")
+            return False
+
+    def _fold_buckets(self, member_id: int, guild_id: int, arrival: datetime, leaving: datetime, sign: int = 1):
+        rows = [
+            (member_id, guild_id, granularity, _timestamp(bucket), sign * seconds)
+            for granularity in GRANULARITIES
+            for bucket, seconds in split_session(arrival, leaving, granularity)
+        ]
+        self.conn.executemany(
+            "insert into TimeBuckets (memberId, guildId, granularity, bucketStart, seconds) values (?, ?, ?, ?, ?) "
+            "on conflict (memberId, guildId, granularity, bucketStart) do update set seconds = seconds + excluded.seconds",
+            rows)
+
+    def _close_session(self, member_id: int, guild_id: Optional[int], leaving: datetime,
+                       leave_event_id: Optional[str] = None) -> Dict:
+        # Sessions opened after the leave belong to a later join
+        rows = self._query(
+            "select id, arrivalTime, creditedUntil from TimeLog where memberId = ? and leavingTime is null and arrivalTime <= ? "
+            "order by arrivalTime desc limit 1", (member_id, _timestamp(leaving)))
+        if not rows:
+            return {"duration": 0.0, "credited": 0.0, "gameTime": None, "arrivalTime": None, "leavingTime": None}
+
+        arrival = datetime.fromisoformat(rows[0]["arrivalTime"])
+        duration = max(0.0, (leaving - arrival).total_seconds())
+        # Checkpoints credited the session up to creditedUntil. A leave that reaches us late
+        # (debounced or replayed) can fall before that, and then takes the excess back.
+        credited_until = datetime.fromisoformat(rows[0]["creditedUntil"] or rows[0]["arrivalTime"])
+        remainder = (leaving - credited_until).total_seconds()
+        self.conn.execute("update TimeLog set leavingTime = ?, leaveEventId = ? where id = ?",
+                          (_timestamp(leaving), leave_event_id, rows[0]["id"]))
+
+        self.conn.execute("update Members set gameTime = coalesce(gameTime, 0) + ? where memberId = ?", (remainder, member_id))
+        total = self._query("select gameTime from Members where memberId = ?", (member_id,))
+
+        if guild_id is not None:
+            if remainder >= 0:
+                self._fold_buckets(member_id, guild_id, credited_until, leaving)
+            else:
+                self._fold_buckets(member_id, guild_id, leaving, credited_until, sign=-1)
+            self.conn.execute(
+                "insert into MemberStats (memberId, guildId, totalTime, sessionCount, longestSession, lastSession, lastSeen) "
+                "values (?, ?, ?, 1, ?, ?, ?) on conflict (memberId, guildId) do update set "
+                "totalTime = totalTime + excluded.totalTime, sessionCount = sessionCount + 1, "
+                "longestSession = max(longestSession, excluded.longestSession), "
+                "lastSession = excluded.lastSession, lastSeen = excluded.lastSeen",
+                (member_id, guild_id, remainder, duration, duration, _timestamp(leaving)))
+
+        return {
+            "duration": duration,
+            "credited": remainder,
+            "gameTime": float(total[0]["gameTime"]) if total else None,
+            "arrivalTime": _timestamp(arrival),
+            "leavingTime": _timestamp(leaving),
+        }
+
+    async def closeSession(self, member, leavingTime: Optional[datetime] = None) -> Optional[Dict]:
+        try:
+            leaving = datetime.fromisoformat(_timestamp(leavingTime))
+            return await self._run(self._transaction, self._close_session, member.id, member.guild.id, leaving)
+        except Exception as e:
+            print(f"Error closing session for {member.name}: {e}")
+            return None
+
+    def _close_sessions(self, leaves: List[Dict]) -> Dict[str, Dict]:
+        placeholders = ",".join("?" * len(leaves))
+        applied = {row["leaveEventId"] for row in self._query(
+            f"select leaveEventId from TimeLog where leaveEventId in ({placeholders})",
+            tuple(leave["eventId"] for leave in leaves))}
+        sessions = {}
+        for leave in leaves:
+            if leave["eventId"] in applied:
+                continue  # Replayed: this leave already closed its session
+            leaving = datetime.fromisoformat(_timestamp(leave["at"]))
+            sessions[leave["eventId"]] = self._close_session(leave["memberId"], leave.get("guildId"), leaving, leave["eventId"])
+        return sessions
+
+    async def closeSessions(self, leaves: List[Dict]) -> Optional[Dict[str, Dict]]:
+        if not leaves:
+            return {}
+        try:
+            # Leaves already recorded are skipped, so a failed batch is safe to resend
+            return await self._run(self._transaction, self._close_sessions, leaves, idempotent=True)
+        except Exception as e:
+            print(f"Error closing {len(leaves)} sessions: {e}")
+            return None
+
+    def _checkpoint_sessions(self, guild_id: int, member_ids: List[int], until: datetime) -> List[Dict]:
+        placeholders = ",".join("?" * len(member_ids))
+        # Only each member's newest open session, the one close_session will close: older ones
+        # are stale and closed at creditedUntil, so crediting them too would count time twice
+        sessions = self._query(
+            "select id, memberId, arrivalTime, creditedUntil from TimeLog t "
+            f"where guildId = ? and leavingTime is null and memberId in ({placeholders}) "
+            "and id = (select id from TimeLog o where o.memberId = t.memberId and o.guildId = t.guildId "
+            "and o.leavingTime is null order by o.arrivalTime desc, o.id desc limit 1) "
+            "and coalesce(creditedUntil, arrivalTime) < ?",
+            (guild_id, *member_ids, _timestamp(until)))
+        if not sessions:
+            return []
+
+        credit: Dict[int, float] = {}
+        for session in sessions:
+            since = datetime.fromisoformat(session["creditedUntil"] or session["arrivalTime"])
+            credit[session["memberId"]] = credit.get(session["memberId"], 0.0) + (until - since).total_seconds()
+            self._fold_buckets(session["memberId"], guild_id, since, until)
+
+        self.conn.executemany("update TimeLog set creditedUntil = ? where id = ?",
+                              [(_timestamp(until), session["id"]) for session in sessions])
+        self.conn.executemany("update Members set gameTime = coalesce(gameTime, 0) + ? where memberId = ?",
+                              [(seconds, member_id) for member_id, seconds in credit.items()])
+        # The session itself is counted (sessionCount, longestSession) when it closes
+        self.conn.executemany(
+            "insert into MemberStats (memberId, guildId, totalTime, lastSeen) values (?, ?, ?, ?) "
+            "on conflict (memberId, guildId) do update set "
+            "totalTime = totalTime + excluded.totalTime, lastSeen = excluded.lastSeen",
+            [(member_id, guild_id, seconds, _timestamp(until)) for member_id, seconds in credit.items()])
+
+        placeholders = ",".join("?" * len(credit))
+        return self._query(f"select memberId, gameTime from Members where memberId in ({placeholders})", tuple(credit))
+
+    async def checkpointSessions(self, guildId: int, memberIds: List[int], until: Optional[datetime] = None) -> Optional[List[Dict]]:
+        if not memberIds:
+            return []
+        try:
+            until = datetime.fromisoformat(_timestamp(until))
+            return await self._run(self._transaction, self._checkpoint_sessions, guildId, memberIds, until)
+        except Exception as e:
+            print(f"Error checkpointing sessions in guild {guildId}: {e}")
+            return None
+
+    def _import_sessions(self, rows: List[Dict]) -> int:
+        imported = 0
+        for row in rows:
+            arrival, leaving = _timestamp(row["arrivalTime"]), _timestamp(row["leavingTime"])
+            cursor = self.conn.execute(
+                "insert into TimeLog (memberId, guildId, arrivalTime, leavingTime, creditedUntil, eventId) "
+                "values (?, ?, ?, ?, ?, ?) on conflict (eventId) do nothing",
+                (row["memberId"], row["guildId"], arrival, leaving, leaving, row["eventId"]))
+            if not cursor.rowcount:
+                continue  # Imported by an earlier run
+            imported += 1
+            # When the time was spent is unknown, so it is not split into TimeBuckets
+            duration = (datetime.fromisoformat(leaving) - datetime.fromisoformat(arrival)).total_seconds()
+            self.conn.execute("update Members set gameTime = coalesce(gameTime, 0) + ? where memberId = ?",
+                              (duration, row["memberId"]))
+            self.conn.execute(
+                "insert into MemberStats (memberId, guildId, totalTime, sessionCount, longestSession, lastSession, lastSeen) "
+                "values (?, ?, ?, 1, ?, ?, ?) on conflict (memberId, guildId) do update set "
+                "totalTime = totalTime + excluded.totalTime, sessionCount = sessionCount + 1, "
+                "longestSession = max(longestSession, excluded.longestSession), "
+                "lastSession = coalesce(lastSession, excluded.lastSession), "
+                "lastSeen = max(coalesce(lastSeen, ''), excluded.lastSeen)",
+                (row["memberId"], row["guildId"], duration, duration, duration, leaving))
+        return imported
+
+    async def importSessions(self, rows: List[Dict]) -> Optional[int]:
+        if not rows:
+            return 0
+        try:
+            # Rows already present are skipped by eventId, so a retried chunk is not counted twice
+            return await self._run(self._transaction, self._import_sessions, rows, idempotent=True)
+        except Exception as e:
+            print(f"Error importing {len(rows)} sessions: {e}")
+            return None
+
+    async def getOpenSessions(self) -> Optional[List[Dict]]:
+        try:
+            return await self._run(self._query, "select id, memberId, guildId, arrivalTime from TimeLog where leavingTime is null")
+        except Exception as e:
+            print(f"Error fetching open sessions: {e}")
+            return None
+
+    def _close_stale_sessions(self, session_ids: List[int]) -> int:
+        placeholders = ",".join("?" * len(session_ids))
+        cursor = self.conn.execute(
+            f"update TimeLog set leavingTime = coalesce(creditedUntil, arrivalTime) where id in ({placeholders}) and leavingTime is null",
+            tuple(session_ids))
+        return cursor.rowcount
+
+    async def closeStaleSessions(self, sessionIds: List[int]) -> int:
+        if not sessionIds:
+            return 0
+        try:
+            return await self._run(self._transaction, self._close_stale_sessions, sessionIds)
+        except Exception as e:
+            print(f"Error closing {len(sessionIds)} stale sessions: {e}")
+            return 0
+
+    # Guilds and notifications
+
+    async def registerGuild(self, guild) -> bool:
+        try:
+            await self._run(self.conn.execute,
+                "insert into Guild (guildId, guildName) values (?, ?) "
+                "on conflict (guildId) do update set guildName = excluded.guildName",
+                (guild.id, guild.name), idempotent=True)
+            return True
+        except Exception as e:
+            print(f"There was an error on registering this guild {guild.name}: {e}")
+            return False
+
+    async def getCoolDown(self, guild) -> Optional[float]:
+        try:
+            rows = await self._run(self._query, "select Cooldown from Guild where guildId = ?", (guild.id,))
+            return float(rows[0]["Cooldown"] or 0) if rows else 0.0
+        except Exception as e:
+            print(f"There was an error getting the cooldown for {guild.name}: {e}")
+            return None
+
+    async def updateCoolDown(self, guild, timestamp: Optional[float] = None):
+        try:
+            await self._run(self.conn.execute, "update Guild set Cooldown = ? where guildId = ?", (timestamp or time.time(), guild.id))
+        except Exception as e:
+            print(f"There was an error updating {guild.name}'s cooldown: {e}")
+            return False
+
+    async def _set_dm(self, guild, member, value: int) -> bool:
+        await self._run(self.conn.execute, "update MembersGuild set DM = ? where guildId = ? and memberId = ?", (value, guild.id, member.id))
+        return True
+
+    async def add_to_dm_group(self, guild, member) -> bool:
+        try:
+            return await self._set_dm(guild, member, 1)
+        except Exception as e:
+            print(f"Error adding member {member.id} to DM group for guild {guild.id}: {e}")
+            return False
+
+    async def remove_from_dm_group(self, guild, member) -> bool:
+        try:
+            return await self._set_dm(guild, member, 0)
+        except Exception as e:
+            print(f"Error removing member {member.id} from DM group for guild {guild.id}: {e}")
+            return False
+
+    async def get_dm_group(self, guild) -> Optional[list]:
+        try:
+            return await self._run(self._query, "select memberId from MembersGuild where guildId = ? and DM = 1", (guild.id,))
+        except Exception as e:
+            print(f"Error fetching DM group for guild {guild.id}: {e}")
+            return None
+
+    async def getDmStatus(self, guild, member):
+        try:
+            rows = await self._run(self._query, "select DM from MembersGuild where guildId = ? and memberId = ?", (guild.id, member.id))
+            return rows[0]["DM"] if rows else None
+        except Exception as e:
+            print(f"Error fetching DM status for guild {guild.id}: {e}")
+            return None
+
+    # Leaderboards and stats
+
+    async def getTopUsersByGuild(self, guildId, limit) -> List[Dict]:
+        try:
+            return await self._run(self._query,
+                "select m.memberId, m.gameTime, m.name from MembersGuild mg "
+                "join Members m on m.memberId = mg.memberId "
+                "where mg.guildId = ? and m.gameTime is not null order by m.gameTime desc limit ?",
+                (guildId, limit))
+        except Exception as e:
+            print(f"Error fetching top users for guild {guildId}: {e}")
+            return []
+
+    def _member_stats(self, member_id: int, since: str) -> Dict:
+        total = self._query("select gameTime from Members where memberId = ?", (member_id,))
+        guilds = self._query(
+            "select guildId, totalTime, sessionCount, longestSession, lastSession, lastSeen "
+            "from MemberStats where memberId = ?", (member_id,))
+        recent = self._query(
+            "select coalesce(sum(seconds), 0) as seconds from TimeBuckets "
+            "where memberId = ? and granularity = 'day' and bucketStart >= ?", (member_id, since))
+        return {
+            "gameTime": float(total[0]["gameTime"] or 0.0) if total else 0.0,
+            "guilds": {row["guildId"]: row for row in guilds},
+            "recent": float(recent[0]["seconds"]),
+        }
+
+    async def getMemberStats(self, memberId: int, windowDays: int = 7) -> Optional[Dict]:
+        since = _truncate(datetime.now(timezone.utc) - timedelta(days=windowDays), "day")
+        try:
+            return await self._run(self._member_stats, memberId, _timestamp(since))
+        except Exception as e:
+            print(f"Error fetching stats for member {memberId}: {e}")
+            return None
+
+    async def getWindowTotals(self, guildId: int, since: datetime, granularity: str = "day",
+                              limit: Optional[int] = None) -> Optional[List[Dict]]:
+        try:
+            rows = await self._run(self._query,
+                "select b.memberId, coalesce(m.name, b.memberId) as name, sum(b.seconds) as gameTime "
+                "from TimeBuckets b left join Members m on m.memberId = b.memberId "
+                "where b.guildId = ? and b.granularity = ? and b.bucketStart >= ? "
+                "group by b.memberId order by gameTime desc limit ?",
+                (guildId, granularity, _timestamp(since), -1 if limit is None else limit))
+            return rows
+        except Exception as e:
+            print(f"Error fetching windowed totals for guild {guildId}: {e}")
+            return None
+
+    def _rebuild_time_buckets(self, since: datetime) -> int:
+        window_start = _truncate(since.astimezone(timezone.utc), "day")
+        self.conn.execute("delete from TimeBuckets where bucketStart >= ?", (_timestamp(window_start),))
+        sessions = self._query(
+            "select memberId, guildId, arrivalTime, coalesce(leavingTime, creditedUntil) as endTime from TimeLog "
+            "where guildId is not null and coalesce(leavingTime, creditedUntil) > ? "
+            # Imported legacy totals say nothing about when the time was spent (see _import_sessions)
+            "and (eventId is null or eventId not like 'legacy:%')",
+            (_timestamp(window_start),))
+        folded = 0
+        for session in sessions:
+            # Open sessions count up to their last checkpoint
+            arrival = max(datetime.fromisoformat(session["arrivalTime"]), window_start)
+            self._fold_buckets(session["memberId"], session["guildId"], arrival, datetime.fromisoformat(session["endTime"]))
+            folded += 1
+        return folded
+
+    async def rebuildTimeBuckets(self, since: datetime) -> Optional[int]:
+        try:
+            return await self._run(self._transaction, self._rebuild_time_buckets, since)
+        except Exception as e:
+            print(f"Error rebuilding time buckets since {since}: {e}")
+            return None
@@ -0,0 +1,51 @@
+# stats.py
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from cache import TTLCache
+from storage import StorageBackend
+
+class StatsCache:
+    """Per-member stats rollups cached in memory and kept current from session closes"""
+
+    def __init__(self, db: StorageBackend, max_size: int = 10000, ttl_seconds: float = 600):
+        self.db = db
+        self.cache = TTLCache(max_size, ttl_seconds)  # memberId -> {"gameTime", "guilds": {guildId: row}}
+
+    async def get(self, member_id: int) -> Optional[Dict]:
+        stats = self.cache.get(member_id)
+        if stats is None:
+            stats = await self.db.getMemberStats(member_id)
+            if stats is not None:
+                self.cache.set(member_id, stats)
+        return stats
+
+    def record_session(self, member, session: Dict):
+        """Fold a closed session into the cached rollup, mirroring close_session"""
+        stats = self.cache.get(member.id)
+        if stats is None or session.get("arrivalTime") is None:
+            return  # Not cached (the next !stats reads the updated rows) or nothing was closed
+
+        duration = session["duration"]
+        # Checkpoints already counted the rest of the session
+        credited = session.get("credited", duration)
+        if session["gameTime"] is not None:
+            stats["gameTime"] = session["gameTime"]
+        else:
+            stats["gameTime"] += credited
+
+        stats["recent"] = stats.get("recent", 0.0) + credited
+
+        row = stats["guilds"].setdefault(member.guild.id, {
+            "guildId": member.guild.id, "totalTime": 0.0, "sessionCount": 0,
+            "longestSession": 0.0, "lastSession": None, "lastSeen": None,
+        })
+        row["totalTime"] = float(row["totalTime"]) + credited
+        row["sessionCount"] += 1
+        row["longestSession"] = max(float(row["longestSession"]), duration)
+        row["lastSession"] = duration
+        # UTC like the stored timestamps, which !stats compares it with
+        row["lastSeen"] = session.get("leavingTime") or datetime.now(timezone.utc).isoformat()
+
+    def invalidate(self, member_id: int):
+        """Drop a rollup whose rows changed outside a session close (a checkpoint)"""
+        self.cache.pop(member_id)
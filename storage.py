@@ -0,0 +1,143 @@
+# storage.py
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+from cache import MemberRegistry
+from metrics import timed
+from resilience import CallGuard
+
+class StorageBackend(ABC):
+    """Everything the bot reads or writes. Methods log their own errors and
+    return a falsy value (False, None, [] or 0) instead of raising."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Time every interface method a backend implements under the "db" component
+        for name in StorageBackend.__abstractmethods__:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "__timed__", False):
+                setattr(cls, name, timed("db")(method))
+
+    def __init__(self, registry: Optional[MemberRegistry] = None, guard: Optional[CallGuard] = None):
+        # Members and member/guild links already persisted, so repeat upserts are skipped
+        self.registry = registry or MemberRegistry()
+        # Every query runs under the event's deadline and the backend's circuit breaker
+        self.guard = guard or CallGuard()
+
+    def close(self):
+        """Release connections and worker threads"""
+
+    # Members and guild links
+    @abstractmethod
+    async def existsMember(self, member) -> bool: ...
+
+    @abstractmethod
+    async def newMember(self, member) -> bool: ...
+
+    @abstractmethod
+    async def newMemberToGuild(self, member, guild) -> bool: ...
+
+    @abstractmethod
+    async def existsMembersGuild(self, member, guild) -> bool: ...
+
+    @abstractmethod
+    async def upsertMembers(self, rows: List[Dict]) -> bool: ...
+
+    @abstractmethod
+    async def upsertMembersGuild(self, rows: List[Dict]) -> bool: ...
+
+    @abstractmethod
+    async def warmRegistry(self, guildIds: List[int]) -> int: ...
+
+    # Sessions
+    @abstractmethod
+    async def logArrivalTime(self, member) -> bool: ...
+
+    @abstractmethod
+    async def insertTimeLogs(self, rows: List[Dict]) -> bool:
+        """Insert arrivals; rows carrying an eventId already present are skipped"""
+
+    @abstractmethod
+    async def logLeaveTime(self, member) -> bool: ...
+
+    @abstractmethod
+    async def logGameTime(self, member) -> bool: ...
+
+    @abstractmethod
+    async def closeSession(self, member, leavingTime: Optional[datetime] = None) -> Optional[Dict]:
+        """Close the newest session opened before leavingTime (default now) and credit the time
+        checkpoints have not (negative if they ran past leavingTime);
+        returns {"duration", "credited", "gameTime", "arrivalTime", "leavingTime"}"""
+
+    @abstractmethod
+    async def closeSessions(self, leaves: List[Dict]) -> Optional[Dict[str, Dict]]:
+        """Close one session per leave ({"memberId", "guildId", "at", "eventId"}) in a single call,
+        recording the leave's eventId on the row it closed; leaves whose eventId is already
+        recorded are skipped. Returns {eventId: session, as closeSession} for the leaves applied"""
+
+    @abstractmethod
+    async def checkpointSessions(self, guildId: int, memberIds: List[int], until: Optional[datetime] = None) -> Optional[List[Dict]]:
+        """Credit the open sessions of memberIds in the guild up to until (default now);
+        returns [{"memberId", "gameTime"}] for the members credited"""
+
+    @abstractmethod
+    async def importSessions(self, rows: List[Dict]) -> Optional[int]:
+        """Insert closed sessions ({"memberId", "guildId", "arrivalTime", "leavingTime", "eventId"}) and credit
+        them to the member's totals, skipping eventIds already present; returns how many were imported"""
+
+    @abstractmethod
+    async def getOpenSessions(self) -> Optional[List[Dict]]: ...
+
+    @abstractmethod
+    async def closeStaleSessions(self, sessionIds: List[int]) -> int: ...
+
+    # Guilds and notifications
+    @abstractmethod
+    async def registerGuild(self, guild) -> bool: ...
+
+    @abstractmethod
+    async def getCoolDown(self, guild) -> Optional[float]:
+        """Timestamp of the guild's last notification (0.0 if never), or None on error"""
+
+    @abstractmethod
+    async def updateCoolDown(self, guild, timestamp: Optional[float] = None): ...
+
+    @abstractmethod
+    async def add_to_dm_group(self, guild, member) -> bool: ...
+
+    @abstractmethod
+    async def remove_from_dm_group(self, guild, member) -> bool: ...
+
+    @abstractmethod
+    async def get_dm_group(self, guild) -> Optional[list]: ...
+
+    @abstractmethod
+    async def getDmStatus(self, guild, member): ...
+
+    # Leaderboards and stats
+    @abstractmethod
+    async def getTopUsersByGuild(self, guildId, limit) -> List[Dict]: ...
+
+    @abstractmethod
+    async def getMemberStats(self, memberId: int, windowDays: int = 7) -> Optional[Dict]: ...
+
+    @abstractmethod
+    async def getWindowTotals(self, guildId: int, since: datetime, granularity: str = "day",
+                              limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Seconds per member in the guild's buckets since a point in time, summed by the database;
+        returns [{"memberId", "name", "gameTime"}] highest first, at most limit rows"""
+
+    @abstractmethod
+    async def rebuildTimeBuckets(self, since: datetime) -> Optional[int]: ...
+
+def createDatabase(backend: str = "supabase", **options) -> StorageBackend:
+    """Build the configured storage backend ("supabase" or "sqlite")"""
+    if backend == "sqlite":
+        from sqlite_queries import SqliteQueries
+        return SqliteQueries(options.get("path", "gamingNotif.db"), guard=options.get("guard"))
+    if backend == "supabase":
+        from supabase import create_client
+        from queries import DatabaseQueries
+        client = create_client(options["url"], options["key"])
+        return DatabaseQueries(client, max_workers=options.get("max_workers", 8), guard=options.get("guard"))
+    raise ValueError(f"Unknown database backend: {backend}")
@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# The bot's modules live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,64 @@
+# test_cache.py
+from types import SimpleNamespace
+import cache
+from cache import TTLCache, MemberRegistry
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def fake_clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+def test_evicts_least_recently_used(monkeypatch):
+    fake_clock(monkeypatch)
+    c = TTLCache(max_size=2, ttl_seconds=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # "b" is now the least recently used
+    c.set("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    c = TTLCache(max_size=10, ttl_seconds=60)
+    c.set("a", 1)
+    c.set("b", 2, ttl_seconds=120)
+    clock.now += 61
+    assert c.get("a", "gone") == "gone"
+    assert len(c) == 1  # The expired entry is dropped when read
+    assert c.get("b") == 2
+    clock.now += 60
+    assert "b" not in c
+
+def test_set_refreshes_ttl(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    c = TTLCache(max_size=10, ttl_seconds=60)
+    c.set("a", 1)
+    clock.now += 50
+    c.set("a", 2)
+    clock.now += 50
+    assert c.get("a") == 2
+
+def test_pop_returns_value_or_default(monkeypatch):
+    fake_clock(monkeypatch)
+    c = TTLCache()
+    c.set("a", 1)
+    assert c.pop("a") == 1
+    assert c.pop("a", "missing") == "missing"
+
+def test_registry_tracks_names_and_links():
+    registry = MemberRegistry()
+    registry.remember_member(1, "old")
+    assert registry.has_member(1)
+    assert registry.is_known_member(1, "old")
+    assert not registry.is_known_member(1, "new")
+    assert not registry.is_linked(1, 10)
+    registry.remember_link(1, 10)
+    assert registry.is_linked(1, 10)
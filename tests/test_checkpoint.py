@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlite_queries import SqliteQueries, _timestamp
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+def open_session(db, member_id, arrival, guild_id=10):
+    db.conn.execute("insert or ignore into Members (memberId, name, gameTime) values (?, ?, 0)", (member_id, f"m{member_id}"))
+    db.conn.execute("insert into TimeLog (memberId, guildId, arrivalTime) values (?, ?, ?)",
+                    (member_id, guild_id, _timestamp(arrival)))
+
+def game_time(db, member_id):
+    return db.conn.execute("select gameTime from Members where memberId = ?", (member_id,)).fetchone()[0]
+
+def test_checkpoint_credits_only_the_newest_open_session(tmp_path):
+    db = SqliteQueries(str(tmp_path / "test.db"))
+    try:
+        # A stale session left open two hours ago, and the one the member is in now
+        open_session(db, 1, NOW - timedelta(hours=2))
+        open_session(db, 1, NOW - timedelta(minutes=5))
+
+        totals = asyncio.run(db.checkpointSessions(10, [1], NOW))
+        assert totals == [{"memberId": 1, "gameTime": 300.0}]
+        asyncio.run(db.checkpointSessions(10, [1], NOW + timedelta(minutes=5)))
+        assert game_time(db, 1) == 600.0
+        assert db.conn.execute("select count(*) from TimeLog where creditedUntil is not null").fetchone()[0] == 1
+    finally:
+        db.close()
+
+def test_checkpoint_then_close_credits_the_session_once(tmp_path):
+    db = SqliteQueries(str(tmp_path / "test.db"))
+    try:
+        open_session(db, 1, NOW - timedelta(minutes=10))
+        asyncio.run(db.checkpointSessions(10, [1], NOW))
+        session = asyncio.run(db.closeSessions([{"memberId": 1, "guildId": 10, "at": NOW + timedelta(minutes=2),
+                                                 "eventId": "leave-1"}]))["leave-1"]
+        assert (session["duration"], session["credited"]) == (720.0, 120.0)
+        assert game_time(db, 1) == 720.0
+        stats = db.conn.execute("select totalTime, sessionCount from MemberStats where memberId = 1").fetchone()
+        assert tuple(stats) == (720.0, 1)
+    finally:
+        db.close()
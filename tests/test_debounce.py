@@ -0,0 +1,81 @@
+# test_debounce.py
+import asyncio
+from types import SimpleNamespace
+from debounce import FlapDebouncer
+
+def member(member_id=1, guild_id=10):
+    return SimpleNamespace(id=member_id, name=f"m{member_id}", guild=SimpleNamespace(id=guild_id))
+
+def test_leave_closes_after_grace_window():
+    closed = []
+
+    async def on_expire(m, left_at):
+        closed.append((m.id, left_at))
+
+    async def run():
+        debouncer = FlapDebouncer(grace_seconds=0.01)
+        debouncer.defer_leave(member(), "voice", on_expire)
+        assert len(debouncer) == 1
+        await asyncio.sleep(0.05)
+        assert len(debouncer) == 0
+
+    asyncio.run(run())
+    assert [m for m, _ in closed] == [1]
+
+def test_rejoin_cancels_pending_leave():
+    closed = []
+
+    async def on_expire(m, left_at):
+        closed.append(m.id)
+
+    async def run():
+        debouncer = FlapDebouncer(grace_seconds=0.01)
+        debouncer.defer_leave(member(), "voice", on_expire)
+        assert debouncer.cancel_leave(member()) == "voice"
+        assert debouncer.cancel_leave(member()) is None
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert closed == []
+
+def test_flush_closes_pending_leaves_at_their_leave_time():
+    closed = []
+
+    async def on_expire(m, left_at):
+        closed.append((m.id, left_at))
+
+    async def run():
+        debouncer = FlapDebouncer(grace_seconds=60)
+        debouncer.defer_leave(member(1), "a", on_expire)
+        debouncer.defer_leave(member(2), "b", on_expire)
+        left_at = {key[0]: entry[3] for key, entry in debouncer.pending.items()}
+        await debouncer.flush(on_expire)
+        assert len(debouncer) == 0
+        return left_at
+
+    left_at = asyncio.run(run())
+    assert sorted(closed) == sorted(left_at.items())
+
+def test_second_leave_restarts_the_grace_window():
+    closed = []
+
+    async def on_expire(m, left_at):
+        closed.append(left_at)
+
+    async def run():
+        debouncer = FlapDebouncer(grace_seconds=0.05)
+        debouncer.defer_leave(member(), "voice", on_expire)
+        first_task = debouncer.pending[(1, 10)][0]
+        await asyncio.sleep(0.03)
+        debouncer.defer_leave(member(), "voice", on_expire)
+        second_left_at = debouncer.pending[(1, 10)][3]
+        await asyncio.sleep(0.03)
+        # The first timer would have fired by now
+        assert len(debouncer) == 1 and closed == []
+        await asyncio.sleep(0.05)
+        await asyncio.sleep(0)
+        return first_task, second_left_at
+
+    first_task, second_left_at = asyncio.run(run())
+    assert first_task.cancelled()
+    assert closed == [second_left_at]
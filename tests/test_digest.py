@@ -0,0 +1,22 @@
+# test_digest.py
+from digest import TokenBucket
+
+def test_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(rate=1 / 60, burst=2)
+    now = bucket.updated
+    assert bucket.try_take(now)
+    assert bucket.try_take(now)
+    assert not bucket.try_take(now)
+    assert bucket.ready_at(now) == now + 60
+    assert not bucket.try_take(now + 59)
+    assert bucket.try_take(now + 60)
+
+def test_bucket_never_exceeds_burst():
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.try_take(bucket.updated + 3600)
+    assert bucket.tokens == 1
+
+def test_bucket_tolerates_a_clock_read_before_it_was_created():
+    # flush() reads the clock once, then may create buckets a moment later
+    bucket = TokenBucket(rate=1 / 3600, burst=1)
+    assert bucket.try_take(bucket.updated - 0.5)
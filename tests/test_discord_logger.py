@@ -0,0 +1,27 @@
+# test_discord_logger.py
+import asyncio
+from discord_logger import DiscordLogger
+
+def test_file_mirror_keeps_filtered_dropped_and_unrouted_lines(tmp_path):
+    log_file = tmp_path / "bot.log"
+    printed = []
+
+    async def run():
+        logger = DiscordLogger(bot=None, guild_id=0, channel_name="logs", buffer_size=1,
+                               min_level="WARNING", log_file=str(log_file))
+        logger.original_print = printed.append
+        # No channel yet: printed to the console and mirrored
+        await logger.log("before setup")
+        logger.channel = object()
+        logger.enqueue("filtered", "INFO")
+        logger.enqueue("kept", "ERROR")
+        logger.enqueue("overflow", "ERROR")  # Drops "kept" from the channel buffer
+        assert logger.dropped == 1
+        logger.channel = None
+        await logger.stop()
+
+    asyncio.run(run())
+    text = log_file.read_text(encoding="utf-8")
+    for message in ("before setup", "filtered", "kept", "overflow"):
+        assert message in text
+    assert "before setup" in printed
@@ -0,0 +1,60 @@
+import asyncio
+from dispatcher import EventDispatcher
+
+def test_member_events_run_in_order_and_guilds_concurrently():
+    log = []
+
+    async def handler(name, delay):
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+
+    async def run():
+        dispatcher = EventDispatcher(partitions=2, concurrency=4)
+        dispatcher.start()
+        # Guild 10's member 1 joins slowly and then leaves; guild 11 is on the other partition
+        await dispatcher.submit(10, 1, handler, "join", 0.05)
+        await dispatcher.submit(10, 1, handler, "leave", 0)
+        await dispatcher.submit(11, 2, handler, "other guild", 0)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert log.index(("end", "join")) < log.index(("start", "leave"))
+    # The other guild did not wait behind the slow join
+    assert log.index(("end", "other guild")) < log.index(("end", "join"))
+
+def test_members_of_one_guild_do_not_wait_on_each_other():
+    log = []
+
+    async def handler(name, delay):
+        await asyncio.sleep(delay)
+        log.append(name)
+
+    async def run():
+        dispatcher = EventDispatcher(partitions=1, concurrency=4)
+        dispatcher.start()
+        await dispatcher.submit(10, 1, handler, "slow", 0.05)
+        await dispatcher.submit(10, 2, handler, "fast", 0)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert log == ["fast", "slow"]
+
+def test_a_failing_handler_does_not_stop_the_member_queue():
+    log = []
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def handler():
+        log.append("ran")
+
+    async def run():
+        dispatcher = EventDispatcher(partitions=1)
+        dispatcher.start()
+        await dispatcher.submit(10, 1, failing)
+        await dispatcher.submit(10, 1, handler)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert log == ["ran"]
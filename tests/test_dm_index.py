@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+from dm_index import DmIndex
+
+class SlowDb:
+    """get_dm_group returns the rows as they were when it was called, once released"""
+
+    def __init__(self, members):
+        self.members = set(members)
+        self.release = None
+
+    async def get_dm_group(self, guild):
+        rows = [{"memberId": m} for m in self.members]
+        await self.release.wait()
+        return rows
+
+def test_toggles_during_the_first_load_are_kept():
+    db = SlowDb({1, 2})
+    index = DmIndex(db)
+    guild = SimpleNamespace(id=10)
+
+    async def run():
+        db.release = asyncio.Event()
+        loading = asyncio.create_task(index.get(guild))
+        await asyncio.sleep(0)
+        # !dm toggles written to the db after the load read its rows
+        index.add(10, 3)
+        index.remove(10, 1)
+        db.release.set()
+        return await loading
+
+    assert asyncio.run(run()) == {2, 3}
+    assert index._toggles == {}
+
+def test_toggles_during_a_reconcile_are_kept():
+    db = SlowDb({1})
+    index = DmIndex(db)
+    guild = SimpleNamespace(id=10)
+
+    async def run():
+        db.release = asyncio.Event()
+        db.release.set()
+        await index.get(guild)
+        db.release = asyncio.Event()
+        reconciling = asyncio.create_task(index.reconcile())
+        await asyncio.sleep(0)
+        index.add(10, 2)
+        db.release.set()
+        await reconciling
+        return await index.get(guild)
+
+    assert asyncio.run(run()) == {1, 2}
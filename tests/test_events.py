@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+from events import BotEvents
+
+class FakeDb:
+    def __init__(self, dm_status):
+        self.dm_status = dm_status
+        self.added = []
+
+    async def getDmStatus(self, guild, member):
+        return self.dm_status
+
+    async def add_to_dm_group(self, guild, member):
+        self.added.append(member.id)
+        return True
+
+class FakeIndex:
+    def __init__(self):
+        self.members = set()
+
+    async def get(self, guild):
+        return set(self.members)
+
+    def add(self, guild_id, member_id):
+        self.members.add(member_id)
+
+def uncached_update(dm_status):
+    db = FakeDb(dm_status)
+    index = FakeIndex()
+    bot = SimpleNamespace(event=lambda handler: handler)
+    events = BotEvents(bot, SimpleNamespace(dm_index=index), db)
+    member = SimpleNamespace(id=1, name="m1", guild=SimpleNamespace(id=10), roles=[SimpleNamespace(name="DM")])
+    asyncio.run(events.on_uncached_member_update(member))
+    return db, index
+
+def test_uncached_member_with_the_role_and_no_row_is_subscribed():
+    db, index = uncached_update(None)
+    assert db.added == [1] and index.members == {1}
+
+def test_uncached_update_does_not_undo_a_dm_opt_out():
+    db, index = uncached_update(0)
+    assert db.added == [] and index.members == set()
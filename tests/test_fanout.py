@@ -0,0 +1,25 @@
+# test_fanout.py
+import asyncio
+from types import SimpleNamespace
+import fanout
+from fanout import RateLimiter
+
+def test_rate_limiter_paces_after_burst(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(fanout, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(fanout.asyncio, "sleep", sleep)
+
+    async def run():
+        limiter = RateLimiter(rate=10, burst=2)
+        for _ in range(4):
+            await limiter.acquire()
+
+    asyncio.run(run())
+    assert len(slept) == 2
+    assert all(abs(s - 0.1) < 1e-9 for s in slept)
@@ -0,0 +1,84 @@
+# test_import_legacy.py
+import json
+import pytest
+from import_legacy import iter_json_array, _parse_clock
+
+ITEMS = [{"member_id": i, "details": {"member_name": f"mé{i}", "timestamp": 1700000000 + i}} for i in range(50)]
+
+@pytest.fixture
+def legacy_file(tmp_path):
+    path = tmp_path / "log.json"
+    path.write_text(json.dumps(ITEMS, indent=2, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 16])
+def test_streams_every_item(legacy_file, read_size):
+    assert [item for item, _ in iter_json_array(legacy_file, read_size=read_size)] == ITEMS
+
+@pytest.mark.parametrize("read_size", [3, 1 << 16])
+def test_resumes_after_any_yielded_offset(legacy_file, read_size):
+    offsets = [offset for _, offset in iter_json_array(legacy_file, read_size=read_size)]
+    for i in (0, 17, len(ITEMS) - 1):
+        rest = [item for item, _ in iter_json_array(legacy_file, offsets[i], read_size=read_size)]
+        assert rest == ITEMS[i + 1:]
+
+def test_offsets_are_byte_offsets(legacy_file):
+    data = open(legacy_file, "rb").read()
+    for item, offset in iter_json_array(legacy_file):
+        assert data[:offset].rstrip().endswith(b"}")
+
+def test_empty_array(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text(" [ ] ")
+    assert list(iter_json_array(str(path))) == []
+
+def test_truncated_file_raises(tmp_path):
+    path = tmp_path / "cut.json"
+    path.write_text(json.dumps(ITEMS)[:-40])
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path)))
+
+def test_not_an_array_raises(tmp_path):
+    path = tmp_path / "object.json"
+    path.write_text("{}")
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path)))
+
+def test_parse_clock():
+    assert _parse_clock("01:02:03") == 3723
+    assert _parse_clock("02:03") == 123
+    assert _parse_clock(None) == 0
+    assert _parse_clock("bad") == 0
+
+def test_rebuild_leaves_imported_time_out_of_buckets(tmp_path):
+    import asyncio
+    import time
+    from datetime import datetime, timedelta, timezone
+    from import_legacy import LegacyImporter
+    from sqlite_queries import SqliteQueries
+
+    now = time.time()
+    arrivals = tmp_path / "log.json"
+    arrivals.write_text(json.dumps([{"member_id": 1, "details": {"member_name": "m1", "timestamp": now - 600}}]))
+    totals = tmp_path / "gameplay_time.json"
+    totals.write_text(json.dumps([{"member_id": 1, "member_name": "m1", "total_gameplay_time_seconds": 7200.0,
+                                   "last_session": "05:00"}]))
+
+    async def run():
+        db = SqliteQueries(str(tmp_path / "bot.db"))
+        try:
+            importer = LegacyImporter(db, 10)
+            await importer.import_arrivals(str(arrivals))
+            await importer.import_totals(str(totals))
+            folded = await db.rebuildTimeBuckets(datetime.now(timezone.utc) - timedelta(days=30))
+            buckets = db._query("select count(*) as n from TimeBuckets")[0]["n"]
+            game_time = db._query("select gameTime from Members where memberId = 1")[0]["gameTime"]
+            return importer.sessions, folded, buckets, game_time
+        finally:
+            db.close()
+
+    sessions, folded, buckets, game_time = asyncio.run(run())
+    assert sessions == 1
+    assert folded == 0
+    assert buckets == 0
+    assert game_time == 7200.0
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+from leaderboard import GuildLeaderboard, LeaderboardCache
+
+def board_with(*totals, size=3):
+    board = GuildLeaderboard(size)
+    board.seed([{"memberId": i, "gameTime": t, "name": f"m{i}"} for i, t in enumerate(totals, 1)])
+    return board
+
+def ranking(board):
+    return [row["memberId"] for row in board.ranked()]
+
+def test_outsider_enters_only_by_passing_last_place():
+    board = board_with(300, 200, 100)
+    assert not board.update(4, "m4", 100)
+    assert board.update(4, "m4", 150)
+    assert ranking(board) == [1, 2, 4]
+
+def test_listed_member_moves_up():
+    board = board_with(300, 200, 100)
+    board.ranked()
+    board.update(3, "m3", 400)
+    assert ranking(board) == [3, 1, 2]
+    assert not board.stale
+
+def test_decrease_re_sorts_and_marks_a_full_board_stale():
+    board = board_with(300, 200, 100)
+    board.ranked()
+    board.update(1, "m1", 50)
+    assert ranking(board) == [2, 3, 1]
+    assert board.stale
+
+def test_decrease_on_a_board_with_room_is_exact():
+    board = board_with(300, 200, size=5)
+    board.update(1, "m1", 50)
+    assert ranking(board) == [2, 1]
+    assert not board.stale
+
+def test_stale_board_is_re_seeded_on_read():
+    class Db:
+        def __init__(self):
+            self.rows = [{"memberId": 1, "gameTime": 300, "name": "m1"}, {"memberId": 2, "gameTime": 200, "name": "m2"}]
+
+        async def getTopUsersByGuild(self, guild_id, limit):
+            return self.rows[:limit]
+
+    db = Db()
+    cache = LeaderboardCache(db, size=2)
+
+    async def run():
+        await cache.get(10)
+        # Member 1 loses time; member 3, off the board, is now ahead of them
+        cache.credit(SimpleNamespace(id=1, name="m1", guild=SimpleNamespace(id=10)), 100)
+        db.rows = [{"memberId": 2, "gameTime": 200, "name": "m2"}, {"memberId": 3, "gameTime": 150, "name": "m3"}]
+        return await cache.get(10)
+
+    assert [row["memberId"] for row in asyncio.run(run())] == [2, 3]
@@ -0,0 +1,29 @@
+# test_notifications.py
+import asyncio
+from types import SimpleNamespace
+from utils import NotificationManager
+
+class SlowCooldownDb:
+    def __init__(self):
+        self.written = []
+
+    async def getCoolDown(self, guild):
+        return 0.0
+
+    async def updateCoolDown(self, guild, timestamp=None):
+        await asyncio.sleep(0.02)
+        self.written.append((guild.id, timestamp))
+
+def test_flush_waits_for_cooldown_writes():
+    db = SlowCooldownDb()
+    guild = SimpleNamespace(id=10, name="g")
+
+    async def run():
+        manager = NotificationManager(db, dm_index=SimpleNamespace(), fanout=SimpleNamespace())
+        assert await manager.try_start_cooldown(guild)
+        assert not await manager.try_start_cooldown(guild)
+        await manager.flush()
+        assert not manager._pending_writes
+
+    asyncio.run(run())
+    assert [guild_id for guild_id, _ in db.written] == [10]
@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+from utils import reconcileVoiceStates
+
+def guild(guild_id, *member_ids):
+    g = SimpleNamespace(id=guild_id, stage_channels=[])
+    members = [SimpleNamespace(id=m, name=f"m{m}", guild=g) for m in member_ids]
+    g.voice_channels = [SimpleNamespace(members=members)]
+    return g
+
+class FakeDb:
+    def __init__(self, open_sessions):
+        self.open_sessions = open_sessions
+        self.closed = []
+        self.opened = []
+
+    async def getOpenSessions(self):
+        return self.open_sessions
+
+    async def closeStaleSessions(self, ids):
+        self.closed += ids
+        return len(ids)
+
+    async def upsertMembers(self, rows):
+        return True
+
+    async def upsertMembersGuild(self, rows):
+        return True
+
+    async def insertTimeLogs(self, rows):
+        self.opened += [row["memberId"] for row in rows]
+        return True
+
+def session(session_id, member_id, arrival, guild_id=10):
+    return {"id": session_id, "memberId": member_id, "guildId": guild_id, "arrivalTime": arrival}
+
+def test_sessions_are_kept_closed_or_opened():
+    db = FakeDb([
+        session(1, 1, "2024-01-01T10:00:00+00:00"),  # Member 1 is still in voice: kept
+        session(2, 1, "2024-01-01T08:00:00+00:00"),  # An older duplicate of member 1's: stale
+        session(3, 2, "2024-01-01T09:00:00+00:00"),  # Member 2 left while the bot was offline: stale
+    ])
+    asyncio.run(reconcileVoiceStates([guild(10, 1, 3)], db, batchSize=1))
+    assert sorted(db.closed) == [2, 3]
+    assert db.opened == [3]  # Member 3 joined while the bot was offline
+
+def test_a_failed_load_changes_nothing():
+    db = FakeDb(None)
+    asyncio.run(reconcileVoiceStates([guild(10, 1)], db))
+    assert db.closed == [] and db.opened == []
+
+def test_sharded_worker_leaves_other_guilds_alone():
+    db = FakeDb([session(1, 1, "2024-01-01T10:00:00+00:00", guild_id=20)])
+    asyncio.run(reconcileVoiceStates([guild(10)], db, ownGuildsOnly=True))
+    assert db.closed == []
@@ -0,0 +1,94 @@
+# test_resilience.py
+import asyncio
+import pytest
+from resilience import (CallGuard, CircuitBreaker, CircuitOpen, DeadlineExceeded, OutcomeUnknown, deadline, no_deadline,
+                        remaining)
+
+def test_nested_deadline_never_extends_the_outer_one():
+    async def run():
+        with deadline(0.1):
+            with deadline(10):
+                assert remaining() <= 0.1
+        assert remaining() is None
+
+    asyncio.run(run())
+
+def test_no_deadline_lifts_the_budget_for_the_block():
+    async def run():
+        with deadline(0.1):
+            with no_deadline():
+                assert remaining() is None
+            assert remaining() is not None
+
+    asyncio.run(run())
+
+def test_call_over_budget_raises_deadline_exceeded():
+    async def run():
+        guard = CallGuard(retries=0)
+        with deadline(0.01):
+            await guard.run(lambda: asyncio.sleep(0.1))
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+
+def test_write_over_budget_finishes_and_reports_unknown():
+    writes = []
+
+    async def slow_write():
+        await asyncio.sleep(0.05)
+        writes.append(1)
+
+    async def run():
+        breaker = CircuitBreaker(min_calls=1)
+        guard = CallGuard(breaker, retries=0)
+        with pytest.raises(OutcomeUnknown):
+            with deadline(0.01):
+                await guard.run(slow_write)
+        assert writes == []
+        await asyncio.sleep(0.1)
+        # Not cancelled: the write committed after the caller gave up, and the breaker saw it succeed
+        assert writes == [1]
+        assert breaker.state == breaker.CLOSED and len(breaker._outcomes) == 1
+
+    asyncio.run(run())
+
+def test_idempotent_call_over_budget_is_abandoned():
+    async def run():
+        guard = CallGuard(retries=0)
+        with pytest.raises(DeadlineExceeded) as raised:
+            with deadline(0.01):
+                await guard.run(lambda: asyncio.sleep(0.1), idempotent=True)
+        assert not isinstance(raised.value, OutcomeUnknown)
+
+    asyncio.run(run())
+
+def test_breaker_opens_on_failures_and_closes_after_probes():
+    breaker = CircuitBreaker(min_calls=2, open_seconds=0, probe_calls=1)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(False, 0.0)
+    assert breaker.state == breaker.OPEN
+    breaker.allow()  # open_seconds=0: the next call is a probe
+    assert breaker.state == breaker.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(True, 0.0)
+    assert breaker.state == breaker.CLOSED
+
+def test_only_idempotent_calls_are_retried():
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise RuntimeError("down")
+
+    async def run(idempotent):
+        guard = CallGuard(CircuitBreaker(min_calls=100), retries=2, retry_base=0)
+        with pytest.raises(RuntimeError):
+            await guard.run(failing, idempotent)
+
+    asyncio.run(run(False))
+    assert len(calls) == 1
+    calls.clear()
+    asyncio.run(run(True))
+    assert len(calls) == 3
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlite_queries import SqliteQueries, _timestamp
+
+NOW = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+MEMBER = SimpleNamespace(id=1, name="m1", guild=SimpleNamespace(id=10))
+
+def open_db(tmp_path, arrival):
+    db = SqliteQueries(str(tmp_path / "test.db"))
+    db.conn.execute("insert into Members (memberId, name, gameTime) values (1, 'm1', 0)")
+    db.conn.execute("insert into TimeLog (memberId, guildId, arrivalTime) values (1, 10, ?)", (_timestamp(arrival),))
+    return db
+
+def totals(db):
+    game_time = db.conn.execute("select gameTime from Members where memberId = 1").fetchone()[0]
+    stats = db.conn.execute("select totalTime from MemberStats where memberId = 1").fetchone()[0]
+    buckets = db.conn.execute("select sum(seconds) from TimeBuckets where granularity = 'hour'").fetchone()[0]
+    return game_time, stats, buckets
+
+def test_close_credits_the_whole_session(tmp_path):
+    db = open_db(tmp_path, NOW - timedelta(minutes=45))
+    try:
+        session = asyncio.run(db.closeSession(MEMBER, NOW))
+        assert (session["duration"], session["credited"], session["gameTime"]) == (2700.0, 2700.0, 2700.0)
+        assert totals(db) == (2700.0, 2700.0, 2700.0)
+    finally:
+        db.close()
+
+def test_close_after_a_checkpoint_credits_the_remainder(tmp_path):
+    db = open_db(tmp_path, NOW - timedelta(minutes=45))
+    try:
+        asyncio.run(db.checkpointSessions(10, [1], NOW - timedelta(minutes=15)))
+        session = asyncio.run(db.closeSession(MEMBER, NOW))
+        assert (session["duration"], session["credited"]) == (2700.0, 900.0)
+        assert totals(db) == (2700.0, 2700.0, 2700.0)
+    finally:
+        db.close()
+
+def test_late_leave_before_a_checkpoint_takes_the_excess_back(tmp_path):
+    db = open_db(tmp_path, NOW - timedelta(minutes=45))
+    try:
+        asyncio.run(db.checkpointSessions(10, [1], NOW))
+        # A debounced or replayed leave that happened ten minutes before the checkpoint
+        session = asyncio.run(db.closeSession(MEMBER, NOW - timedelta(minutes=10)))
+        assert (session["duration"], session["credited"]) == (2100.0, -600.0)
+        assert totals(db) == (2100.0, 2100.0, 2100.0)
+    finally:
+        db.close()
+
+def test_close_without_an_open_session_credits_nothing(tmp_path):
+    db = open_db(tmp_path, NOW + timedelta(minutes=5))  # Opened after the leave: a later join's session
+    try:
+        session = asyncio.run(db.closeSession(MEMBER, NOW))
+        assert session["duration"] == 0.0 and session["arrivalTime"] is None
+        assert db.conn.execute("select count(*) from TimeLog where leavingTime is null").fetchone()[0] == 1
+    finally:
+        db.close()
@@ -0,0 +1,39 @@
+# test_stats.py
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from stats import StatsCache
+
+def member(member_id=1, guild_id=10):
+    return SimpleNamespace(id=member_id, name=f"m{member_id}", guild=SimpleNamespace(id=guild_id))
+
+def cached(stats: StatsCache, member_id=1):
+    stats.cache.set(member_id, {"gameTime": 100.0, "recent": 0.0, "guilds": {}})
+    return stats.cache.get(member_id)
+
+def test_record_session_folds_only_the_uncredited_part():
+    stats = StatsCache(db=None)
+    rollup = cached(stats)
+    stats.record_session(member(), {"duration": 600.0, "credited": 100.0, "gameTime": None,
+                                    "arrivalTime": "2024-01-01T00:00:00+00:00",
+                                    "leavingTime": "2024-01-01T00:10:00+00:00"})
+    row = rollup["guilds"][10]
+    assert rollup["gameTime"] == 200.0
+    assert row["totalTime"] == 100.0
+    assert row["sessionCount"] == 1
+    assert row["longestSession"] == 600.0
+
+def test_fallback_last_seen_is_utc():
+    stats = StatsCache(db=None)
+    rollup = cached(stats)
+    before = datetime.now(timezone.utc)
+    stats.record_session(member(), {"duration": 1.0, "gameTime": 101.0, "arrivalTime": "2024-01-01T00:00:00+00:00",
+                                    "leavingTime": None})
+    last_seen = datetime.fromisoformat(rollup["guilds"][10]["lastSeen"])
+    assert last_seen.utcoffset().total_seconds() == 0
+    assert last_seen >= before
+
+def test_invalidate_drops_the_rollup():
+    stats = StatsCache(db=None)
+    cached(stats)
+    stats.invalidate(1)
+    assert stats.cache.get(1) is None
@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlite_queries import SqliteQueries, split_session
+
+NOW = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+def test_session_is_split_across_the_buckets_it_touches():
+    buckets = list(split_session(NOW - timedelta(minutes=90), NOW + timedelta(minutes=15), "hour"))
+    assert [(bucket.hour, seconds) for bucket, seconds in buckets] == [(10, 1800.0), (11, 3600.0), (12, 900.0)]
+
+def test_window_totals_are_summed_per_member_and_limited(tmp_path):
+    db = SqliteQueries(str(tmp_path / "test.db"))
+
+    async def run():
+        await db.upsertMembers([{"memberId": m, "name": f"m{m}"} for m in (1, 2, 3)])
+        # Member 1 has two sessions a day apart; member 3 played before the window
+        await db.insertTimeLogs([
+            {"memberId": 1, "guildId": 10, "arrivalTime": NOW - timedelta(days=1, hours=1)},
+            {"memberId": 1, "guildId": 10, "arrivalTime": NOW - timedelta(hours=1)},
+            {"memberId": 2, "guildId": 10, "arrivalTime": NOW - timedelta(hours=3)},
+            {"memberId": 3, "guildId": 10, "arrivalTime": NOW - timedelta(days=9, hours=5)},
+        ])
+        await db.closeSessions([{"memberId": 1, "guildId": 10, "at": NOW - timedelta(days=1), "eventId": "a"},
+                                {"memberId": 3, "guildId": 10, "at": NOW - timedelta(days=9), "eventId": "b"}])
+        await db.closeSessions([{"memberId": m, "guildId": 10, "at": NOW, "eventId": f"c{m}"} for m in (1, 2)])
+        since = NOW - timedelta(days=7)
+        return await db.getWindowTotals(10, since, "day"), await db.getWindowTotals(10, since, "day", limit=1)
+
+    try:
+        totals, top = asyncio.run(run())
+    finally:
+        db.close()
+    assert totals == [{"memberId": 2, "name": "m2", "gameTime": 10800.0},
+                      {"memberId": 1, "name": "m1", "gameTime": 7200.0}]
+    assert top == totals[:1]
@@ -0,0 +1,109 @@
+# test_write_behind.py
+import asyncio
+import time
+from types import SimpleNamespace
+from resilience import deadline
+from sqlite_queries import SqliteQueries
+from write_behind import WriteBehindQueue
+
+def member(member_id, guild_id=10, name=None):
+    return SimpleNamespace(id=member_id, name=name or f"m{member_id}", guild=SimpleNamespace(id=guild_id))
+
+class FlakyDb:
+    """Records successful bulk writes; the named methods fail while listed in failing"""
+
+    def __init__(self, *failing):
+        self.failing = set(failing)
+        self.written = {"upsertMembers": [], "upsertMembersGuild": [], "insertTimeLogs": []}
+
+    def _write(self, method, rows):
+        if method in self.failing:
+            return False
+        self.written[method] += rows
+        return True
+
+    async def upsertMembers(self, rows):
+        return self._write("upsertMembers", rows)
+
+    async def upsertMembersGuild(self, rows):
+        return self._write("upsertMembersGuild", rows)
+
+    async def insertTimeLogs(self, rows):
+        return self._write("insertTimeLogs", rows)
+
+def test_flush_writes_parents_first():
+    db = FlakyDb()
+    queue = WriteBehindQueue(db)
+    queue.enqueue_join(member(1))
+    queue.enqueue_join(member(1))
+    assert asyncio.run(queue.flush())
+    assert len(db.written["upsertMembers"]) == 1
+    assert len(db.written["upsertMembersGuild"]) == 1
+    assert len(db.written["insertTimeLogs"]) == 2
+    assert len(queue) == 0
+
+def test_failed_member_write_keeps_every_row():
+    db = FlakyDb("upsertMembers")
+    queue = WriteBehindQueue(db)
+    queue.enqueue_join(member(1))
+
+    assert not asyncio.run(queue.flush())
+    # Nothing after the failed parent write is attempted
+    assert db.written == {"upsertMembers": [], "upsertMembersGuild": [], "insertTimeLogs": []}
+    assert queue.has_pending_arrival(1)
+    assert len(queue) == 3
+
+    db.failing.clear()
+    assert asyncio.run(queue.flush())
+    assert [row["memberId"] for row in db.written["insertTimeLogs"]] == [1]
+    assert len(queue) == 0
+
+def test_failed_time_log_insert_is_retried_once():
+    db = FlakyDb("insertTimeLogs")
+    queue = WriteBehindQueue(db)
+    queue.enqueue_join(member(1))
+    assert not asyncio.run(queue.flush())
+    assert len(queue) == 1 and queue.has_pending_arrival(1)
+
+    db.failing.clear()
+    assert asyncio.run(queue.flush())
+    assert len(db.written["insertTimeLogs"]) == 1
+
+def test_requeued_rows_keep_arrival_order_and_newer_names():
+    db = FlakyDb("upsertMembers")
+    queue = WriteBehindQueue(db)
+
+    async def run():
+        queue.enqueue_join(member(1, name="old"))
+        assert not await queue.flush()
+        queue.enqueue_join(member(1, name="new"))
+        queue.enqueue_join(member(2))
+        db.failing.clear()
+        assert await queue.flush()
+
+    asyncio.run(run())
+    assert [row["name"] for row in db.written["upsertMembers"] if row["memberId"] == 1] == ["new"]
+    assert [row["memberId"] for row in db.written["insertTimeLogs"]] == [1, 1, 2]
+
+class SlowInsertSqlite(SqliteQueries):
+    def _insert_time_logs(self, rows):
+        time.sleep(0.2)
+        super()._insert_time_logs(rows)
+
+def test_insert_cut_short_by_the_deadline_is_not_written_twice(tmp_path):
+    db = SlowInsertSqlite(str(tmp_path / "test.db"))
+    queue = WriteBehindQueue(db)
+
+    async def run():
+        queue.enqueue_join(member(1))
+        with deadline(0.1):
+            # The insert keeps running on the connection's thread and commits after the budget is spent
+            assert not await queue.flush()
+        assert queue.has_pending_arrival(1)
+        assert await queue.flush()
+
+    try:
+        asyncio.run(run())
+        assert db.conn.execute("select count(*) from TimeLog where memberId = 1").fetchone()[0] == 1
+    finally:
+        db.close()
@@ -1,45 +1,138 @@
-from typing import Dict
+from typing import Dict, Optional
+import asyncio
 import discord
 import time
 import os
+from datetime import datetime, timezone
 import json
-from queries import DatabaseQueries
+from storage import StorageBackend
+from dm_index import DmIndex
+from fanout import DmFanout, FanoutReport
+from digest import DigestScheduler
+from metrics import timed
+from cache import TTLCache
 
 class NotificationManager:
-    def __init__(self, db):
+    def __init__(self, db, dm_index: Optional[DmIndex] = None, fanout: Optional[DmFanout] = None, store=None,
+                 digests: Optional[DigestScheduler] = None):
         self.last_notification_time = 0
         self.COOLDOWN_SECONDS = 3600 * 4
         self.db = db
-    
+        self.dm_index = dm_index or DmIndex(db, store=store)
+        self.fanout = fanout or DmFanout()
+        # Shared with the other bot processes when running as a cluster
+        self.store = store
+        # When set, subscribers get merged per-recipient digests instead of the guild-wide cooldown
+        self.digests = digests
+
+        # guildId -> timestamp of the last notification, loaded lazily from the db
+        self.cooldowns: Dict[int, float] = {}
+        self._cooldown_locks: Dict[int, asyncio.Lock] = {}
+        self._pending_writes = set()
+
+        # Subscribers fetched over the API because the lean profile does not cache them
+        self.fetched_members = TTLCache(max_size=10000, ttl_seconds=3600)
+        self._fetch_semaphore = asyncio.Semaphore(5)
+
+    async def _fetch_subscriber(self, guild, member_id: int):
+        """Fetch a subscriber the client does not cache and remember them; None if they left"""
+        async with self._fetch_semaphore:
+            try:
+                member = await guild.fetch_member(member_id)
+            except discord.NotFound:
+                return None
+            except discord.HTTPException as e:
+                print(f"Error fetching DM subscriber {member_id} in {guild.name}: {e}")
+                return None
+        self.fetched_members.set((guild.id, member_id), member)
+        return member
+
+    async def _load_cooldown(self, guild) -> float:
+        """Return the guild's last notification time, reading the db only once per guild"""
+        if guild.id not in self.cooldowns:
+            lock = self._cooldown_locks.setdefault(guild.id, asyncio.Lock())
+            async with lock:
+                if guild.id not in self.cooldowns:
+                    cooldown = await self.db.getCoolDown(guild)
+                    if cooldown is None:
+                        return 0.0  # Lookup failed, try again on the next event
+                    self.cooldowns[guild.id] = cooldown
+        return self.cooldowns[guild.id]
+
+    def _persist_cooldown(self, guild, timestamp: float):
+        """Write the cooldown back in the background"""
+        task = asyncio.create_task(self.db.updateCoolDown(guild, timestamp))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def flush(self):
+        """Wait for cooldown writes still in flight, so a cooldown claimed just before
+        shutdown is not lost and the next process does not notify again (used on shutdown)"""
+        while self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
     async def is_on_cooldown(self, guild):
         """Check if notifications are on cooldown"""
+        last = await self._load_cooldown(guild)
+        return time.time() - last < self.COOLDOWN_SECONDS
+
+    async def try_start_cooldown(self, guild) -> bool:
+        """Atomically check the cooldown and start it; returns True if the caller may notify"""
+        last = await self._load_cooldown(guild)
+        # No await between the check and the set, so concurrent joins cannot both pass
         current_time = time.time()
-        cooldown = await self.db.getCoolDown(guild)
-        if cooldown:
-            return current_time - cooldown.data[0]["Cooldown"] < self.COOLDOWN_SECONDS
-    
+        if current_time - self.cooldowns.get(guild.id, last) < self.COOLDOWN_SECONDS:
+            return False
+        self.cooldowns[guild.id] = current_time
+
+        if self.store is not None:
+            try:
+                # Another process may own the guild now (after a reshard) and have notified already
+                if not await self.store.claim(f"cooldown:{guild.id}", self.COOLDOWN_SECONDS):
+                    return False
+            except Exception as e:
+                print(f"Error claiming shared cooldown for {guild.name}: {e}")
+
+        self._persist_cooldown(guild, current_time)
+        return True
+
     async def update_cooldown(self, guild):
         """Update the last notification time"""
-        await self.db.updateCoolDown(guild)
+        current_time = time.time()
+        self.cooldowns[guild.id] = current_time
+        self._persist_cooldown(guild, current_time)
     
-    async def send_notifications(self, channel):
-        """Send notifications to all DM group members"""
+    @timed("notifications")
+    async def send_notifications(self, channel) -> FanoutReport:
+        """Send notifications to all DM group members, or queue them for their digests"""
         membersStr = " and ".join([member.name for member in channel.members])
-        result = await self.db.get_dm_group(channel.guild)
+        subscribers = await self.dm_index.get(channel.guild)
+        report = FanoutReport()
 
-        if len(result) < 1: 
-            return False
-
-        for members in result:
-            member = channel.guild.get_member(members["memberId"])
-            if member in channel.members or not member:
+        in_channel = {member.id for member in channel.members}
+        recipients = []
+        missing = []
+        for member_id in list(subscribers):
+            if member_id in in_channel:
+                report.skipped += 1
                 continue
-            try:
-                await member.send(f'Gaming time in "{channel.name}" with {membersStr}!')
-            except discord.Forbidden:
-                print(f"Cannot send DM to {member.name}")
-                return False
-        return True
+            member = channel.guild.get_member(member_id) or self.fetched_members.get((channel.guild.id, member_id))
+            if member is None:
+                missing.append(member_id)
+            else:
+                recipients.append(member)
+
+        for member in await asyncio.gather(*(self._fetch_subscriber(channel.guild, m) for m in missing)):
+            if member is None:
+                report.skipped += 1
+            else:
+                recipients.append(member)
+
+        if self.digests is not None:
+            report.queued = self.digests.add(recipients, channel)
+            report.skipped += len(recipients) - report.queued
+            return report
+        return await self.fanout.send(recipients, f'Gaming time in "{channel.name}" with {membersStr}!', report)
 
 def is_user_joining_voice(before, after):
     """Check if user is joining a voice channel"""
@@ -53,25 +146,46 @@ def is_user_leaving_voice(before, after):
     """Check if user is leaving a voice channel"""
     return before.channel is not None and after.channel is None
 
-async def handleVoiceJoin(member, db: DatabaseQueries):
+@timed("voice")
+async def handleVoiceJoin(member, db: StorageBackend, write_behind=None, replayer=None):
     """Handle new user by checking and inserting into DB"""
+    if replayer is not None:
+        # Journaled locally first; the replayer writes it to the db in bulk
+        await replayer.record_join(member)
+        return
+
+    if write_behind is not None:
+        # Buffered: the upserts go out in the next bulk flush
+        write_behind.enqueue_join(member)
+        return
+
     await db.newMember(member)
     await db.newMemberToGuild(member, member.guild)
     await db.logArrivalTime(member)
         
 
-async def handleVoiceLeave(member, db: DatabaseQueries):
+@timed("voice")
+async def handleVoiceLeave(member, db: StorageBackend, write_behind=None, replayer=None, leavingTime=None):
     """Handle complete voice leave process: log leave time and calculate duration"""
     try:
-        # Step 1: Log leave time
-        leave_success = await db.logLeaveTime(member)
-        if not leave_success:
+        if replayer is not None:
+            # None while the db is down: the leave waits in the journal and is credited on replay
+            session = await replayer.record_leave(member, leavingTime)
+        else:
+            # The arrival row must exist before the session can be closed
+            if write_behind is not None and write_behind.has_pending_arrival(member.id):
+                if not await write_behind.flush():
+                    # Closing now would close an older session; the arrival stays buffered for the next flush
+                    return None
+
+            # Stamp the leave time and credit game time in one round trip
+            session = await db.closeSession(member, leavingTime)
+        if session is None:
             return None
-        
-        # Step 2: Calculate and update game time
-        await db.logGameTime(member)
 
-        return None
+        if session["duration"] > 0:
+            print(f"{member.name} played for {_format_duration(session['duration'])}")
+        return session
     except Exception as e:
         print(f"Error handling voice leave for {member.name}: {e}")
         return None
@@ -87,5 +201,46 @@ def _format_duration(seconds: float) -> str:
     else:
         return f"{minutes:02d}:{secs:02d}"
 
+async def reconcileVoiceStates(guilds, db: StorageBackend, batchSize: int = 500, ownGuildsOnly: bool = False):
+    """Open sessions for members already in voice and close sessions of members who left while offline.
+    With ownGuildsOnly (sharded workers), sessions in guilds this process does not see are left alone."""
+    in_voice = {}
+    for guild in guilds:
+        for channel in guild.voice_channels + guild.stage_channels:
+            for member in channel.members:
+                in_voice[member.id] = member
+
+    open_sessions = await db.getOpenSessions()
+    if open_sessions is None:
+        print("Skipping voice reconciliation: open sessions could not be loaded")
+        return
+    if ownGuildsOnly:
+        guild_ids = {guild.id for guild in guilds}
+        open_sessions = [s for s in open_sessions if s.get("guildId") in guild_ids]
+
+    # Keep the newest open session per member; anything older is stale
+    latest = {}
+    stale = []
+    for session in sorted(open_sessions, key=lambda s: s["arrivalTime"], reverse=True):
+        if session["memberId"] in latest or session["memberId"] not in in_voice:
+            stale.append(session["id"])
+        else:
+            latest[session["memberId"]] = session
+
+    to_open = [member for member_id, member in in_voice.items() if member_id not in latest]
+    arrival = datetime.now(timezone.utc).isoformat()
+
+    closed = 0
+    for i in range(0, len(stale), batchSize):
+        closed += await db.closeStaleSessions(stale[i:i + batchSize])
+
+    for i in range(0, len(to_open), batchSize):
+        batch = to_open[i:i + batchSize]
+        await db.upsertMembers([{"memberId": m.id, "name": m.name} for m in batch])
+        await db.upsertMembersGuild([{"memberId": m.id, "guildId": m.guild.id} for m in batch])
+        await db.insertTimeLogs([{"memberId": m.id, "guildId": m.guild.id, "arrivalTime": arrival} for m in batch])
+
+    print(f"Voice reconciliation: {len(to_open)} sessions opened, {closed} stale sessions closed")
+
 async def handleNewGuild(guild, db): 
     return await db.registerGuild(guild)
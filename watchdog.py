@@ -0,0 +1,133 @@
+# watchdog.py
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional, Tuple
+from metrics import metrics
+
+# Frames from these files are the bot's own code; the offending frame is the innermost of them
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+Frame = Tuple[str, int, str]  # (file, line, function)
+
+class Stall:
+    """One stretch of time in which the event loop did not get to run"""
+
+    def __init__(self, at: datetime, duration: float, frame: Optional[Frame], stack: List[str], samples: int):
+        self.at = at
+        self.duration = duration
+        self.frame = frame  # None when the stall ended before the helper thread looked
+        self.stack = stack
+        self.samples = samples
+
+    def where(self) -> str:
+        if self.frame is None:
+            return "not sampled"
+        path, line, function = self.frame
+        return f"{os.path.relpath(path, REPO_DIR) if path.startswith(REPO_DIR) else path}:{line} in {function}"
+
+class LoopWatchdog:
+    """Measures event-loop lag continuously and finds out what blocked the loop.
+
+    A task on the loop wakes every interval seconds and records how late it woke
+    up. A helper thread watches that heartbeat; once it is more than threshold
+    seconds old the thread samples the loop thread's stack every sample_interval
+    until the loop runs again. The loop then files a Stall with the frame seen
+    most often, prints it (which reaches the log channel) and keeps the last
+    history stalls for !stalls."""
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1, sample_interval: Optional[float] = None,
+                 history: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_interval = sample_interval or max(threshold / 5, 0.005)
+        self.stalls: Deque[Stall] = deque(maxlen=history)
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._samples: Counter = Counter()
+        self._stacks = {}  # offending frame -> stack it was last seen in
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge("loop_lag_seconds", lambda: self.lag)
+        metrics.gauge("loop_lag_max_seconds", lambda: self.max_lag)
+
+    def start(self):
+        """Start the heartbeat and the sampling thread (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._loop_thread = threading.get_ident()
+            self._beat = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._stopping.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def recent(self, limit: int = 10) -> List[Stall]:
+        """The latest stalls, newest first"""
+        return list(self.stalls)[::-1][:limit]
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            with self._lock:
+                self._beat = now
+                samples, self._samples = self._samples, Counter()
+                stacks, self._stacks = self._stacks, {}
+            if self.lag >= self.threshold:
+                self._record(self.lag, samples, stacks)
+
+    def _record(self, duration: float, samples: Counter, stacks: dict):
+        frame, count = samples.most_common(1)[0] if samples else (None, 0)
+        stall = Stall(datetime.now(timezone.utc), duration, frame, stacks.get(frame, []), count)
+        self.stalls.append(stall)
+        metrics.begin(("loop", "stall"))
+        metrics.end(("loop", "stall"), duration)
+        print(f"⚠️ Event loop blocked for {duration * 1000:.0f} ms at {stall.where()} "
+              f"({count}/{sum(samples.values())} samples)")
+
+    def _watch(self):
+        """Helper thread: sample the loop thread's stack while its heartbeat is overdue"""
+        while not self._stopping.wait(self.sample_interval):
+            # The heartbeat is due every interval; anything later than that plus threshold is a stall
+            if time.monotonic() - self._beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            offending = next((f for f in reversed(stack) if f.filename.startswith(REPO_DIR)
+                              and f.filename != __file__), stack[-1] if stack else None)
+            if offending is None:
+                continue
+            key = (offending.filename, offending.lineno, offending.name)
+            with self._lock:
+                self._samples[key] += 1
+                self._stacks[key] = [f"{f.filename}:{f.lineno} in {f.name}" for f in stack[-8:]]
@@ -0,0 +1,107 @@
+# write_behind.py
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from storage import StorageBackend
+
+class WriteBehindQueue:
+    """Buffers voice-join writes in memory and flushes them as bulk upserts"""
+
+    def __init__(self, db: StorageBackend, max_batch: int = 200, flush_interval: float = 2.0):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        # Pending rows, coalesced per table
+        self.members: Dict[int, Dict] = {}
+        self.members_guild: Dict[Tuple[int, int], Dict] = {}
+        self.time_logs: List[Dict] = []
+
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.members) + len(self.members_guild) + len(self.time_logs)
+
+    def start(self):
+        """Start the background flusher (must be called from a running loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out anything still buffered"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not await self.flush():
+            print(f"{len(self)} buffered voice-join rows could not be written before shutdown")
+
+    def enqueue_join(self, member):
+        """Record a voice join; the database writes happen on the next flush"""
+        self.members[member.id] = {"memberId": member.id, "name": member.name}
+        self.members_guild[(member.id, member.guild.id)] = {"memberId": member.id, "guildId": member.guild.id}
+        self.time_logs.append({
+            "memberId": member.id,
+            "guildId": member.guild.id,
+            "arrivalTime": datetime.now(timezone.utc).isoformat(),
+            # Makes the insert idempotent: a flush that timed out may have committed anyway
+            "eventId": uuid.uuid4().hex,
+        })
+
+        if len(self) >= self.max_batch:
+            self._wake.set()
+
+    def has_pending_arrival(self, member_id: int) -> bool:
+        """Check if a member's arrival row has not reached the database yet"""
+        return any(row["memberId"] == member_id for row in self.time_logs)
+
+    async def flush(self) -> bool:
+        """Write all buffered rows, parents first so foreign keys resolve.
+        Stops at the first failed write and keeps what was not written for the next flush."""
+        async with self._flush_lock:
+            if len(self) == 0:
+                return True
+
+            members = self.members
+            members_guild = self.members_guild
+            time_logs = self.time_logs
+            self.members = {}
+            self.members_guild = {}
+            self.time_logs = []
+
+            if members and not await self.db.upsertMembers(list(members.values())):
+                self._requeue(members, members_guild, time_logs)
+                return False
+            if members_guild and not await self.db.upsertMembersGuild(list(members_guild.values())):
+                self._requeue({}, members_guild, time_logs)
+                return False
+            # A failed or timed-out insert may still have committed; rows already present are
+            # skipped by eventId, so sending them again never opens a session twice
+            if time_logs and not await self.db.insertTimeLogs(time_logs):
+                self._requeue({}, {}, time_logs)
+                return False
+            return True
+
+    def _requeue(self, members: Dict[int, Dict], members_guild: Dict[Tuple[int, int], Dict], time_logs: List[Dict]):
+        """Put unwritten rows back ahead of anything buffered during the flush"""
+        self.members = {**members, **self.members}
+        self.members_guild = {**members_guild, **self.members_guild}
+        self.time_logs = time_logs + self.time_logs
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing write-behind queue: {e}")